@@ -0,0 +1,117 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+""" Benchmarks for Blocks.
+
+The benchmarks prefixed with 'ast_' run the same thing on
+'codetools.blocks2.Block', which uses the 'ast' module instead of the
+'compiler' package, so comparing the two shows the parse and compile speedup.
+
+"""
+
+from codetools.blocks.api import Block
+from codetools.blocks.compiler_.api import code_cache
+from codetools.blocks2.api import Block as AstBlock
+
+from scripts import MAX_SINGLE_CODE_STATEMENTS, script_context, \
+    synthetic_script
+
+
+def benchmarks(sizes):
+    """ Yield '(name, setup)' pairs, where 'setup()' prepares a benchmark and
+    returns the function to time.
+
+    """
+    for n in sizes:
+        yield 'block_construction[%d]' % n, _construction(n, cached=False)
+        yield 'block_construction_cached[%d]' % n, _construction(n,
+                                                                 cached=True)
+        yield 'compute_dependencies[%d]' % n, _compute_dependencies(n)
+        yield 'restrict_cold[%d]' % n, _restrict(n, warm=False)
+        yield 'restrict_warm[%d]' % n, _restrict(n, warm=True)
+        yield 'execute[%d]' % n, _execute(n, no_filenames=False)
+        if n <= MAX_SINGLE_CODE_STATEMENTS:
+            yield 'compile[%d]' % n, _compile(n)
+            yield 'execute_no_filenames[%d]' % n, _execute(n,
+                                                           no_filenames=True)
+        yield 'execute_impure_context[%d]' % n, _execute_impure_context(n)
+
+        yield 'ast_block_construction[%d]' % n, _construction(
+            n, cached=False, block_class=AstBlock)
+        yield 'ast_block_construction_cached[%d]' % n, _construction(
+            n, cached=True, block_class=AstBlock)
+        yield 'ast_compile[%d]' % n, _compile(n, block_class=AstBlock)
+        yield 'ast_restrict_cold[%d]' % n, _restrict(n, warm=False,
+                                                     block_class=AstBlock)
+        yield 'ast_execute[%d]' % n, _execute(n, no_filenames=False,
+                                              block_class=AstBlock)
+        # (The ast module has no limit on the size of code objects)
+        yield 'ast_execute_no_filenames[%d]' % n, _execute(
+            n, no_filenames=True, block_class=AstBlock)
+
+def _construction(n, cached, block_class=Block):
+    def setup():
+        code = synthetic_script(n)
+        block_class(code)
+        def run():
+            if not cached:
+                block_class._parse_cache.clear()
+            block_class(code)
+        return run
+    return setup
+
+def _compile(n, block_class=Block):
+    def setup():
+        block = block_class(synthetic_script(n))
+        block.no_filenames_in_tracebacks = True
+        def run():
+            # (Compile the whole block from its AST, without the code cache)
+            code_cache.clear()
+            block.invalidate_cache()
+            block._code
+        return run
+    return setup
+
+def _compute_dependencies(n):
+    def setup():
+        sub_blocks = Block(synthetic_script(n)).sub_blocks
+        return lambda: Block._compute_dependencies(sub_blocks)
+    return setup
+
+def _restrict(n, warm, block_class=Block):
+    def setup():
+        block = block_class(synthetic_script(n))
+        # (Only the restrictions are cold: the dependency graph is built)
+        block._dep_graph
+        inputs, outputs = ('x3',), ('v%d' % (n // 2),)
+        def run():
+            if not warm:
+                block._get_restrictions().clear()
+            block.restrict(inputs=inputs)
+            block.restrict(outputs=outputs)
+        run()
+        return run
+    return setup
+
+def _execute(n, no_filenames, block_class=Block):
+    def setup():
+        block = block_class(synthetic_script(n))
+        block.no_filenames_in_tracebacks = no_filenames
+        context = script_context()
+        block.execute(dict(context))
+        return lambda: block.execute(dict(context))
+    return setup
+
+def _execute_impure_context(n):
+    # (A small script in a context of 'n' names that it doesn't use)
+    def setup():
+        block = Block(synthetic_script(10))
+        context = script_context()
+        context.update(('unused%d' % i, float(i)) for i in range(n))
+        block.execute_impure(context)
+        return lambda: block.execute_impure(context)
+    return setup
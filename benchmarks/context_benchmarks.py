@@ -0,0 +1,151 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'Benchmarks for contexts.'
+
+import numpy
+
+from codetools.contexts.api import (AdaptedDataContext, DataContext,
+    FastDataContext, MultiContext, NameAdapter)
+from codetools.execution.executing_context import ExecutingContext
+from codetools.execution.lazy_executing_context import LazyExecutingContext
+from codetools.execution.restricting_code_executable import \
+    RestrictingCodeExecutable
+
+from scripts import MAX_SINGLE_CODE_STATEMENTS, script_context, \
+    synthetic_script
+
+# How many lookups each timed call of a lookup benchmark does
+LOOKUPS = 1000
+
+
+def benchmarks(sizes):
+    """ Yield '(name, setup)' pairs, where 'setup()' prepares a benchmark and
+    returns the function to time.
+
+    """
+    for depth in (1, 8, 64):
+        yield 'multi_context_lookup[%d]' % depth, _multi_context_lookup(depth)
+    for cls in (DataContext, FastDataContext):
+        for observed in (False, True):
+            yield '%s_set[%s]' % (cls.__name__, 'observed' if observed
+                                  else 'unobserved'), \
+                  _data_context_set(cls, observed)
+    for adapters in (0, 1, 4, 16):
+        yield 'adapted_context_lookup[%d]' % adapters, \
+              _adapted_context_lookup(adapters)
+    for n in sizes:
+        # (The executable runs the restricted block as a single function)
+        if n <= MAX_SINGLE_CODE_STATEMENTS:
+            yield 'executing_context_update[%d]' % n, \
+                  _executing_context_update(n)
+            yield 'executing_context_update_in_dict[%d]' % n, \
+                  _executing_context_update(n, execute_in_dict=True)
+        yield 'lazy_context_update_read_one[%d]' % n, _lazy_context_update(n)
+        yield 'multi_context_set_array[%d]' % n, _multi_context_set_array(n)
+        for cls in (DataContext, FastDataContext):
+            yield '%s_update[%d]' % (cls.__name__, n), \
+                  _data_context_update(cls, n)
+        yield 'DataContext_update_many[%d]' % n, \
+              _data_context_update(DataContext, n, 'update_many')
+
+def _multi_context_lookup(depth):
+    def setup():
+        # The name is in the last subcontext, so every lookup misses in all
+        # the others first
+        contexts = [DataContext(subcontext={'a%d' % i: i})
+                    for i in range(depth)]
+        context = MultiContext(*contexts)
+        name = 'a%d' % (depth - 1)
+        def run():
+            for i in xrange(LOOKUPS):
+                context[name]
+        return run
+    return setup
+
+def _data_context_set(cls, observed):
+    def setup():
+        context = cls()
+        if observed:
+            context.on_trait_change(_ignore, 'items_modified')
+        def run():
+            for i in xrange(LOOKUPS):
+                context['a'] = i
+        return run
+    return setup
+
+def _data_context_update(cls, n, method='update'):
+    def setup():
+        context = cls()
+        context.on_trait_change(_ignore, 'items_modified')
+        items = dict(('a%d' % i, i) for i in range(n))
+        update = getattr(context, method)
+        def run():
+            update(items)
+        return run
+    return setup
+
+def _multi_context_set_array(n):
+    def setup():
+        # An array of 'n' thousand items, updated in place and then assigned
+        # back, as code that works on views does
+        array = numpy.zeros(n * 1000)
+        context = MultiContext({'a': array})
+        def run():
+            numpy.add(array, 1, out=array)
+            context['a'] = array
+        return run
+    return setup
+
+def _adapted_context_lookup(adapters):
+    def setup():
+        context = AdaptedDataContext(subcontext={'a': 1.0})
+        for i in range(adapters):
+            context.push_adapter(NameAdapter(map={'alias%d' % i: 'a'}))
+        def run():
+            for i in xrange(LOOKUPS):
+                context['a']
+        return run
+    return setup
+
+def _executing_context_update(n, execute_in_dict=False):
+    def setup():
+        executable = RestrictingCodeExecutable(code=synthetic_script(n))
+        context = ExecutingContext(executable=executable,
+                                   subcontext=DataContext(
+                                       subcontext=script_context()),
+                                   execute_in_dict=execute_in_dict)
+        context.execute_for_names(None)
+        values = [4.0, 5.0]
+        def run():
+            # (Alternate values, so that every update changes something)
+            values.reverse()
+            context['x3'] = values[0]
+        run()
+        return run
+    return setup
+
+def _lazy_context_update(n):
+    # (The same update as 'executing_context_update', with one output read)
+    def setup():
+        context = LazyExecutingContext(code=synthetic_script(n),
+                                       subcontext=DataContext(
+                                           subcontext=script_context()))
+        name = 'v%d' % (n // 2)
+        for key in context.keys():
+            context.get(key)
+        values = [4.0, 5.0]
+        def run():
+            values.reverse()
+            context['x3'] = values[0]
+            context[name]
+        run()
+        return run
+    return setup
+
+def _ignore(event):
+    "An 'items_modified' listener"
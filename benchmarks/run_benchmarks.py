@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+""" Run the block and context benchmarks, and compare them with a baseline.
+
+Usage::
+
+    python benchmarks/run_benchmarks.py [--sizes 10,1000,10000]
+        [--filter NAME] [--output results.json] [--baseline baseline.json]
+        [--threshold 1.5] [--save-baseline]
+
+Each benchmark is timed as the best of several repeats, and the results are
+written as JSON. If there is a baseline (by default 'baseline.json' next to
+this script), every benchmark that takes more than 'threshold' times its
+baseline time is reported as a regression, and the exit status is 1.
+
+Timings depend on the machine, so regenerate the baseline with
+'--save-baseline' when moving to another one, and commit it along with
+changes that are expected to change the timings.
+
+"""
+
+from argparse import ArgumentParser
+import json
+import os
+import platform
+import sys
+from timeit import default_timer
+
+import block_benchmarks
+import context_benchmarks
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baseline.json')
+
+# Each repeat of a benchmark runs it often enough to take at least this long
+MIN_REPEAT_TIME = 0.05
+
+# Times below this are too noisy to compare
+MIN_COMPARABLE_TIME = 1e-5
+
+
+def all_benchmarks(sizes):
+    "Yield the '(name, setup)' pairs of every benchmark"
+    for module in (block_benchmarks, context_benchmarks):
+        for benchmark in module.benchmarks(sizes):
+            yield benchmark
+
+def time_benchmark(setup, repeat=3):
+    """ Return the best time of a call of the function 'setup' returns, and
+    the number of calls per repeat.
+
+    """
+    run = setup()
+    start = default_timer()
+    run()
+    elapsed = default_timer() - start
+    number = max(1, int(MIN_REPEAT_TIME / max(elapsed, 1e-9)))
+
+    best = None
+    for i in range(repeat):
+        start = default_timer()
+        for j in xrange(number):
+            run()
+        elapsed = (default_timer() - start) / number
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, number
+
+def run_benchmarks(sizes, name_filter=None, repeat=3, log=None):
+    "Run the benchmarks and return their results, as saved in JSON"
+    results = {}
+    for name, setup in all_benchmarks(sizes):
+        if name_filter and name_filter not in name:
+            continue
+        time, number = time_benchmark(setup, repeat)
+        results[name] = {'time': time, 'number': number, 'repeat': repeat}
+        if log is not None:
+            log.write('%-40s %12.6f ms\n' % (name, time * 1e3))
+            log.flush()
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': results,
+    }
+
+def compare(results, baseline, threshold):
+    """ Compare results with a baseline.
+
+    Returns a list of '(name, baseline time, time, ratio)' for each benchmark
+    in both, and the list of the names of those that regressed by more than
+    'threshold'.
+
+    >>> base = {'benchmarks': {'a': {'time': 1.0}, 'b': {'time': 1.0}}}
+    >>> new = {'benchmarks': {'a': {'time': 2.0}, 'b': {'time': 1.1},
+    ...                       'c': {'time': 1.0}}}
+    >>> rows, regressions = compare(new, base, 1.5)
+    >>> rows
+    [('a', 1.0, 2.0, 2.0), ('b', 1.0, 1.1, 1.1)]
+    >>> regressions
+    ['a']
+
+    """
+    rows, regressions = [], []
+    for name in sorted(results['benchmarks']):
+        if name not in baseline['benchmarks']:
+            continue
+        base = baseline['benchmarks'][name]['time']
+        time = results['benchmarks'][name]['time']
+        ratio = time / base if base > 0 else float('inf')
+        rows.append((name, base, time, ratio))
+        if ratio > threshold and time > MIN_COMPARABLE_TIME:
+            regressions.append(name)
+    return rows, regressions
+
+def main(argv=None):
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='10,1000,10000',
+                        help='comma-separated numbers of statements of the '
+                             'synthetic scripts (default: %(default)s)')
+    parser.add_argument('--filter', dest='name_filter',
+                        help='only run benchmarks whose names contain this')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='repeats per benchmark (default: %(default)s)')
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='compare with this file (default: %(default)s)')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='fail when a benchmark takes more than this '
+                             'times its baseline (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write the results to the baseline file instead '
+                             'of comparing')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = run_benchmarks(sizes, args.name_filter, args.repeat, sys.stdout)
+
+    if args.output:
+        _save(results, args.output)
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # Keep the benchmarks we didn't run this time
+            baseline = _load(args.baseline)
+            baseline['benchmarks'].update(results['benchmarks'])
+            results = dict(results, benchmarks=baseline['benchmarks'])
+        _save(results, args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print 'No baseline at %s' % args.baseline
+        return 0
+
+    rows, regressions = compare(results, _load(args.baseline),
+                                args.threshold)
+    print
+    print '%-40s %12s %12s %7s' % ('benchmark', 'baseline ms', 'ms', 'ratio')
+    for name, base, time, ratio in rows:
+        print '%-40s %12.6f %12.6f %7.2f%s' % (
+            name, base * 1e3, time * 1e3, ratio,
+            '  REGRESSION' if name in regressions else '')
+    if regressions:
+        print '\n%d regression(s) over %.2fx the baseline' % (
+            len(regressions), args.threshold)
+        return 1
+    return 0
+
+def _load(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+def _save(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+if __name__ == '__main__':
+    sys.exit(main())
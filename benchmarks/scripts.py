@@ -0,0 +1,47 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'Synthetic scripts for the benchmarks.'
+
+# The free names of the scripts
+INPUTS = ['x%d' % i for i in range(5)]
+
+# The compiler package can't emit code objects over 64KB (it has no
+# EXTENDED_ARG), so larger scripts can't execute as a single code object
+MAX_SINGLE_CODE_STATEMENTS = 1000
+
+
+def synthetic_script(n):
+    """ Return a script of 'n' top-level statements (plus an import).
+
+    The statements are a deterministic mix of arithmetic, function calls and
+    'if'/'else' statements, each reading one earlier result and one earlier
+    result or input, so that the dependency graph is neither a single chain
+    nor flat.
+
+    """
+    lines = ['from math import sqrt']
+    for i in range(n):
+        a = 'v%d' % (i // 2) if i > 0 else 'x0'
+        if i % 3 == 0 or i < 2:
+            b = INPUTS[i % len(INPUTS)]
+        else:
+            b = 'v%d' % (i - 1)
+        if i % 10 == 0:
+            lines.append('if %s > %s:\n    v%d = %s - %s\nelse:\n'
+                         '    v%d = %s - %s' % (a, b, i, a, b, i, b, a))
+        elif i % 10 == 5:
+            lines.append('v%d = sqrt(abs(%s)) + f(%s)' % (i, a, b))
+        else:
+            lines.append('v%d = %s * 0.5 + %s' % (i, a, b))
+    return '\n'.join(lines) + '\n'
+
+def script_context():
+    "Return a namespace with the inputs that synthetic scripts read"
+    context = dict((name, float(i + 1)) for i, name in enumerate(INPUTS))
+    context['f'] = abs
+    return context
@@ -7,7 +7,9 @@
 #
 from __future__ import absolute_import
 
+import __builtin__
 import compiler, compiler.ast
+from collections import namedtuple
 from compiler.ast import (
     AssAttr, Assign, AssName, Const, Dict, Expression, Getattr, List, Name,
     Node, Tuple,
@@ -46,6 +48,24 @@ def local_vars(ast, *args, **kw):
 def conditional_local_vars(ast, *args, **kw):
     return walk(ast, NameFinder(*args, **kw)).conditional_locals
 
+def analyse_statements(asts):
+    ''' Analyse the names in a sequence of statements in one pass.
+
+        Returns a NameSummary for each statement on its own, and one for the
+        whole sequence, which is folded together from the others (see
+        'NameFinder.extend') instead of walking the statements again.
+
+        >>> from compiler import parse
+        >>> ss, s = analyse_statements(parse('a = b\\nc = a + d').node.nodes)
+        >>> [sorted(x.free) for x in ss], sorted(s.free), sorted(s.locals)
+        ([['b'], ['a', 'd']], ['b', 'd'], ['a', 'c'])
+    '''
+    summaries = [walk(ast, NameFinder()).summary() for ast in asts]
+    v = NameFinder()
+    for summary in summaries:
+        v.extend(summary)
+    return summaries, v.summary()
+
 
 ### Structure #################################################################
 
@@ -184,8 +204,7 @@ def dependency_graph(asts, to_ast=lambda x: x):
         # Compute the dependency relation: nodes depend on their inputs, and
         # outputs depend on their nodes
         g = {}
-        for ast in asts:
-            v = walk(ast, NameFinder())
+        for ast, v in zip(asts, analyse_statements(asts)[0]):
             g.setdefault(ast, []).extend(v.free)
             for o in v.locals | v.conditional_locals:
                 g.setdefault(o, []).append(ast)
@@ -224,6 +243,13 @@ def walk(x, visitor, walker=None, verbose=None):
     else:
         raise ValueError(x)
 
+# What a NameFinder found, without its working state
+NameSummary = namedtuple('NameSummary', 'free locals conditional_locals '
+                         'global_reads constlist fromimports imports')
+
+# Built-in names are global to anything
+_builtin_names = frozenset(dir(__builtin__))
+
 class NameFinder:
     'Find and classify variable names'
 
@@ -236,9 +262,12 @@ class NameFinder:
         self.fromimports = []
         self.imports = []
 
+        # Names we saw while they were global. (Code that runs before us
+        # might bind them, so 'extend' needs them.)
+        self.global_reads = set()
+
         # Consider built-in names as global to anything
-        import __builtin__
-        self.globals |= set(dir(__builtin__))
+        self.globals |= _builtin_names
 
     ###########################################################################
     # NameFinder interface
@@ -247,8 +276,38 @@ class NameFinder:
     def all_locals(self):
         return self.locals | self.conditional_locals
 
-    def _see_unbound(self, names): # TODO I dislike this name...
-        for name in set(names) - self.globals - self.locals:
+    def summary(self):
+        "Return what we found as a NameSummary"
+        return NameSummary(self.free, self.locals, self.conditional_locals,
+                           self.global_reads, self.constlist,
+                           self.fromimports, self.imports)
+
+    def extend(self, other):
+        ''' Update our names as if we had gone on to walk the code that
+            'other' (a NameFinder or NameSummary) walked, starting from
+            scratch.
+
+            This lets us analyse a sequence of statements from analyses of
+            each statement without walking them again.
+        '''
+        # Names that were free in 'other' are free for us unless we bind
+        # them, and names that were global in 'other' might not be global
+        # for us
+        self._see_unbound(other.free, ())
+        self._see_unbound(other.global_reads)
+        self._bind(other.locals)
+        self._bind_conditional(other.conditional_locals)
+        self.constlist.extend(other.constlist)
+        self.fromimports.extend(other.fromimports)
+        self.imports.extend(other.imports)
+
+    def _see_unbound(self, names, globals=None): # TODO I dislike this name...
+        if globals is None:
+            globals = self.globals
+        for name in set(names) - self.locals:
+            if name in globals:
+                self.global_reads.add(name)
+                continue
             # (Conditional locals don't bind free names)
 
             # We need to check if the name is a dotted name.
@@ -262,10 +321,10 @@ class NameFinder:
                     prefix += suffix[:suffix.find('.')]
 
                 if prefix in self.locals:
-                    return
+                    break
                 suffix = suffix[suffix.find('.')+1:]
-
-            self.free.add(name)
+            else:
+                self.free.add(name)
 
     def _bind(self, names):
 
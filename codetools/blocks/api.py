@@ -9,8 +9,11 @@ from __future__ import absolute_import
 
 from .analysis import NameFinder, free_vars, local_vars, conditional_local_vars
 from .block import Block, Expression, to_block
-from .compiler_.api import compile_ast, parse
+from .compiler_.api import cached_compile_ast, compile_ast, parse
 from .compiler_unparse import unparse
 from .rename import rename
 from .decorators import func2block, func2co, func2str
+from .memo import SubBlockMemo
+from .parse_cache import ParseCache, parse_cache
+from .profiler import BlockProfiler, SubBlockProfile
 from .namespace_tools import Namespace, namespace, namespace_from_keywords
@@ -0,0 +1,187 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'Batch evaluation of restricted blocks over many sets of inputs.'
+
+from __future__ import absolute_import
+
+from compiler.ast import (Add, Assign, AssName, Bitand, Bitor,
+    Bitxor, CallFunc, Compare, Const, Div, FloorDiv, From, Getattr, Import,
+    Invert, LeftShift, Mod, Module, Mul, Name, Power, RightShift, Stmt, Sub,
+    UnaryAdd, UnarySub)
+from itertools import izip
+
+import numpy
+
+from .compiler_.api import cached_compile_ast
+
+
+def batch_function(block, inputs, outputs):
+    """ Return a function that evaluates 'block' (already restricted to
+    'inputs' and 'outputs') for many sets of inputs at once.
+
+    The function takes one column of values per input and returns one array
+    of results per output (or a single array for a single output). Its
+    'from_rows' attribute does the same for an iterable of argument tuples.
+
+    When every statement is arithmetic on names and constants and calls of
+    NumPy ufuncs, the block runs once over whole columns. Otherwise, or if
+    that fails, it runs once per set of inputs, reusing one code object and
+    one namespace. Columns that aren't already arrays and hold integers
+    always take the second path, so that Python's integers don't overflow.
+    """
+    statements = _statements(block.ast)
+    imports = [s for s in statements if isinstance(s, (Import, From))]
+    body = [s for s in statements if not isinstance(s, (Import, From))]
+    callees = []
+    vectorisable = all(_is_vectorisable(s, callees) for s in body)
+
+    code = cached_compile_ast(Module(None, Stmt(statements)),
+                              '(Block with filename suppressed)')
+    # Names we have to forget between rows, since a row might not set them
+    transient = sorted(block.conditional_outputs)
+
+    # The imported names, and whether the calls are all ufuncs. (Computed
+    # on first use, since importing might be slow.)
+    state = {}
+
+    def vectorised(columns):
+        if 'base' not in state:
+            base = {}
+            exec cached_compile_ast(Module(None, Stmt(imports)),
+                                    '(Block with filename suppressed)') \
+                in {}, base
+            state['base'] = base
+            state['ufuncs'] = all(isinstance(_resolve(c, base), numpy.ufunc)
+                                  for c in callees)
+        if not state['ufuncs']:
+            return None
+
+        n = len(columns[0])
+        namespace = dict(state['base'])
+        for name, column in izip(inputs, columns):
+            if not isinstance(column, numpy.ndarray):
+                column = numpy.asarray(column)
+                if column.dtype.kind not in 'fcb':
+                    return None
+            elif column.dtype.kind not in 'biufc':
+                return None
+            namespace[name] = column
+        try:
+            with numpy.errstate(all='raise'):
+                exec code in {}, namespace
+        except Exception:
+            return None
+
+        results = []
+        for name in outputs:
+            value = numpy.asarray(namespace[name])
+            if value.ndim == 0:
+                value = numpy.repeat(value, n)
+            elif len(value) != n:
+                return None
+            elif any(value is column for column in columns):
+                value = value.copy()
+            results.append(value)
+        return results
+
+    def looped(rows):
+        globals_, namespace = {}, {}
+        results = [[] for name in outputs]
+        for row in rows:
+            if len(row) != len(inputs):
+                raise ValueError, "Must have %d inputs" % len(inputs)
+            for name in transient:
+                namespace.pop(name, None)
+            namespace.update(izip(inputs, row))
+            exec code in globals_, namespace
+            for result, name in izip(results, outputs):
+                result.append(namespace[name])
+        return [numpy.array(result) for result in results]
+
+    def stack(results):
+        if len(outputs) == 1:
+            return results[0]
+        return tuple(results)
+
+    def batchfunc(*columns):
+        if len(columns) != len(inputs):
+            raise ValueError, "Must have %d inputs" % len(inputs)
+        if len(set(len(column) for column in columns)) > 1:
+            raise ValueError, "Inputs must have the same length"
+        results = None
+        if vectorisable and columns:
+            results = vectorised(columns)
+        if results is None:
+            results = looped(izip(*columns))
+        return stack(results)
+
+    def from_rows(rows):
+        return stack(looped(rows))
+
+    batchfunc.from_rows = from_rows
+    return batchfunc
+
+def _statements(ast):
+    'The statements in an AST, with nested Stmt and Module nodes flattened'
+    if isinstance(ast, Module):
+        return _statements(ast.node)
+    elif isinstance(ast, Stmt):
+        return [s for node in ast.nodes for s in _statements(node)]
+    else:
+        return [ast]
+
+# Operations that NumPy does element by element
+_ELEMENTWISE = (Add, Bitand, Bitor, Bitxor, Div, FloorDiv, Invert, LeftShift,
+                Mod, Mul, Power, RightShift, Sub, UnaryAdd, UnarySub)
+
+_COMPARISONS = ('<', '>', '==', '!=', '<=', '>=')
+
+def _is_vectorisable(node, callees):
+    """ Whether a statement or expression gives the same results when its
+    names hold columns instead of single values, provided that the calls
+    (which we append to 'callees') are ufuncs.
+    """
+    if isinstance(node, Assign):
+        return all(isinstance(n, AssName) for n in node.nodes) and \
+               _is_vectorisable(node.expr, callees)
+    elif isinstance(node, Name):
+        return True
+    elif isinstance(node, Const):
+        return isinstance(node.value, (int, long, float, complex))
+    elif isinstance(node, _ELEMENTWISE):
+        return all(_is_vectorisable(n, callees) for n in node.getChildNodes())
+    elif isinstance(node, Compare):
+        return len(node.ops) == 1 and node.ops[0][0] in _COMPARISONS and \
+               _is_vectorisable(node.expr, callees) and \
+               _is_vectorisable(node.ops[0][1], callees)
+    elif isinstance(node, CallFunc):
+        if node.star_args or node.dstar_args or \
+               _dotted_name(node.node) is None:
+            return False
+        callees.append(_dotted_name(node.node))
+        return all(_is_vectorisable(n, callees) for n in node.args)
+    else:
+        return False
+
+def _dotted_name(node):
+    "The dotted name for a Name or Getattr node, or None for anything else"
+    if isinstance(node, Name):
+        return node.name
+    elif isinstance(node, Getattr):
+        prefix = _dotted_name(node.expr)
+        if prefix is not None:
+            return prefix + '.' + node.attrname
+    return None
+
+def _resolve(dotted_name, namespace):
+    'The value of a dotted name in a namespace, or None'
+    names = dotted_name.split('.')
+    value = namespace.get(names[0])
+    for name in names[1:]:
+        value = getattr(value, name, None)
+    return value
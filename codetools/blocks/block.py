@@ -9,22 +9,32 @@
 
 from __future__ import absolute_import
 
+import __builtin__
 import compiler
-from compiler.ast import Module, Node, Stmt
+import dis
+import sys
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from compiler.ast import (AugAssign, CallFunc, Class, Exec, From, Function,
+                          GenExpr, Getattr, Global, Lambda, Module, Name,
+                          Node, Return, Slice, Stmt, Subscript, Tuple, Yield)
+from itertools import chain
+from StringIO import StringIO
+from tokenize import (COMMENT, DEDENT, ENDMARKER, INDENT, NEWLINE, NL,
+                      TokenError, generate_tokens)
 from traceback import format_exc
 import types
 from uuid import UUID, uuid4
 
-from traits.api import (Bool, Dict, Either, HasTraits,
-                                  Instance, List, Property, Str,
-                                  cached_property, Event)
+from traits.api import (Any, Bool, Dict, Either, HasTraits,
+                                  Instance, Int, List, Property, Str)
 
-from ..util.dict import map_keys, map_values
-from ..util import graph
+from ..util.cache import LRUCache
 from ..util.sequence import is_sequence
 
 from .analysis import NameFinder
-from .compiler_.api import compile_ast, parse
+from .compiler_.api import cached_compile_ast, parse
+from .parse_cache import parse_cache
 from .parser_ import BlockTransformer
 from .compiler_unparse import unparse
 
@@ -56,6 +66,48 @@ class ShadowDict(dict):
         self.shadow[key] = val
 
 
+class ShadowOverlay(ShadowDict):
+    """ ShadowDict over a context that it doesn't copy.
+
+    Reads of names that weren't written fall through to the context (see
+    '__missing__'), and writes never reach it. Code that reads a dict
+    directly instead of by indexing (like functions reading their globals,
+    or 'globals().get') only sees the names that were written or
+    'preload'ed.
+
+    >>> context = {'a': 1, 'b': 2}
+    >>> d = ShadowOverlay(context)
+    >>> d['b'] = 3
+    >>> d['a'], d['b'], d.shadow, context
+    (1, 3, {'b': 3}, {'a': 1, 'b': 2})
+    """
+    def __init__(self, context, preload=()):
+        ShadowDict.__init__(self)
+        self.context = context
+        # The names of the context that were deleted here
+        self.deleted = set()
+        for name in preload:
+            if name in context:
+                dict.__setitem__(self, name, context[name])
+
+    def __missing__(self, key):
+        if key in self.deleted:
+            raise KeyError(key)
+        return self.context[key]
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or \
+               (key not in self.deleted and key in self.context)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if dict.__contains__(self, key):
+            dict.__delitem__(self, key)
+        self.shadow.pop(key, None)
+        self.deleted.add(key)
+
+
 class Block(HasTraits):
     'A block of code that can be inspected, manipulated, and executed.'
 
@@ -80,6 +132,10 @@ class Block(HasTraits):
     fromimports = Property(Instance(set))
     imports_ast = Property(Instance(Node))
 
+    # What the NameFinder that analysed our AST (or folded our sub-blocks'
+    # analyses together) found, for our parent to fold into its own
+    _names = Any(transient=True)
+
     # The sequence of sub-blocks that make up this block, if any. If we don't
     # decompose into sub-blocks, 'sub_blocks' is None.
     sub_blocks = List(__this)
@@ -106,6 +162,10 @@ class Block(HasTraits):
     # Is this block the result of merging other blocks?
     grouped = Bool(False)
 
+    # The maximum number of restrictions to cache. The least recently used
+    # restrictions are evicted first.
+    restriction_cache_size = Int(128)
+
     ### Protected traits #####################################################
 
     # The dependency graph for 'sub_blocks', if they exist. If we don't
@@ -114,11 +174,43 @@ class Block(HasTraits):
     # False' invalidates the cache. ('__dep_graph = None' is valid, so we need
     # to track validity with another variable.)
     _dep_graph = Property(Either(Dict, None))
-    __dep_graph = Either(Dict, None)
+    __dep_graph = Any # (a plain dict, so that we can patch it cheaply)
     __dep_graph_is_valid = Bool(False)
 
-    _code = Property(depends_on='_code_invalidated, ast')
-    _code_invalidated = Event()
+    # The edges of '_dep_graph' grouped by the name that induced them, and a
+    # count of how many names induce each edge. Together they let us patch
+    # '_dep_graph' in place when a single sub-block is inserted, removed or
+    # replaced instead of recomputing it from scratch. ('None' means we have
+    # to recompute.)
+    __dep_edges = Any(transient=True)
+    __dep_edge_counts = Any(transient=True)
+
+    # The reverse of '_dep_graph', kept up to date with it, and the position
+    # of each sub-block in 'sub_blocks' along with the import sub-blocks.
+    # 'restrict' uses these to search the dep graph in both directions
+    # without building the transitive closure.
+    __dep_graph_reverse = Any(transient=True)
+    __sub_block_positions = Any(transient=True)
+
+    # The sub-blocks grouped into waves that can execute concurrently (see
+    # 'execute' with an executor)
+    __execution_waves = Any(transient=True)
+
+    # Code objects for functions that execute this block with fast locals,
+    # by arguments and returned names (see '_get_function_code')
+    __function_codes = Any(transient=True)
+
+    # The source text we were parsed from split into top-level statements,
+    # along with their sub-blocks (see '_get_statement_chunks')
+    __statement_chunks = Any(transient=True)
+
+    _code = Property
+
+    # The compiled '_code', until our AST changes or 'invalidate_cache' is
+    # called. (Not a cached_property that depends on 'ast': every Block would
+    # set up listeners for it when it's created, which costs more than the
+    # rest of creating a sub-block.)
+    __code = Any(transient=True)
 
 
     # Flag to break call cycles when we update 'ast' and 'sub_blocks'
@@ -126,8 +218,21 @@ class Block(HasTraits):
 
     codestring = Property
     _stored_string = Str('')
-    # A cache for block restrictions. Invalidates when structure changes.
-    __restrictions = Dict
+    # A cache for block restrictions (see '_get_restrictions'). Entries are
+    # invalidated when the structure changes in a way that touches the names
+    # they were computed from.
+    __restrictions = Any(transient=True)
+
+    ### Protected class attributes ###########################################
+
+    # What our ASTs are made of, and which of them are imports. (Subclasses
+    # can represent code with other ASTs by overriding these and the methods
+    # under "AST protected interface".)
+    _ast_class = Node
+    _import_classes = (compiler.ast.Import, compiler.ast.From)
+
+    # The cache for our source text (see 'codetools.blocks.parse_cache')
+    _parse_cache = parse_cache
 
     ###########################################################################
     # object interface
@@ -163,11 +268,16 @@ class Block(HasTraits):
             x = x.read()
 
         # 'x' -> 'self.ast' or 'self.sub_blocks'
+        cached = None
         if isinstance(x, basestring):
-            # (BlockTransformer handles things like 'import *')
-            self.ast = parse(x, mode='exec', transformer=BlockTransformer())
+            # Reuse the AST and analysis of identical text if we can
+            cached = self._parse_cache.get(x)
+            if cached is None:
+                self.ast = self._parse(x)
+            else:
+                self.ast = cached[0]
             self._stored_string = x
-        elif isinstance(x, Node):
+        elif isinstance(x, self._ast_class):
             # push an exception handler onto the stack to ensure that the calling function gets the error
             #push_exception_handler(handler = lambda o,t,ov,nv: None, reraise_exceptions=True)
             self._updating_structure = True
@@ -179,9 +289,9 @@ class Block(HasTraits):
             #pop_exception_handler()
         elif is_sequence(x):
             if len(x) == 0:
-                self.ast = Stmt([])
+                self.ast = self._join([])
             sub_blocks = []
-            for block in map(to_block, x):
+            for block in map(self._to_block, x):
                 if block.sub_blocks is None or len(block.sub_blocks) == 0:
                     sub_blocks.append(block)
                 else:
@@ -193,6 +303,20 @@ class Block(HasTraits):
 
         # prepare the inputs and outputs
         self._clear_cache_inputs_and_outputs()
+        if isinstance(x, basestring):
+            if cached is None:
+                # (Text we only see once is analysed when it's used, if ever.
+                # Code we can't analyse can still be executed, so its
+                # analysis errors only surface when the names are used.)
+                if self._parse_cache.wants(x):
+                    try:
+                        analysis = self._get_analysis()
+                    except Exception:
+                        analysis = None
+                    if analysis is not None:
+                        self._parse_cache.set(x, (self.ast, analysis))
+            else:
+                self._set_analysis(cached[1])
 
         # We really want to keep the filename for "pristine" blocks, and
         # _structure_changed nukes it most times
@@ -279,11 +403,57 @@ class Block(HasTraits):
         return isinstance(self.ast, Stmt) and len(self.ast.nodes) == 0
 
 
-    def execute(self, local_context, global_context = {}, continue_on_errors=False):
+    def execute(self, local_context, global_context = {}, continue_on_errors=False,
+                executor=None, memo=None, profiler=None):
         """Execute the block in local_context, optionally specifying a global
         context.  If continue_on_errors is specified, continue executing code after
         an exception is thrown and throw the exceptions at the end of execution.
-        if more than one exception was thrown, combine them in a CompositeException"""
+        if more than one exception was thrown, combine them in a CompositeException
+
+        If a concurrent.futures 'executor' is given, independent sub-blocks
+        run concurrently on it (see '_execute_waves'). Blocks whose names we
+        can't analyze (like 'del name') run one by one instead.
+
+        If a 'memo' (see 'codetools.blocks.memo.SubBlockMemo') is given,
+        sub-blocks whose inputs haven't changed since they last ran with it
+        aren't executed again; their remembered outputs are used instead.
+
+        If a 'profiler' (see 'codetools.blocks.profiler.BlockProfiler') is
+        given, it records the time each sub-block takes. Neither can be used
+        with an 'executor'."""
+        if executor is not None and len(self.sub_blocks) > 1:
+            if memo is not None or profiler is not None:
+                raise ValueError("Can't use a memo or a profiler with an "
+                                 "executor")
+            try:
+                waves = self._get_execution_waves()
+            except NotImplementedError:
+                waves = None
+            if waves is not None:
+                self._execute_waves(waves, local_context, global_context,
+                                    continue_on_errors, executor)
+                return
+
+        if memo is not None or profiler is not None:
+            exceptions = []
+            for block in self.sub_blocks or [self]:
+                try:
+                    if profiler is not None:
+                        profiler.execute(block, local_context, global_context,
+                                         parent=self, memo=memo)
+                    else:
+                        memo.execute(block, local_context, global_context)
+                except Exception, e:
+                    if not continue_on_errors:
+                        raise
+                    e.traceback = format_exc()
+                    exceptions.append(e)
+            if len(exceptions) > 1:
+                raise CompositeException(exceptions)
+            elif exceptions:
+                raise exceptions[0]
+            return
+
         # To get tracebacks to show the right filename for any line in any
         # sub-block, we need each sub-block to compile its own '_code' since a
         # code object only keeps one filename. This is slow, so we give the
@@ -317,6 +487,65 @@ class Block(HasTraits):
                     block.execute(local_context, global_context)
         return
 
+    def execute_fast(self, local_context, global_context={}):
+        """ Execute the block like 'execute', but as a generated function
+        whose variables are fast locals instead of items of 'local_context'.
+
+        The names in 'local_context' that the block uses are passed in as
+        arguments (as are the names the block binds that are only in
+        'global_context' or the builtins, which a function wouldn't fall back
+        to), and the names the block binds are written back into
+        'local_context' when the function returns or raises, in sorted
+        order. (Names that are still bound to the argument they came in as
+        aren't written back.)
+
+        Blocks that can't run as a function (because they use 'return',
+        'yield', 'global' or 'exec' at the top level, or 'del' on names, or
+        something else the dependency analysis doesn't handle) just use
+        'execute'.
+        """
+        try:
+            names = _root_names(self.inputs | self.all_outputs |
+                                self.fromimports)
+            bound_names = _root_names(self.all_outputs | self.fromimports)
+        except NotImplementedError:
+            self.execute(local_context, global_context)
+            return
+
+        args = []
+        argnames = []
+        for name in names:
+            if name in local_context:
+                value = local_context[name]
+            elif name not in bound_names:
+                continue
+            elif name in global_context:
+                value = global_context[name]
+            elif hasattr(__builtin__, name):
+                value = getattr(__builtin__, name)
+            else:
+                continue
+            argnames.append(name)
+            args.append(value)
+        code = self._get_function_code(tuple(argnames), None)
+        if code is None:
+            self.execute(local_context, global_context)
+            return
+
+        passed = dict(zip(argnames, args))
+        try:
+            bound = _function(code, global_context)(*args)
+        except Exception:
+            # Keep what the block bound before the exception, as 'execute'
+            # does, from the function's frame in the traceback
+            exc_info = sys.exc_info()
+            tb = exc_info[2].tb_next
+            if tb is not None and tb.tb_frame.f_code is code:
+                _write_bound(local_context, tb.tb_frame.f_locals,
+                             bound_names, passed)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        _write_bound(local_context, bound, bound_names, passed)
+
     def execute_impure(self, context, continue_on_errors=False,
                        clean_shadow=True):
         """
@@ -351,9 +580,15 @@ class Block(HasTraits):
           function definitions, then the passed-in local and global contexts
           must be identical, and must be a dict.
 
-        To meet these requirements, execute_impure copies a context into a
-        dict, then executes the code block with this dict serving as both
-        local and global context.
+        To meet these requirements, execute_impure executes the code block
+        with a dict over the context (a ShadowOverlay) serving as both local
+        and global context. The context isn't copied: the dict holds only the
+        names the code block writes, plus the names that its functions (and
+        classes, lambdas and generator expressions) read as globals, so the
+        cost doesn't depend on the size of the context. Other reads fall
+        through to the context. Code that looks at its namespace as a whole
+        (with 'exec', 'eval', 'globals', 'locals', 'vars', 'dir' or
+        'execfile') gets a copy of the context (a ShadowDict) instead.
 
         execute_impure also uses a shadow dictionary to track any calls to the
         context dict's __setitem__, allowing you to keep track of changes made
@@ -390,7 +625,18 @@ class Block(HasTraits):
             shadowed names/values.
 
         """
-        shadowed = ShadowDict(context)
+        codes = [block._code for block in self.sub_blocks or [self]]
+        if any(_reads_namespace(code) for code in codes):
+            # The code looks at the namespace as a whole, so it needs all of
+            # the context
+            shadowed = ShadowDict(context)
+        else:
+            # Functions read their globals from the dict directly, so give it
+            # the names they might read
+            names = set()
+            for code in codes:
+                names |= _nested_global_names(code)
+            shadowed = ShadowOverlay(context, preload=names)
         self.execute(shadowed, shadowed, continue_on_errors)
         shadow = shadowed.shadow
         if clean_shadow:
@@ -403,11 +649,213 @@ class Block(HasTraits):
         return shadow
 
 
+    def _execute_waves(self, waves, local_context, global_context,
+                       continue_on_errors, executor):
+        """ Execute our sub-blocks wave by wave (see '_get_execution_waves')
+            on 'executor'.
+
+            The sub-blocks in a wave neither read nor write any name that
+            another sub-block in the same wave writes, so they can run in
+            any order. Each one runs against its own namespace that reads
+            through to 'local_context', and after the wave we write the
+            namespaces back into 'local_context' in the order of
+            'sub_blocks'. The context only ever changes in the calling
+            thread, and always in the same order.
+
+            If a sub-block fails and we aren't continuing on errors, we leave
+            'local_context' as executing the sub-blocks one by one would: we
+            write back what the sub-blocks before it in the current wave
+            bound, execute the ones before it in later waves, write back
+            what it bound before it failed, and raise its exception. (The
+            rest of the wave still ran, but only its changes to objects in
+            place or to 'global_context' are kept.)
+        """
+        # Compile up front so that the workers don't update traits
+        for block in self.sub_blocks:
+            block._code
+
+        def run(block):
+            namespace = _WaveNamespace(local_context)
+            try:
+                block.execute(namespace, global_context)
+            except Exception, e:
+                e.traceback = format_exc()
+                return namespace, e
+            return namespace, None
+
+        positions = dict((id(block), i)
+                         for i, block in enumerate(self.sub_blocks))
+        executed = set()
+        exceptions = []
+        for wave in waves:
+            results = list(executor.map(run, wave))
+            for block, (namespace, e) in zip(wave, results):
+                if e is not None and not continue_on_errors:
+                    # Execute what would have run before it. (The sub-blocks
+                    # before it in later waves can't read or write what it
+                    # bound, so that can be written back after them.)
+                    position = positions[id(block)]
+                    for earlier in self.sub_blocks[:position]:
+                        if id(earlier) not in executed:
+                            earlier.execute(local_context, global_context)
+                for name, value in namespace.iteritems():
+                    local_context[name] = value
+                if e is not None:
+                    if not continue_on_errors:
+                        raise e
+                    exceptions.append((positions[id(block)], e))
+                executed.add(id(block))
+
+        exceptions = [e for position, e in sorted(exceptions)]
+        if len(exceptions) > 1:
+            raise CompositeException(exceptions)
+        elif exceptions:
+            raise exceptions[0]
+
+    def _get_function_code(self, argnames, returns):
+        """ Return the code for a function that takes 'argnames', executes
+        our AST, and returns the values of the names in 'returns' (a single
+        value for a single name, and a dict of its local variables if
+        'returns' is None).
+
+        Returns None if our AST can't be the body of a function. The codes
+        are cached until our structure changes.
+        """
+        if self.__function_codes is None:
+            self.__function_codes = LRUCache(max_entries=32)
+        key = (argnames, returns)
+        code = self.__function_codes.get(key, False)
+        if code is False:
+            code = self.__function_codes[key] = \
+                   self._compile_function(argnames, returns)
+        return code
+
+    def _get_execution_waves(self):
+        """ Group our sub-blocks into waves: the first wave holds the
+            sub-blocks that don't depend on any other, and each later wave
+            only depends on earlier ones.
+
+            Unlike '_dep_graph', we also order writes (including imports)
+            after earlier reads and writes of the same name, and we only look
+            at the first part of dotted names (so writing 'a.x' conflicts
+            with any use of 'a'). Changes in place, like 'd[k] = v', 'a.x +=
+            1' or 'lst.append(v)', count as writes of the changed name.
+        """
+        if self.__execution_waves is None:
+            waves = []
+            last_read, last_written = {}, {}
+            for block in self.sub_blocks:
+                reads = set(name.split('.', 1)[0] for name in block.inputs)
+                writes = set(name.split('.', 1)[0] for name in
+                             block.all_outputs | block.fromimports)
+                writes.update(self._find_mutated_names(block.ast))
+                wave = 0
+                for name in reads | writes:
+                    wave = max(wave, last_written.get(name, -1) + 1)
+                for name in writes:
+                    wave = max(wave, last_read.get(name, -1) + 1)
+                for name in reads:
+                    last_read[name] = max(last_read.get(name, -1), wave)
+                for name in writes:
+                    last_written[name] = wave
+                if wave == len(waves):
+                    waves.append([])
+                waves[wave].append(block)
+            self.__execution_waves = waves
+        return self.__execution_waves
+
     def invalidate_cache(self):
         """ Someone modified the block's internal ast. This method provides and
             explicit means to invalidating the cached _code object
         """
-        self._code_invalidated = True
+        self.__code = None
+        self.__function_codes = None
+
+    def reparse(self, code):
+        ''' Change the block to represent the source text 'code', keeping
+            the sub-blocks of the top-level statements that didn't change.
+
+            The kept sub-blocks hold on to their uuids, their analysis and
+            their compiled code, only the edited statements are parsed and
+            analysed, and only the cached restrictions involving names that
+            the edited statements read or write are dropped. Statements that
+            only moved to other lines get their line numbers updated (and
+            their code recompiled, to keep tracebacks right).
+
+            If the block didn't come from source text, or the text can't be
+            split into statements, the whole text is parsed again.
+
+            >>> b = Block('a = 1\\nb = a + 1')
+            >>> a_block = b.sub_blocks[0]
+            >>> b.reparse('a = 1\\nb = a + 2\\nc = b')
+            >>> b.sub_blocks[0] is a_block, sorted(b.outputs)
+            (True, ['a', 'b', 'c'])
+        '''
+        old_chunks = self._get_statement_chunks()
+        new_chunks = _statement_chunks(code)
+        if not old_chunks or not new_chunks:
+            self._reparse_all(code)
+            return
+
+        # Parse the edited statements first, so that a syntax error leaves
+        # us unchanged
+        filename = self.sub_blocks[0].filename
+        matcher = SequenceMatcher(None, [text for text, _, _ in old_chunks],
+                                  [text for text, _ in new_chunks],
+                                  autojunk=False)
+        opcodes = matcher.get_opcodes()
+        chunks = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == 'equal':
+                chunks.extend((new_chunks[j][0], new_chunks[j][1], blocks)
+                              for j, (_, _, blocks) in
+                              zip(range(j1, j2), old_chunks[i1:i2]))
+                continue
+            for text, row in new_chunks[j1:j2]:
+                # (Pad with newlines to get the right line numbers)
+                blocks = self._decompose(self._parse('\n' * (row - 1) +
+                                                     text))
+                for b in blocks:
+                    b.filename = filename
+                chunks.append((text, row, blocks))
+
+        # Move the statements that moved
+        shifted = False
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag != 'equal':
+                continue
+            for (_, old_row, blocks), (_, new_row) in \
+                    zip(old_chunks[i1:i2], new_chunks[j1:j2]):
+                if new_row != old_row:
+                    shifted = True
+                    for b in blocks:
+                        self._shift_linenos(b.ast, new_row - old_row)
+                        b.invalidate_cache()
+
+        # Edit 'sub_blocks' from the end, one sub-block at a time, so that
+        # the caches are patched rather than recomputed
+        positions = [0]
+        for _, _, blocks in old_chunks:
+            positions.append(positions[-1] + len(blocks))
+        for tag, i1, i2, j1, j2 in reversed(opcodes):
+            if tag == 'equal':
+                continue
+            start, stop = positions[i1], positions[i2]
+            new_blocks = [b for _, _, blocks in chunks[j1:j2] for b in blocks]
+            common = min(stop - start, len(new_blocks))
+            for k in range(common):
+                self.sub_blocks[start + k] = new_blocks[k]
+            for k in range(stop - start - common):
+                del self.sub_blocks[start + common]
+            for k in range(common, len(new_blocks)):
+                self.sub_blocks.insert(start + k, new_blocks[k])
+
+        if shifted:
+            self.invalidate_cache()
+            for _, (b, _, _) in self._get_restrictions().items():
+                b.invalidate_cache()
+        self._stored_string = code
+        self.__statement_chunks = (code, chunks)
 
     def restrict(self, inputs=(), outputs=()):
         ''' The minimal sub-block that computes 'outputs' from 'inputs'.
@@ -440,9 +888,11 @@ class Block(HasTraits):
         outputs = set(outputs)
 
         # Look for results in the cache
+        restrictions = self._get_restrictions()
         cache_key = (frozenset(inputs), frozenset(outputs))
-        if cache_key in self.__restrictions:
-            return self.__restrictions[cache_key]
+        cached = restrictions.get(cache_key)
+        if cached is not None:
+            return cached[0]
 
         # Validate the method arguments.
         #
@@ -463,104 +913,112 @@ class Block(HasTraits):
         if self.sub_blocks is None:
             return self
 
-        # we must keep a list of import blocks. Imports are lost because
-        # they are not reachable during the reversing of the graph
-        import_sub_blocks = []
-        for sub_block in self.sub_blocks:
-            if isinstance(sub_block.ast, compiler.ast.Import) or \
-               isinstance(sub_block.ast, compiler.ast.From):
-                import_sub_blocks.append(sub_block)
-
-        # We use the mock constructors `In` and `Out` to separate input and
-        # output names in the dep graph in order to avoid cyclic graphs (in
-        # case input and output names overlap)
+        dep_graph = self._dep_graph
+        dependents = self.__dep_graph_reverse
+        positions, import_sub_blocks = self._get_sub_block_positions()
+        imports = set(import_sub_blocks)
+
+        # A cached restriction on a subset of the inputs gives the same result
+        # if the other inputs aren't intermediates and only the sub-blocks it
+        # already reaches depend on them
+        for key, (b, names, forward) in restrictions.items():
+            if key[1] == cache_key[1] and key[0] and key[0] < cache_key[0]:
+                extra = cache_key[0] - key[0]
+                if extra.isdisjoint(self.outputs) and \
+                       all(forward.issuperset(dependents.get(name, ()))
+                           for name in extra):
+                    restrictions.get(key)
+                    restrictions[cache_key] = (b, names | extra, forward)
+                    return b
+
+        # We use the tags `in_` and `out` to separate input and output names
+        # in the dep graph in order to avoid cyclic graphs (in case input and
+        # output names overlap). Names are represented as '(name, tag)' and
+        # blocks as themselves.
         in_, out = object(), object() # (singletons)
-        In = lambda x: (x, in_)
-        Out = lambda x: (x, out)
-
-        def wrap_names(wrap):
-            "Wrap names and leave everything else alone"
-            def g(x):
-                if isinstance(x, basestring):
-                    return wrap(x)
-                else:
-                    return x
-            return g
-
-        # Decorate input names with `In` and output names with `Out` so that
-        # `g` isn't cyclic
-        g = map_keys(wrap_names(Out),
-                map_values(lambda l: map(wrap_names(In), l), self._dep_graph))
 
-        # Find the subgraph reachable from inputs, and then find its subgraph
-        # reachable from outputs. (We could also flip the order.)
+        # Inputs that are outputs of the block are intermediates. The block
+        # providing an intermediate is cut off from its dependents, which
+        # depend on the intermediate value instead. This means for the code
+        # "c = a * b; d = c * 3", we are removing c's dependency on "a" and
+        # "b". If the user restricts on 'd' as an input instead, the result is
+        # an empty block.
+        intermediates = inputs & self.outputs
+        pruned = set()
+        for name in intermediates:
+            pruned.update(dep_graph.get(name, ()))
+
+        def users(node):
+            "The nodes that depend directly on 'node'"
+            if isinstance(node, Block):
+                if node not in pruned:
+                    for user in dependents.get(node, ()):
+                        if isinstance(user, Block):
+                            yield user
+                        else:
+                            yield (user, out)
+            elif node[1] is in_:
+                for user in dependents.get(node[0], ()):
+                    yield user
+
+        def deps(node):
+            "The nodes that 'node' depends on directly"
+            if isinstance(node, Block):
+                for dep in dep_graph.get(node, ()):
+                    if isinstance(dep, Block):
+                        if dep not in pruned:
+                            yield dep
+                    else:
+                        yield (dep, in_)
+            elif node[1] is out and node[0] not in intermediates:
+                for dep in dep_graph.get(node[0], ()):
+                    if dep not in pruned:
+                        yield dep
+
+        # Find the nodes that depend on the inputs, and then the nodes among
+        # them that the outputs depend on.
         if inputs:
-            # look in the outputs for intermediate inputs
-            intermediates = map(Out, self.outputs.intersection(inputs))
-            inputs = inputs - self.outputs.intersection(inputs)
-
-            # Find the intermediate's block node and replace it
-            # with the intermediate value. This effectively cuts
-            # the block's children off the tree. This means for
-            # the code "c = a * b; d = c * 3", we are removing c's
-            # dependency on "a" and "b"
-            #
-            # There is a special case which is handled here as well:
-            # for the code "c = a * b; d = c * 3", is the user wants
-            # to restrict the block with 'd' as an input, the result
-            # is an empty sub-block
-            for intermediate in intermediates:
-                pruned_block = g[intermediate][0]
-
-                # its possible someone tried to restrict an import,
-                # which is not in the graph
-                #fixme: uncommenting these breaks pruning intermediates, why is this here?
-#                if not g.has_key(pruned_block):
-#                    intermediates.remove(intermediate)
-#                    continue
-
-                # if intermediate is not removed, the resulting graph will
-                # be cyclic
-                g.pop(intermediate)
-
-                pure_output = True
-                for v in g.values():
-                    if pruned_block in v:
-                        pure_output = False
-                        v.remove(pruned_block)
-                        v.append(intermediate)
-                if pure_output:
-                    # pure outputs must be kept on the graph or else
-                    # they will not be reachable
-                    g[intermediate] = [Block("%s = %s" % \
-                                        (intermediate[0], intermediate[0]))]
-
-            inputs = map(In, inputs) + intermediates
-
-            # if no inputs were valid, do not alter the graph
-            if len(inputs) > 0:
-                g = graph.reverse(graph.reachable_graph(graph.reverse(g), inputs))
+            starts = [ (name, out) for name in intermediates ] + \
+                     [ (name, in_) for name in inputs - intermediates ]
+            for b in pruned:
+                for user in dependents.get(b, ()):
+                    starts.append(user if isinstance(user, Block)
+                                  else (user, out))
+            reachable = forward = _search(starts, users)
         if outputs:
-            outputs = map(Out, outputs)
-            g = graph.reachable_graph(g, set(outputs).intersection(g.keys()))
+            starts = [ (name, out) for name in outputs ]
+            if inputs:
+                starts = [ node for node in starts if node in forward ]
+                reachable = _search(starts, deps, within=forward)
+            else:
+                reachable = _search(starts, deps)
+
+        # Remember which names the result was computed from so that we can
+        # tell whether a later structural change affects it. (A change can
+        # only affect the result if it touches the nodes that depend on the
+        # inputs or, if there are no inputs, the nodes the outputs depend on.)
+        reachable_names = set(cache_key[0] | cache_key[1])
+        reachable_names.update(_node_names(forward if inputs else reachable))
 
         # Create a new block from the remaining sub-blocks (ordered imports
-        # first, then input to output, ignoring the variables at the ends)
-        # and give it our filename
-        remaining_sub_blocks = [node for node in reversed(graph.topological_sort(g))
-                       if isinstance(node, Block)]
-
-        # trim out redundant imports which can occur if a restricted output is
-        # one of the imports:
-        for sub_block in remaining_sub_blocks:
-            if sub_block in import_sub_blocks:
-                remaining_sub_blocks.remove(sub_block)
-
-        b = Block(import_sub_blocks + remaining_sub_blocks)
+        # first, then in the order of execution) and give it our filename.
+        # (We must keep all of the imports because they aren't reachable in
+        # the dep graph)
+        remaining_sub_blocks = sorted((node for node in reachable
+                                       if isinstance(node, Block) and
+                                       node not in imports),
+                                      key=positions.__getitem__)
+
+        b = type(self)(import_sub_blocks + remaining_sub_blocks)
         b.filename = self.filename
 
-        # Cache result
-        self.__restrictions[cache_key] = b
+        # Cache result, along with the sub-blocks that depend on the inputs
+        if inputs:
+            forward = frozenset(node for node in forward
+                                if isinstance(node, Block))
+        else:
+            forward = None
+        restrictions[cache_key] = (b, frozenset(reachable_names), forward)
 
         return b
 
@@ -579,25 +1037,88 @@ class Block(HasTraits):
         block.no_filenames_in_tracebacks = True
         leni = len(inputs)
         leno = len(outputs)
-        def simplefunc(*args):
-            if len(args) != leni:
-                raise ValueError, "Must have %d inputs" % leni
-            namespace = {}
-            for i, arg in enumerate(args):
-                namespace[inputs[i]] = arg
-            block.execute(namespace)
-            if leno == 1:
-                return namespace[outputs[0]]
-            vals = []
-            for name in outputs:
-                vals.append(namespace[name])
-            return tuple(vals)
+        code = block._get_function_code(tuple(inputs), tuple(outputs))
+        if code is not None:
+            # Run the block as a real function, with fast locals
+            function = _function(code, {})
+            def simplefunc(*args):
+                if len(args) != leni:
+                    raise ValueError, "Must have %d inputs" % leni
+                return function(*args)
+        else:
+            def simplefunc(*args):
+                if len(args) != leni:
+                    raise ValueError, "Must have %d inputs" % leni
+                namespace = {}
+                for i, arg in enumerate(args):
+                    namespace[inputs[i]] = arg
+                block.execute(namespace)
+                if leno == 1:
+                    return namespace[outputs[0]]
+                vals = []
+                for name in outputs:
+                    vals.append(namespace[name])
+                return tuple(vals)
         callstr = '(%s)'% ','.join(inputs)
         retstr = ','.join(outputs)
         simplefunc.__doc__ = "%s = <name>%s" % (retstr, callstr)
         simplefunc._block = block
         return simplefunc
 
+    def get_batch_function(self, inputs=[], outputs=[]):
+        """Return a function which takes a column of values for each of the
+        input variables and returns an array of values for each of the given
+        outputs (or a single array for a single output).
+
+        The function's 'from_rows' attribute takes an iterable of argument
+        tuples instead. Blocks of plain arithmetic and ufunc calls are
+        evaluated once over whole NumPy columns; anything else is evaluated
+        in a loop. See 'codetools.blocks.batch'.
+        """
+        from .batch import batch_function
+
+        if isinstance(outputs, basestring):
+            outputs = [outputs]
+        if isinstance(inputs, basestring):
+            inputs = [inputs]
+        block = self.restrict(inputs=inputs, outputs=outputs)
+        batchfunc = batch_function(block, list(inputs), list(outputs))
+        callstr = '(%s)'% ','.join(inputs)
+        retstr = ','.join(outputs)
+        batchfunc.__doc__ = "%s = <name>%s" % (retstr, callstr)
+        batchfunc._block = block
+        return batchfunc
+
+    def execute_chunked(self, local_context, outputs, chunk_size=65536,
+                        axis=0, sliced=None, out=None, global_context={}):
+        """ Compute 'outputs' from the arrays in 'local_context' in slices of
+        'chunk_size' along 'axis', and write them into 'local_context'.
+
+        Only the part of the block that computes 'outputs' runs, once per
+        slice, and its other values are dropped after each run, so arrays
+        of any length can be processed in bounded memory. The outputs go
+        into the arrays of 'out' (a mapping of names to arrays, which may be
+        memory-mapped), or else into new arrays. See
+        'codetools.blocks.chunked'.
+        """
+        from .chunked import execute_chunked
+
+        if isinstance(outputs, basestring):
+            outputs = [outputs]
+        block = self.restrict(outputs=outputs)
+        execute_chunked(block, local_context, list(outputs),
+                        chunk_size=chunk_size, axis=axis, sliced=sliced,
+                        out=out, global_context=global_context)
+
+    def restriction_cache_info(self):
+        """ Return the hits, misses and evictions of the restriction cache,
+        and its current and maximum number of entries.
+
+        Reusing a cached restriction on a subset of the inputs counts as a
+        miss for the new inputs and a hit for the reused restriction.
+        """
+        return self._get_restrictions().info()
+
     def validate_for_restriction(self):
         # Check to ensure that there is not sub_block that has the same
         # variable as an input and an output. Return the offending
@@ -629,6 +1150,9 @@ class Block(HasTraits):
         if isinstance(self.ast, Stmt) and len(self.ast.nodes) == 1:
             [self.ast] = self.ast.nodes
 
+    def _ast_changed(self):
+        self.__code = None
+
     def _structure_changed(self, name, new):
         if not self._updating_structure:
             try:
@@ -639,7 +1163,7 @@ class Block(HasTraits):
                     self._tidy_ast()
 
                     # Compute our new sub-blocks and give them our filename
-                    self.sub_blocks = Block._decompose(self.ast)
+                    self.sub_blocks = self._decompose(self.ast)
                     if self.sub_blocks is not None:
                         for b in self.sub_blocks:
                             b.filename = self.filename
@@ -648,15 +1172,29 @@ class Block(HasTraits):
 
                 elif name in ('sub_blocks', 'sub_blocks_items'):
 
-                    self.ast = Stmt([ b.ast for b in self.sub_blocks ])
+                    self.ast = self._join([ b.ast for b in self.sub_blocks ])
 
                 else:
                     assert False
 
-                # Invalidate caches
-                self.__dep_graph_is_valid = False
-                self.__restrictions.clear()
+                # Invalidate caches. If a single sub-block was inserted,
+                # removed or replaced, only the names it touches are affected.
+                # (A sub-block that reads a name it writes makes every
+                # restriction fail, and every restriction keeps all the
+                # import sub-blocks, so either invalidates everything.)
+                if name == 'sub_blocks_items' and \
+                       len(new.added) <= 1 and len(new.removed) <= 1 and \
+                       not any(b.inputs & b.outputs for b in new.added) and \
+                       not any(isinstance(b.ast, self._import_classes)
+                               for b in new.added + new.removed):
+                    self._patch_caches_for(new.added + new.removed)
+                else:
+                    self.__dep_graph_is_valid = False
+                    self._get_restrictions().clear()
                 self._stored_string = ''
+                self.__sub_block_positions = None
+                self.__execution_waves = None
+                self.__function_codes = None
 
                 # update inputs and outputs
                 self._clear_cache_inputs_and_outputs()
@@ -664,6 +1202,142 @@ class Block(HasTraits):
             finally:
                 self._updating_structure = False
 
+    def _patch_caches_for(self, changed):
+        ''' Update the caches after the sub-blocks in 'changed' were added to
+            or removed from 'sub_blocks'.
+
+            Only the dependency edges induced by the names that the changed
+            sub-blocks read or write are recomputed, and only the cached
+            restrictions that were computed from those names are dropped.
+        '''
+        names = set()
+        for b in changed:
+            names |= b.inputs | b.all_outputs
+
+        # Dotted inputs depend on the providers of their prefixes, so they
+        # are affected by changes to those prefixes too
+        if self.__dep_edges is not None:
+            for name in self.__dep_edges:
+                if name not in names and \
+                       not names.isdisjoint(_name_prefixes(name)):
+                    names.add(name)
+
+        if self.__dep_graph_is_valid and self.__dep_edges is not None:
+            _, _, _, edges = Block._compute_name_dependencies(self.sub_blocks,
+                                                              names)
+            for name in names:
+                for k, v in self.__dep_edges.pop(name, ()):
+                    self._unlink_dep(k, v)
+            for name, name_edges in edges.items():
+                for k, v in name_edges:
+                    self._link_dep(k, v)
+            self.__dep_edges.update(edges)
+        else:
+            self.__dep_graph_is_valid = False
+
+        touched = set(names)
+        for name in names:
+            parts = name.split('.')
+            touched.update('.'.join(parts[:i]) for i in range(1, len(parts)))
+            touched.update(_name_prefixes(name))
+        restrictions = self._get_restrictions()
+        for key, (b, key_names, forward) in restrictions.items():
+            if not touched.isdisjoint(key_names):
+                del restrictions[key]
+
+    def _link_dep(self, k, v):
+        edge = (k, v)
+        count = self.__dep_edge_counts.get(edge, 0)
+        if count == 0:
+            self.__dep_graph.setdefault(k, set()).add(v)
+            self.__dep_graph_reverse.setdefault(v, set()).add(k)
+        self.__dep_edge_counts[edge] = count + 1
+
+    def _unlink_dep(self, k, v):
+        edge = (k, v)
+        count = self.__dep_edge_counts.pop(edge) - 1
+        if count > 0:
+            self.__dep_edge_counts[edge] = count
+        else:
+            successors = self.__dep_graph[k]
+            successors.discard(v)
+            if not successors:
+                del self.__dep_graph[k]
+            predecessors = self.__dep_graph_reverse[v]
+            predecessors.discard(k)
+            if not predecessors:
+                del self.__dep_graph_reverse[v]
+
+    def _reparse_all(self, code):
+        "Parse 'code' from scratch, as in the constructor"
+        filename = self.sub_blocks[0].filename if self.sub_blocks else \
+                   self.filename
+        self.filename = filename
+        self.ast = self._parse(code)
+        self._stored_string = code
+
+    def _get_statement_chunks(self):
+        ''' Return the top-level statements of the source text we were
+            parsed from (see '_statement_chunks'), each with its line number
+            and the sub-blocks it became, or None if we can't tell.
+        '''
+        code = self._stored_string
+        if not code or not self.sub_blocks:
+            return None
+        if self.__statement_chunks is not None and \
+               self.__statement_chunks[0] == code:
+            return self.__statement_chunks[1]
+        statements = _statement_chunks(code)
+        if statements is None:
+            return None
+
+        # Find the sub-blocks of each statement by their line numbers
+        chunks, i = [], 0
+        for k, (text, row) in enumerate(statements):
+            if k + 1 < len(statements):
+                end = statements[k + 1][1]
+            else:
+                end = None
+            blocks = []
+            while i < len(self.sub_blocks):
+                lineno = getattr(self.sub_blocks[i].ast, 'lineno', None)
+                if lineno is None or lineno < row:
+                    return None
+                if end is not None and lineno >= end:
+                    break
+                blocks.append(self.sub_blocks[i])
+                i += 1
+            if not blocks:
+                return None
+            chunks.append((text, row, blocks))
+        if i != len(self.sub_blocks):
+            return None
+        self.__statement_chunks = (code, chunks)
+        return chunks
+
+    def _get_restrictions(self):
+        "Return the restriction cache, creating it if necessary"
+        if self.__restrictions is None:
+            self.__restrictions = LRUCache(self.restriction_cache_size)
+        return self.__restrictions
+
+    def _restriction_cache_size_changed(self, new):
+        if self.__restrictions is not None:
+            self.__restrictions.max_entries = new
+
+    def _get_sub_block_positions(self):
+        """ Return a dict mapping each sub-block to its position in
+            'sub_blocks', and the list of import sub-blocks.
+        """
+        if self.__sub_block_positions is None:
+            positions, imports = {}, []
+            for i, sub_block in enumerate(self.sub_blocks):
+                positions[sub_block] = i
+                if isinstance(sub_block.ast, self._import_classes):
+                    imports.append(sub_block)
+            self.__sub_block_positions = positions, imports
+        return self.__sub_block_positions
+
     def _clear_cache_inputs_and_outputs(self):
         self._inputs = None
         self._outputs = None
@@ -671,22 +1345,57 @@ class Block(HasTraits):
         self._const_assign = None
         self._fromimports = None
         self._imports_ast = None
+        self._names = None
 
     def _set_inputs_and_outputs(self):
         if self.ast is None:
             return
 
-        v = compiler.walk(self.ast, NameFinder())
+        if self.sub_blocks:
+            # Fold the analyses of our sub-blocks together instead of walking
+            # their ASTs again
+            v = NameFinder()
+            for b in self.sub_blocks:
+                v.extend(b._get_names())
+        else:
+            v = self._find_names(self.ast)
+        self._names = v.summary()
+
         self._inputs = set(v.free)
         self._outputs = set(v.locals)
         self._conditional_outputs = set(v.conditional_locals)
-        temp = [unparse(x).strip() for x in v.constlist]
+        temp = [self._unparse(x).strip() for x in v.constlist]
         temp2 = [x.split('=')[0].strip() for x in temp]
         self._const_assign = (set(temp2), temp)
         self._fromimports = set(v.fromimports)
         self._outputs -= self.fromimports
         self._imports_ast = v.imports
 
+    def _get_names(self):
+        "Return the NameSummary our inputs and outputs come from"
+        if self._names is None:
+            self._set_inputs_and_outputs()
+        return self._names
+
+    def _get_analysis(self):
+        ''' Return the results of '_set_inputs_and_outputs' for this block
+            and its sub-blocks, for '_set_analysis'.
+        '''
+        blocks = [self] + list(self.sub_blocks or [])
+        for block in blocks:
+            if block._inputs is None:
+                block._set_inputs_and_outputs()
+        return [[getattr(block, name) for name in _ANALYSIS_NAMES]
+                for block in blocks]
+
+    def _set_analysis(self, analysis):
+        "Restore the results of '_get_analysis' for an identical block"
+        blocks = [self] + list(self.sub_blocks or [])
+        assert len(blocks) == len(analysis)
+        for block, values in zip(blocks, analysis):
+            for name, value in zip(_ANALYSIS_NAMES, values):
+                setattr(block, name, value)
+
     def _get_inputs(self):
         if self._inputs is None:
             self._set_inputs_and_outputs()
@@ -721,10 +1430,86 @@ class Block(HasTraits):
         if self._stored_string != '':
             return self._stored_string
         else:
-            return unparse(self.ast)
+            return self._unparse(self.ast)
 
-    @cached_property
     def _get__code(self):
+        if self.__code is None:
+            self.__code = self._compile()
+        return self.__code
+
+    def _get__dep_graph(self):
+
+        # Cache dep graphs. (The bookkeeping for the dep graph isn't pickled,
+        # so we recompute it for unpickled blocks.)
+        if not self.__dep_graph_is_valid or self.__dep_edges is None:
+
+            inputs, outputs, conditional_outputs, edges = \
+                Block._compute_name_dependencies(self.sub_blocks)
+
+            self.__dep_graph = {}
+            self.__dep_graph_reverse = {}
+            self.__dep_edges = edges
+            self.__dep_edge_counts = {}
+            for name_edges in edges.values():
+                for k, v in name_edges:
+                    self._link_dep(k, v)
+
+            self.__dep_graph_is_valid = True
+
+        return self.__dep_graph
+
+    ###########################################################################
+    # AST protected interface
+    ###########################################################################
+
+    # Everything that depends on what our ASTs are made of goes through these
+    # (and '_tidy_ast', 'is_empty' and '_decompose'), so that
+    # subclasses can use other ASTs (see 'codetools.blocks2').
+
+    @classmethod
+    def _parse(cls, code):
+        "Parse source text into an AST"
+        # (BlockTransformer handles things like 'import *')
+        return parse(code, mode='exec', transformer=BlockTransformer())
+
+    @classmethod
+    def _join(cls, asts):
+        "Join a sequence of statement ASTs into a single AST"
+        return Stmt(list(asts))
+
+    @classmethod
+    def _to_block(cls, x):
+        "Coerce 'x' to a block of our class without copying blocks"
+        # (Blocks on other ASTs are parsed again from their text)
+        if isinstance(x, Block) and x._ast_class is not cls._ast_class:
+            x = x.codestring
+        if isinstance(x, cls):
+            return x
+        else:
+            return cls(x)
+
+    @staticmethod
+    def _find_names(ast):
+        "Return a NameFinder that walked 'ast'"
+        return compiler.walk(ast, NameFinder())
+
+    @staticmethod
+    def _find_mutated_names(ast):
+        "Return the names of the objects that 'ast' changes in place"
+        return _mutated_names(ast)
+
+    @staticmethod
+    def _unparse(ast):
+        "Return source text for 'ast'"
+        return unparse(ast)
+
+    @staticmethod
+    def _shift_linenos(ast, delta):
+        "Add delta to the line numbers in 'ast'"
+        _shift_linenos(ast, delta)
+
+    def _compile(self):
+        "Compile our AST into the code object that 'execute' runs"
         # Policy: our AST is either a Module or something that fits in a
         # Stmt. (Note that a Stmt fits into a Stmt.)
         ast = self.ast
@@ -740,19 +1525,11 @@ class Block(HasTraits):
         else:
             filename = '(Block with filename suppressed)'
 
-        return compile_ast(ast, filename, 'exec')
-
-    def _get__dep_graph(self):
-
-        # Cache dep graphs
-        if not self.__dep_graph_is_valid:
-
-            inputs, outputs, conditional_outputs, self.__dep_graph = \
-                Block._compute_dependencies(self.sub_blocks)
+        return cached_compile_ast(ast, filename, 'exec')
 
-            self.__dep_graph_is_valid = True
-
-        return self.__dep_graph
+    def _compile_function(self, argnames, returns):
+        "Compile a function code for '_get_function_code', or return None"
+        return _function_code(self.ast, argnames, returns, self.filename)
 
     ###########################################################################
     # Block class interface
@@ -782,21 +1559,21 @@ class Block(HasTraits):
 
             Returns 'None' on failure.
         '''
-        assert isinstance(ast, Node)
+        assert isinstance(ast, cls._ast_class)
 
         # TODO Look within 'for', 'if', 'try', etc. (#1165)
         if isinstance(ast, Module):
             result = cls._decompose(ast.node)
         elif isinstance(ast, Stmt):
             if len(ast.nodes) == 0:
-                result = [Block(ast)]
+                result = [cls(ast)]
             elif len(ast.nodes) == 1:
                 # Treat 'Stmt([node])' the same as 'node'
                 result = cls._decompose(ast.nodes[0])
             else:
-                result = map(Block, ast.nodes)
+                result = map(cls, ast.nodes)
         else:
-            result = [Block(ast)]
+            result = [cls(ast)]
 
         return result
 
@@ -841,87 +1618,122 @@ class Block(HasTraits):
             (Alternative: make each Block track its own dependencies)
         '''
 
-        # An ad-hoc graph interface
-        class Graph(dict):
-            def link(self, k, v):
-                return self.setdefault(k, set()).add(v)
-            def unlink_from(self, k):
-                if k in self:
-                    del self[k]
+        inputs, outputs, conditional_outputs, edges = \
+            Block._compute_name_dependencies(blocks)
+
+        dep_graph = {}
+        for name_edges in edges.values():
+            for k, v in name_edges:
+                dep_graph.setdefault(k, set()).add(v)
+
+        return inputs, outputs, conditional_outputs, dep_graph
+
+    @staticmethod
+    def _compute_name_dependencies(blocks, names=None):
+        ''' Compute the dependency graph edges induced by each name.
+
+            This is the work horse of '_compute_dependencies'. Every edge of
+            the dependency graph is induced by exactly one name: an input of a
+            block, a conditional output of a block, or the final provider of a
+            name. Grouping the edges by name lets us recompute the edges for
+            just a few names when the sequence of blocks changes slightly.
+
+            Parameters
+            ----------
+            blocks : List(Block)
+              A list of blocks in order of execution.
+
+            names : Set(Str), optional
+              Only compute the edges induced by these names. By default, the
+              edges induced by all names are computed.
+
+            Returns
+            -------
+            inputs, outputs, conditional_outputs : Set(Str)
+              As for '_compute_dependencies', but limited to 'names'.
+
+            edges : Dict(Str, List(Tuple(Either(Block, Str), Either(Block, Str))))
+              The edges of the dependency graph, keyed by the name that
+              induces them.
+        '''
+
+        # The names whose providers we need to track: dotted inputs depend on
+        # the providers of their prefixes
+        if names is None:
+            tracked = None
+        else:
+            tracked = set(names)
+            for name in names:
+                tracked.update(_name_prefixes(name))
+
+        def relevant(s, names):
+            if names is None:
+                return s
+            return s & names
 
         # Deferred computations
         deferred = set()
 
-        # Build dep_graph: a not transitively closed dependency graph that
+        # Build the edges of a not transitively closed dependency graph that
         # relates blocks to the blocks and inputs they depend on, and outputs
         # to the last block that modifies or creates them
         inputs, outputs, conditional_outputs = set(), set(), set()
-        dep_graph, env = Graph(), {}
+        edges, env = {}, {}
+        link = lambda name, k, v: edges.setdefault(name, []).append((k, v))
         for b in blocks:
 
             # 'b' depends on the provider for each of its inputs or, if none
             # exists, it depends on the inputs themselves (as inputs to the
             # aggregate block). If a name is provided only conditionally, then
             # 'b' depends on both the provider and the input.
-            for i in b.inputs:
+            for i in relevant(b.inputs, names):
                 # We need to make sure that dotted names are not included if
                 # their parent module or object is already in env.
-                process_i, prefix, suffix = True, '', i
-                while '.' in suffix:
-                    if prefix == '':
-                        prefix = suffix[:suffix.find('.')]
-                    else:
-                        prefix += suffix[:suffix.find('.')]
+                process_i = True
+                for prefix in _name_prefixes(i):
                     if prefix in env:
-                        dep_graph.link(b, env[prefix])
+                        link(i, b, env[prefix])
                         process_i = False
                         break
-                    suffix = suffix[suffix.find('.')+1:]
 
                 if process_i:
                     if i in env:
-                        dep_graph.link(b, env[i])
+                        link(i, b, env[i])
                     if i not in env or i in conditional_outputs:
                         inputs.add(i)
-                        dep_graph.link(b, i)
+                        link(i, b, i)
 
-            for c in b.conditional_outputs:
-
-                # 'b's outputs depend only on 'b'
-                dep_graph.unlink_from(c)
-                dep_graph.link(c, b)
+            for c in relevant(b.conditional_outputs, tracked):
 
                 # 'b' depends on the provider for each of its conditional
                 # outputs or, if none exists and the end result has an input of
                 # the same name, 'b' depends on that input. (We defer the
                 # latter test to check against the final set of inputs rather
                 # than just the inputs we've found so far.)
-                if c in env:
-                    dep_graph.link(b, env[c])
-                else:
-                    def f(b=b, c=c):
-                        if c in inputs:
-                            dep_graph.link(b, c)
-                    deferred.add(f)
+                if names is None or c in names:
+                    if c in env:
+                        link(c, b, env[c])
+                    else:
+                        def f(b=b, c=c):
+                            if c in inputs:
+                                link(c, b, c)
+                        deferred.add(f)
 
-                # 'b' contributes conditional outputs to the aggregate block
-                # unless they are already unconditional
-                if c not in outputs:
-                    conditional_outputs.add(c)
+                    # 'b' contributes conditional outputs to the aggregate
+                    # block unless they are already unconditional
+                    if c not in outputs:
+                        conditional_outputs.add(c)
 
                 # 'b' becomes the provider for its conditional outputs
                 env[c] = b
 
-            for o in b.outputs:
-
-                # 'b's outputs depend only on 'b'
-                dep_graph.unlink_from(o)
-                dep_graph.link(o, b)
+            for o in relevant(b.outputs, tracked):
 
                 # 'b' contributes its outputs to the aggregate block -- as
                 # unconditional outputs
-                outputs.add(o)
-                conditional_outputs.discard(o)
+                if names is None or o in names:
+                    outputs.add(o)
+                    conditional_outputs.discard(o)
 
                 # 'b' becomes the provider for its outputs
                 env[o] = b
@@ -930,7 +1742,11 @@ class Block(HasTraits):
         for f in deferred:
             f()
 
-        return inputs, outputs, conditional_outputs, dep_graph
+        # Outputs depend only on the last block that provides them
+        for o in relevant(set(env), names):
+            link(o, o, env[o])
+
+        return inputs, outputs, conditional_outputs, edges
 
 class Expression(HasTraits):
 
@@ -984,9 +1800,269 @@ class Expression(HasTraits):
 # Util
 ################################################################################
 
+class _WaveNamespace(OrderedDict):
+    """ The local namespace of a sub-block executing in a wave: reads fall
+        through to the shared context, and writes stay here (in order) until
+        we copy them back.
+    """
+    def __init__(self, context):
+        OrderedDict.__init__(self)
+        self._context = context
+
+    def __missing__(self, key):
+        return self._context[key]
+
 def to_block(x):
     "Coerce 'x' to a Block without creating a copy if it's one already"
     if isinstance(x, Block):
         return x
     else:
         return Block(x)
+
+def _statement_chunks(code):
+    ''' Split source text into its top-level statements, as a list of
+        '(text, line number)' pairs, or return None if it doesn't tokenize.
+
+        A statement's text runs up to the next statement, so it includes
+        trailing blank lines and comments.
+
+        >>> code = 'a = 1; b = 2\\n\\nif a:\\n    c = 3\\n@f\\ndef g(): pass\\n'
+        >>> for text, row in _statement_chunks(code):
+        ...     print row, repr(text)
+        1 'a = 1; b = 2\\n\\n'
+        3 'if a:\\n    c = 3\\n'
+        5 '@f\\ndef g(): pass\\n'
+    '''
+    lines = StringIO(code).readlines()
+    rows = []
+    depth = 0
+    at_line_start = True
+    decorating = False
+    try:
+        for type, string, (row, _), _, _ in \
+                generate_tokens(StringIO(code).readline):
+            if type == INDENT:
+                depth += 1
+            elif type == DEDENT:
+                depth -= 1
+            elif type == NEWLINE:
+                at_line_start = True
+            elif type not in (NL, COMMENT, ENDMARKER) and at_line_start:
+                at_line_start = False
+                # (Decorators belong to the statement they decorate)
+                if depth == 0 and not decorating:
+                    rows.append(row)
+                if depth == 0:
+                    decorating = string == '@'
+    except (TokenError, IndentationError):
+        return None
+    return [(''.join(lines[row - 1:end - 1]), row)
+            for row, end in zip(rows, rows[1:] + [len(lines) + 1])]
+
+def _shift_linenos(ast, delta):
+    'Add delta to the line numbers in an AST'
+    todo = [ast]
+    while todo:
+        node = todo.pop()
+        if getattr(node, 'lineno', None) is not None:
+            node.lineno += delta
+        todo.extend(node.getChildNodes())
+
+# The attributes that '_set_inputs_and_outputs' sets
+_ANALYSIS_NAMES = ('_inputs', '_outputs', '_conditional_outputs',
+                   '_const_assign', '_fromimports', '_imports_ast', '_names')
+
+def _root_names(names):
+    "The sorted names, without any dotted suffixes"
+    return sorted(set(name.split('.', 1)[0] for name in names))
+
+def _mutated_names(ast):
+    """ The names of the objects that 'ast' changes in place, by assigning to
+        or deleting their items or slices, by augmented assignment to their
+        items or attributes, or by calling their methods.
+
+        Function and lambda bodies aren't included, since defining them
+        doesn't run them.
+
+        >>> sorted(_mutated_names(compiler.parse('d[k] = 1; a.b.c(); x = y')))
+        ['a', 'd']
+    """
+    names = set()
+    todo = [ast]
+    while todo:
+        node = todo.pop()
+        if isinstance(node, (Function, Lambda)):
+            # (Only the defaults and decorators are evaluated)
+            todo.extend(node.defaults)
+            if getattr(node, 'decorators', None) is not None:
+                todo.append(node.decorators)
+            continue
+        target = None
+        if isinstance(node, (Subscript, Slice)) and node.flags != 'OP_APPLY':
+            target = node.expr
+        elif isinstance(node, AugAssign) and \
+                 isinstance(node.node, (Subscript, Slice, Getattr)):
+            target = node.node.expr
+        elif isinstance(node, CallFunc) and isinstance(node.node, Getattr):
+            target = node.node.expr
+        while isinstance(target, (Getattr, Subscript, Slice)):
+            target = target.expr
+        if isinstance(target, Name):
+            names.add(target.name)
+        todo.extend(node.getChildNodes())
+    return names
+
+# Statements that mean something else at the top level of a function
+_MODULE_ONLY = (Exec, Global, Return, Yield)
+
+# Nodes that start a new scope
+_SCOPES = (Class, Function, GenExpr, Lambda)
+
+def _nested_global_names(code):
+    """ The names that the code objects nested in 'code' (functions, classes,
+        lambdas and generator expressions) might look up as globals.
+
+        >>> sorted(_nested_global_names(compile('def f(x): return g(x, y.z)',
+        ...                                     '', 'exec')))
+        ['g', 'y', 'z']
+    """
+    names = set()
+    todo = [code]
+    while todo:
+        for const in todo.pop().co_consts:
+            if isinstance(const, types.CodeType):
+                names.update(const.co_names)
+                todo.append(const)
+    return names
+
+# Builtins that read a namespace as a whole (or run code that may)
+_NAMESPACE_READERS = frozenset(['dir', 'eval', 'execfile', 'globals',
+                                'locals', 'vars'])
+
+def _reads_namespace(code):
+    """ Whether 'code', or a code object nested in it, might read its
+        namespace as a whole rather than name by name: with 'exec' or one of
+        '_NAMESPACE_READERS'.
+
+        >>> _reads_namespace(compile('def f(): return eval("a")', '', 'exec'))
+        True
+        >>> _reads_namespace(compile('exec "b = a"', '', 'exec'))
+        True
+        >>> _reads_namespace(compile('b = a + 1', '', 'exec'))
+        False
+    """
+    todo = [code]
+    while todo:
+        code = todo.pop()
+        if _NAMESPACE_READERS.intersection(code.co_names):
+            return True
+        bytecode = code.co_code
+        i = 0
+        while i < len(bytecode):
+            op = ord(bytecode[i])
+            if op == _EXEC_STMT:
+                return True
+            i += 3 if op >= dis.HAVE_ARGUMENT else 1
+        todo.extend(const for const in code.co_consts
+                    if isinstance(const, types.CodeType))
+    return False
+
+_EXEC_STMT = dis.opmap['EXEC_STMT']
+
+def _function(code, globals):
+    "A function for 'code', giving 'globals' builtins as 'exec' would"
+    if '__builtins__' not in globals:
+        globals['__builtins__'] = __builtin__
+    return types.FunctionType(code, globals)
+
+def _write_bound(context, bound, names, passed):
+    """ Write the values in 'bound' (the locals of a block function) of
+        'names' into 'context', except those still bound to the argument in
+        'passed' they came in as.
+    """
+    for name in names:
+        if name in bound and not (name in passed and
+                                  bound[name] is passed[name]):
+            context[name] = bound[name]
+
+def _function_code(ast, argnames, returns, filename):
+    """ The code for a function with the given arguments that executes 'ast'
+        (see 'Block._get_function_code'), or None if 'ast' doesn't mean the
+        same in a function.
+
+        >>> code = _function_code(parse('b = a + 1; c = b * 2'), ('a',),
+        ...                       ('b', 'c'), None)
+        >>> types.FunctionType(code, {})(1)
+        (2, 4)
+        >>> 'b' in code.co_varnames
+        True
+        >>> _function_code(parse('global a'), (), None, None) is None
+        True
+    """
+    todo = [ast]
+    while todo:
+        node = todo.pop()
+        if isinstance(node, _MODULE_ONLY) or \
+               (isinstance(node, From) and node.names[0][0] == '*'):
+            return None
+        if not isinstance(node, _SCOPES):
+            todo.extend(node.getChildNodes())
+
+    if isinstance(ast, Module):
+        ast = ast.node
+    if returns is None:
+        value = compiler.ast.CallFunc(Name('locals'), [])
+    elif len(returns) == 1:
+        value = Name(returns[0])
+    else:
+        value = Tuple([Name(name) for name in returns])
+    name = '<block function>'
+    function = Function(None, name, list(argnames), (), 0, None,
+                        Stmt([ast, Return(value)]))
+    module = cached_compile_ast(Module(None, Stmt([function])),
+                                filename or '(Block function)')
+    for const in module.co_consts:
+        if isinstance(const, types.CodeType) and const.co_name == name:
+            return const
+
+def _name_prefixes(name):
+    ''' The prefixes of a dotted name, in the form the dependency analysis
+        looks them up in.
+
+        >>> _name_prefixes('a')
+        []
+        >>> _name_prefixes('a.b.c')
+        ['a', 'ab']
+    '''
+    prefixes, prefix, suffix = [], '', name
+    while '.' in suffix:
+        prefix += suffix[:suffix.find('.')]
+        prefixes.append(prefix)
+        suffix = suffix[suffix.find('.')+1:]
+    return prefixes
+
+def _node_names(nodes):
+    """ The names of the dep graph nodes in 'nodes', where names are
+        represented as '(name, tag)', including the names read and written by
+        its blocks.
+    """
+    names = set()
+    for node in nodes:
+        if isinstance(node, tuple):
+            names.add(node[0])
+        else:
+            names |= node.inputs | node.all_outputs
+    return names
+
+def _search(starts, neighbors, within=None):
+    """ The set of nodes reachable from 'starts' by following 'neighbors',
+        optionally only passing through the nodes in 'within'.
+    """
+    found = set(starts)
+    todo = list(found)
+    while todo:
+        for node in neighbors(todo.pop()):
+            if node not in found and (within is None or node in within):
+                found.add(node)
+                todo.append(node)
+    return found
@@ -0,0 +1,86 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'Execution of blocks of elementwise array code in chunks.'
+
+from __future__ import absolute_import
+
+import numpy
+
+
+def execute_chunked(block, context, outputs, chunk_size=65536, axis=0,
+                    sliced=None, out=None, global_context=None):
+    """ Execute 'block' (already restricted to 'outputs') over slices of the
+    arrays in 'context', and write the whole 'outputs' into 'context'.
+
+    The inputs named in 'sliced' (by default, the inputs that are arrays with
+    a dimension 'axis') are cut into slices of 'chunk_size' along 'axis',
+    and the block runs once per slice, in a namespace of the slices and the
+    other inputs. Each output of a run must be an array with a slice along
+    'axis', which is copied into the output array. So the block must work
+    element by element along 'axis': reductions like 'x.mean()' only see
+    one slice.
+
+    The output arrays are the ones in 'out', a mapping of names to arrays
+    (for example memory-mapped ones from 'numpy.lib.format.open_memmap'),
+    or else new ones, shaped by the first run. The intermediate values of
+    the block are dropped after each run, so that the memory that it uses
+    depends on 'chunk_size' and not on the length of the inputs. (Sliced
+    inputs can be memory-mapped too: slicing them only reads that slice.)
+
+        >>> from codetools.blocks.api import Block
+        >>> block = Block('t = x * 2\\ny = t + c')
+        >>> context = {'x': numpy.arange(5), 'c': 10}
+        >>> execute_chunked(block, context, ['y'], chunk_size=2)
+        >>> context['y']
+        array([10, 12, 14, 16, 18])
+        >>> 't' in context
+        False
+    """
+    if global_context is None:
+        global_context = {}
+    out = dict(out or {})
+    names = sorted(set(name.split('.', 1)[0] for name in block.inputs))
+    values = dict((name, context[name]) for name in names if name in context)
+    if sliced is None:
+        sliced = [name for name, value in values.items()
+                  if isinstance(value, numpy.ndarray) and value.ndim > axis]
+    else:
+        sliced = list(sliced)
+        missing = [name for name in sliced if name not in values]
+        if missing:
+            raise KeyError(missing[0])
+    lengths = set(numpy.shape(values[name])[axis] for name in sliced)
+    if len(lengths) != 1:
+        raise ValueError('The sliced inputs %s must have one length along '
+                         'axis %d, not %s' % (', '.join(sorted(sliced)),
+                                              axis, sorted(lengths) or 'none'))
+    [length] = lengths
+
+    # (One run even for empty inputs, to shape the outputs)
+    for start in xrange(0, max(length, 1), chunk_size):
+        stop = min(start + chunk_size, length)
+        index = (slice(None),) * axis + (slice(start, stop),)
+        namespace = dict(values)
+        for name in sliced:
+            namespace[name] = values[name][index]
+        block.execute(namespace, global_context)
+
+        for name in outputs:
+            value = namespace[name]
+            if not (isinstance(value, numpy.ndarray) and value.ndim > axis
+                    and value.shape[axis] == stop - start):
+                raise ValueError('Output %r is not an array with %d items '
+                                 'along axis %d' % (name, stop - start, axis))
+            if name not in out:
+                shape = list(value.shape)
+                shape[axis] = length
+                out[name] = numpy.empty(shape, dtype=value.dtype)
+            out[name][index] = value
+
+    for name in outputs:
+        context[name] = out[name]
@@ -1 +1,2 @@
-from compiler_ import compile_ast, eval_ast, exec_ast, parse
+from compiler_ import cached_compile_ast, code_cache, compile_ast, eval_ast, \
+    exec_ast, parse
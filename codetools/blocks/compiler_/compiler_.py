@@ -6,6 +6,9 @@ from compiler.ast import Expression, Module
 from compiler.transformer import Transformer
 from copy import copy
 import sys
+from types import CodeType
+
+from codetools.util.cache import LRUCache
 
 # (Copied from python2.4/compiler/transformer.py)
 def parse(buf, mode="exec", transformer=None):
@@ -48,6 +51,55 @@ def compile_ast(ast, filename='<ast>', mode='exec'):
     compiler.syntax.check(ast)
     return modes[mode](ast).getCode()
 
+# Code objects compiled by 'cached_compile_ast', shared by the whole process.
+# Compiling with 'compiler' is slow, and Blocks compile the same statements
+# over and over (decomposed sub-blocks, restrictions, reloaded scripts), so
+# we keep the most recently used code objects around.
+code_cache = LRUCache(max_entries=1024)
+
+def cached_compile_ast(ast, filename='<ast>', mode='exec'):
+    """ Like 'compile_ast', but reuse the code object compiled for any
+        structurally identical AST with the same line numbers.
+
+        The filename doesn't take part in the lookup: a cached code object
+        compiled under another filename is copied with 'filename' instead.
+
+        >>> c1 = cached_compile_ast(parse('a = b + 1'), 'one.py')
+        >>> c2 = cached_compile_ast(parse('a = b + 1'), 'two.py')
+        >>> c1.co_code == c2.co_code, c2.co_filename
+        (True, 'two.py')
+        >>> c1 is cached_compile_ast(parse('a = b + 1'), 'one.py')
+        True
+    """
+    # The structural hash of an AST is the hash of its repr (see
+    # 'ast.deep_equality'), and reprs don't include line numbers.
+    key = (mode, repr(ast), _linenos(ast))
+    code = code_cache.get(key)
+    if code is None:
+        code = code_cache[key] = compile_ast(ast, filename, mode)
+    elif code.co_filename != filename:
+        code = _with_filename(code, filename)
+    return code
+
+def _linenos(ast):
+    'The line numbers of the nodes in an AST, in a fixed order'
+    linenos, todo = [], [ast]
+    while todo:
+        node = todo.pop()
+        linenos.append(getattr(node, 'lineno', None))
+        todo.extend(node.getChildNodes())
+    return tuple(linenos)
+
+def _with_filename(code, filename):
+    'A copy of a code object (and the code objects it contains) for filename'
+    consts = tuple(_with_filename(c, filename) if isinstance(c, CodeType)
+                   else c for c in code.co_consts)
+    return CodeType(code.co_argcount, code.co_nlocals, code.co_stacksize,
+                    code.co_flags, code.co_code, consts, code.co_names,
+                    code.co_varnames, filename, code.co_name,
+                    code.co_firstlineno, code.co_lnotab, code.co_freevars,
+                    code.co_cellvars)
+
 def eval_ast(ast, filename='<ast>', *contexts):
     "Extends 'eval' to understand ASTs from compiler.ast."
     assert isinstance(ast, Expression)
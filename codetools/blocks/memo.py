@@ -0,0 +1,347 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'Memoization of sub-block results across executions.'
+
+from __future__ import absolute_import
+
+import ast as _ast
+from compiler.ast import (AssAttr, AugAssign, CallFunc, Getattr, Keyword,
+                          Name, Slice, Subscript)
+from hashlib import sha1
+import sys
+import types
+import weakref
+
+from ..util.cache import LRUCache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Values we can fingerprint by value
+_IMMUTABLE = (types.NoneType, bool, int, long, float, complex, str, unicode)
+
+# Values that don't change, so we can fingerprint them by identity
+_STATIC = (types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+           type, types.ClassType)
+
+# Methods that don't change the objects they're called on (unless they're
+# given an 'out' argument), for the arrays, dicts, lists and strings code
+# usually calls them on
+_READ_ONLY_METHODS = frozenset([
+    'all', 'any', 'argmax', 'argmin', 'argsort', 'astype', 'conj',
+    'conjugate', 'copy', 'count', 'cumprod', 'cumsum', 'diagonal', 'dot',
+    'endswith', 'flatten', 'format', 'get', 'has_key', 'index', 'item',
+    'items', 'iteritems', 'iterkeys', 'itervalues', 'join', 'keys', 'lower',
+    'max', 'mean', 'min', 'nonzero', 'prod', 'ptp', 'ravel', 'repeat',
+    'replace', 'reshape', 'round', 'searchsorted', 'split', 'squeeze',
+    'startswith', 'std', 'strip', 'sum', 'swapaxes', 'take', 'tolist',
+    'tostring', 'trace', 'transpose', 'upper', 'values', 'var', 'view'])
+
+
+class SubBlockMemo(object):
+    ''' Remembers the outputs of sub-blocks, and skips executing a sub-block
+        when its inputs are the same as the last time it ran.
+
+        Pass an instance to 'Block.execute' as 'memo'. Only use it for pure
+        code: a sub-block that reads anything but its inputs (a random
+        number generator, a file, a global) replays stale outputs.
+
+        Inputs are fingerprinted:
+          - numbers, strings and tuples of them by value
+          - modules, functions and classes by identity
+          - NumPy arrays by identity, data pointer, shape and dtype, plus a
+            version that we bump when a sub-block we execute assigns to
+            their items, or when a listenable context reports a change to
+            them in 'items_modified' (as setting them again does)
+        A sub-block with an input we can't fingerprint (a list, say), or
+        that changes objects in place (by assigning to their attributes or
+        items, by augmented assignment, or by calling their methods, except
+        the ones in '_READ_ONLY_METHODS'), always runs. When it runs, the
+        outputs we remember that are the objects it changes are forgotten,
+        so that we don't replay them changed.
+
+        Arrays have no version number of their own, so other changes in
+        place (made outside the block, or through a view) aren't noticed.
+        With 'hash_arrays', writable arrays are fingerprinted by a hash of
+        their contents too, which notices them at the cost of reading every
+        array input on every execution.
+
+        The memo keeps one entry per sub-block, and evicts the least recently
+        used entries when it has more than 'max_entries' of them or when
+        their outputs take more than 'max_bytes' (as estimated by 'nbytes'
+        for arrays and 'sys.getsizeof' for anything else).
+    '''
+
+    def __init__(self, max_entries=1024, max_bytes=256 * 2**20,
+                 hash_arrays=False):
+        self._entries = LRUCache(max_entries=max_entries, max_size=max_bytes,
+                                 sizeof=_entry_size)
+        self.hash_arrays = hash_arrays
+        self.hits = self.misses = 0
+        # The versions of the arrays changed so far, by id, with weak
+        # references that forget them when the arrays go away
+        self._versions = {}
+        # The listenable contexts we follow the changes of
+        self._contexts = weakref.WeakKeyDictionary()
+        # The uuid of the sub-block whose entry has each output, by id (some
+        # may be out of date, see '_forget_outputs')
+        self._producers = {}
+
+    def execute(self, block, local_context, global_context):
+        "Execute 'block' (a sub-block) unless we remember its outputs"
+        if hasattr(local_context, 'on_trait_change') and \
+               local_context not in self._contexts:
+            local_context.on_trait_change(self._context_modified,
+                                          'items_modified', priority=True)
+            self._contexts[local_context] = True
+
+        names = _memoizable_names(block)
+        if names is None:
+            self.misses += 1
+            try:
+                block.execute(local_context, global_context)
+            finally:
+                for name in _changed_names(block.ast):
+                    if name in local_context:
+                        self._changed(local_context[name])
+            return
+
+        inputs, outputs = names
+        fingerprint = self._fingerprint(local_context, inputs)
+        entry = self._entries.get(block.uuid)
+        if fingerprint is not None and entry is not None and \
+               entry[0] == fingerprint:
+            self.hits += 1
+            for name, value in entry[1].iteritems():
+                if name not in local_context or \
+                       local_context[name] is not value:
+                    local_context[name] = value
+            return
+
+        self.misses += 1
+        block.execute(local_context, global_context)
+        if fingerprint is None:
+            if block.uuid in self._entries:
+                del self._entries[block.uuid]
+        else:
+            values = dict((name, local_context[name]) for name in outputs
+                          if name in local_context)
+            self._entries[block.uuid] = (fingerprint, values)
+            if len(self._producers) > 2 * self._entries.max_entries:
+                self._prune_producers()
+            for value in values.itervalues():
+                self._producers[id(value)] = block.uuid
+
+    def clear(self):
+        "Forget all outputs"
+        self._entries.clear()
+        self._producers.clear()
+
+    def changed(self, value):
+        ''' Note that 'value' (an array) was changed in place, so that the
+            sub-blocks that read it execute again.
+        '''
+        self._changed(value)
+
+    def info(self):
+        "Return the hits, misses and evictions, and the number of entries"
+        info = self._entries.info()
+        return info._replace(hits=self.hits, misses=self.misses)
+
+    def _get_max_bytes(self):
+        return self._entries.max_size
+
+    def _set_max_bytes(self, max_bytes):
+        self._entries.max_size = max_bytes
+
+    max_bytes = property(_get_max_bytes, _set_max_bytes)
+
+    def _get_max_entries(self):
+        return self._entries.max_entries
+
+    def _set_max_entries(self, max_entries):
+        self._entries.max_entries = max_entries
+
+    max_entries = property(_get_max_entries, _set_max_entries)
+
+    def _changed(self, value):
+        ''' Forget the entry that has 'value' as an output, and bump the
+            version of an array (and of the arrays it's a view of).
+        '''
+        if isinstance(value, _IMMUTABLE):
+            return
+        self._forget_outputs(value)
+        while numpy is not None and isinstance(value, numpy.ndarray):
+            if value.base is not None:
+                self._forget_outputs(value.base)
+            key = id(value)
+            if key in self._versions:
+                ref, version = self._versions[key]
+            else:
+                ref = weakref.ref(value, lambda ref, key=key,
+                                  versions=self._versions:
+                                  versions.pop(key, None))
+                version = 0
+            self._versions[key] = (ref, version + 1)
+            value = value.base
+
+    def _forget_outputs(self, value):
+        "Forget the entry that has 'value' as an output, if any"
+        uuid = self._producers.pop(id(value), None)
+        if uuid is not None:
+            entry = self._entries.get(uuid)
+            # (The id may be of an output that has gone since)
+            if entry is not None and any(output is value for output in
+                                         entry[1].itervalues()):
+                del self._entries[uuid]
+
+    def _prune_producers(self):
+        "Drop the outputs of the entries that are gone from '_producers'"
+        self._producers = {}
+        for uuid, entry in self._entries.items():
+            for value in entry[1].itervalues():
+                self._producers[id(value)] = uuid
+
+    def _context_modified(self, context, name, event):
+        for key in event.added + event.modified:
+            if key in context:
+                self._changed(context[key])
+
+    def _fingerprint(self, context, names):
+        'A fingerprint of the values of names in a context, or None'
+        fingerprint = []
+        for name in names:
+            if name not in context:
+                fingerprint.append((name,))
+                continue
+            value = _value_fingerprint(context[name], self._versions,
+                                       self.hash_arrays)
+            if value is None:
+                return None
+            fingerprint.append((name, value))
+        return tuple(fingerprint)
+
+def _memoizable_names(block):
+    """ The input and output names of a sub-block, or None if we can't tell
+        what it changes.
+    """
+    outputs = block.all_outputs | block.fromimports
+    if any('.' in name for name in outputs) or block.inputs & outputs:
+        return None
+    # (Sub-blocks changing objects in place look like they only read them)
+    if _changed_names(block.ast):
+        return None
+    inputs = sorted(set(name.split('.', 1)[0] for name in block.inputs))
+    return inputs, sorted(outputs)
+
+def _changed_names(ast):
+    """ The names of the objects that an AST changes in place: whose
+        attributes, items or slices it assigns to (or deletes), that it
+        assigns to with augmented assignment, or whose methods it calls
+        (except the ones in '_READ_ONLY_METHODS').
+    """
+    if isinstance(ast, _ast.AST):
+        return _ast_changed_names(ast)
+    names = set()
+    todo = [ast]
+    while todo:
+        node = todo.pop()
+        if isinstance(node, AssAttr) or \
+               (isinstance(node, (Subscript, Slice)) and
+                node.flags in ('OP_ASSIGN', 'OP_DELETE')):
+            names.add(_root_name(node.expr))
+        elif isinstance(node, AugAssign):
+            names.add(_root_name(node.node))
+        elif isinstance(node, CallFunc) and isinstance(node.node, Getattr) \
+                 and (node.node.attrname not in _READ_ONLY_METHODS or
+                      any(isinstance(arg, Keyword) and arg.name == 'out'
+                          for arg in node.args)):
+            names.add(_root_name(node.node.expr))
+        todo.extend(node.getChildNodes())
+    names.discard(None)
+    return names
+
+def _root_name(node):
+    "The name an attribute, item or slice expression starts from, or None"
+    while isinstance(node, (Getattr, Subscript, Slice)):
+        node = node.expr
+    if isinstance(node, Name):
+        return node.name
+    return None
+
+def _ast_changed_names(tree):
+    "'_changed_names' for ASTs from the ast module (see 'codetools.blocks2')"
+    names = set()
+    for node in _ast.walk(tree):
+        if isinstance(node, (_ast.Attribute, _ast.Subscript)) and \
+               isinstance(node.ctx, (_ast.Store, _ast.Del)):
+            names.add(_ast_root_name(node.value))
+        elif isinstance(node, _ast.AugAssign):
+            names.add(_ast_root_name(node.target))
+        elif isinstance(node, _ast.Call) and \
+                 isinstance(node.func, _ast.Attribute) and \
+                 (node.func.attr not in _READ_ONLY_METHODS or
+                  any(keyword.arg == 'out' for keyword in node.keywords)):
+            names.add(_ast_root_name(node.func.value))
+    names.discard(None)
+    return names
+
+def _ast_root_name(node):
+    "'_root_name' for ASTs from the ast module"
+    while isinstance(node, (_ast.Attribute, _ast.Subscript)):
+        node = node.value
+    if isinstance(node, _ast.Name):
+        return node.id
+    return None
+
+def _value_fingerprint(value, versions, hash_arrays):
+    if isinstance(value, _IMMUTABLE):
+        return (type(value), value)
+    elif isinstance(value, tuple):
+        items = [_value_fingerprint(item, versions, hash_arrays)
+                 for item in value]
+        if None in items:
+            return None
+        return (tuple, tuple(items))
+    elif isinstance(value, _STATIC):
+        # (Keep a reference so that the id isn't reused)
+        return (id(value), value)
+    elif numpy is not None and isinstance(value, numpy.generic):
+        return (type(value), value.item())
+    elif numpy is not None and type(value) is numpy.ndarray and \
+             not value.dtype.hasobject:
+        if hash_arrays and value.flags.writeable:
+            digest = sha1(numpy.ascontiguousarray(value).view(numpy.uint8)) \
+                     .digest()
+        else:
+            digest = None
+        version = versions.get(id(value), (None, 0))[1]
+        return (id(value), _ArrayRef(value),
+                value.__array_interface__['data'][0], value.shape,
+                value.dtype.str, version, digest)
+    return None
+
+class _ArrayRef(object):
+    ''' Keeps an array alive (so that its id isn't reused) while comparing
+        equal to any other '_ArrayRef', since arrays don't compare to bools.
+    '''
+    __slots__ = ['array']
+    def __init__(self, array):
+        self.array = array
+    def __eq__(self, other):
+        return isinstance(other, _ArrayRef)
+    def __ne__(self, other):
+        return not isinstance(other, _ArrayRef)
+
+def _entry_size(entry):
+    size = 0
+    for value in entry[1].itervalues():
+        size += getattr(value, 'nbytes', None) or sys.getsizeof(value)
+    return size
@@ -0,0 +1,163 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'A cache of parsed and analysed source text for Block construction.'
+
+from __future__ import absolute_import
+
+from cPickle import HIGHEST_PROTOCOL, dumps, loads
+from hashlib import sha1
+import os
+import sys
+from tempfile import mkstemp
+
+from ..util.cache import LRUCache
+
+# Bump this when the format of the entries changes, so that old files in a
+# cache directory are ignored
+_FORMAT_VERSION = 2
+
+
+class ParseCache(object):
+    ''' Remembers the ASTs and name analyses of the Blocks created from
+        source text, keyed by a hash of the text.
+
+        Entries are kept pickled, so every lookup returns fresh ASTs that the
+        caller is free to change. The most recently used entries are kept in
+        memory (at most 'max_entries' of them and 'max_bytes' of pickles).
+        If 'directory' is set, entries are also written there, one file per
+        source text, and read back on a miss, so that a new process doesn't
+        have to parse the same scripts again.
+
+        Making an entry costs more than parsing once, so without a
+        'directory', 'wants' only asks for entries for text it has seen
+        before.
+
+        >>> cache = ParseCache()
+        >>> cache.get('a = 1') is None
+        True
+        >>> cache.wants('a = 1'), cache.wants('a = 1')
+        (False, True)
+        >>> cache.set('a = 1', ['entry'])
+        >>> cache.get('a = 1')
+        ['entry']
+    '''
+
+    def __init__(self, max_entries=256, max_bytes=64 * 2**20, directory=None):
+        self._entries = LRUCache(max_entries=max_entries, max_size=max_bytes,
+                                 sizeof=len)
+        self.directory = directory
+        # The number of misses in memory that 'directory' made up for
+        self.disk_hits = 0
+        # The keys of the text 'wants' was asked about
+        self._seen = LRUCache(max_entries=4 * max_entries)
+
+    def get(self, source):
+        "Return a fresh copy of the entry for 'source', or None"
+        key = _key(source)
+        pickled = self._entries.get(key)
+        if pickled is None and self.directory is not None:
+            pickled = self._read(key)
+            if pickled is not None:
+                self.disk_hits += 1
+                self._entries[key] = pickled
+        if pickled is None:
+            return None
+        return loads(pickled)
+
+    def wants(self, source):
+        """ Return whether to 'set' an entry for 'source' (after a miss):
+        if we have a 'directory', or if we were asked about it before.
+        """
+        key = _key(source)
+        if self.directory is not None or key in self._seen:
+            return True
+        self._seen[key] = True
+        return False
+
+    def set(self, source, entry):
+        "Remember 'entry' (which must be picklable) for 'source'"
+        key = _key(source)
+        pickled = dumps(entry, HIGHEST_PROTOCOL)
+        self._entries[key] = pickled
+        if self.directory is not None:
+            self._write(key, pickled)
+
+    def clear(self):
+        "Forget the entries in memory (but not those in 'directory')"
+        self._entries.clear()
+        self._seen.clear()
+
+    def info(self):
+        "Return the hits, misses and evictions of the in-memory entries"
+        return self._entries.info()
+
+    def _get_max_bytes(self):
+        return self._entries.max_size
+
+    def _set_max_bytes(self, max_bytes):
+        self._entries.max_size = max_bytes
+
+    max_bytes = property(_get_max_bytes, _set_max_bytes)
+
+    def _get_max_entries(self):
+        return self._entries.max_entries
+
+    def _set_max_entries(self, max_entries):
+        self._entries.max_entries = max_entries
+
+    max_entries = property(_get_max_entries, _set_max_entries)
+
+    ###########################################################################
+    # Protected interface
+    ###########################################################################
+
+    def _read(self, key):
+        'The pickled entry for key in our directory, or None'
+        try:
+            with open(self._filename(key), 'rb') as f:
+                header, pickled = loads(f.read())
+        except Exception:
+            # (Missing, unreadable or corrupt files are just misses)
+            return None
+        if header != _header():
+            return None
+        return pickled
+
+    def _write(self, key, pickled):
+        'Save a pickled entry in our directory, quietly giving up on errors'
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # Write to a temporary file first, so that readers never see a
+            # partial file
+            fd, temp = mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(dumps((_header(), pickled), HIGHEST_PROTOCOL))
+                os.rename(temp, self._filename(key))
+            except Exception:
+                os.remove(temp)
+                raise
+        except (IOError, OSError):
+            pass
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+def _key(source):
+    # (Unicode and byte strings parse differently, so they get different keys)
+    if isinstance(source, unicode):
+        return 'u' + sha1(source.encode('utf-8')).hexdigest()
+    return 's' + sha1(source).hexdigest()
+
+def _header():
+    # The compiler package's ASTs change between versions of Python
+    return (_FORMAT_VERSION, sys.version_info[:2])
+
+# The cache that Blocks use
+parse_cache = ParseCache()
@@ -0,0 +1,132 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'Profiling the execution of Blocks sub-block by sub-block.'
+
+from __future__ import absolute_import
+
+from collections import namedtuple, OrderedDict
+import sys
+from timeit import default_timer
+
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SubBlockProfile = namedtuple('SubBlockProfile',
+    'block lineno source calls total_time peak_memory_delta inputs outputs')
+
+
+class BlockProfiler(object):
+    ''' Records how long each sub-block takes when a Block executes.
+
+        Pass an instance to 'Block.execute' as 'profiler'. Each sub-block
+        then runs on its own (even with 'no_filenames_in_tracebacks'), and
+        we record its wall time, number of executions and input and output
+        names, along with how much it raised the peak memory use (resident
+        set size) of the process. That last one is only available where the
+        'resource' module is; it is None elsewhere.
+
+        >>> from codetools.blocks.api import Block
+        >>> profiler = BlockProfiler()
+        >>> Block('a = 1\\nb = a + 1').execute({}, profiler=profiler)
+        >>> [(p.source, p.calls, p.outputs) for p in profiler.report(sort=False)]
+        [('a = 1', 1, ['a']), ('b = a+1', 1, ['b'])]
+    '''
+
+    def __init__(self):
+        self._records = OrderedDict()
+
+    def execute(self, block, local_context, global_context, parent=None,
+                memo=None):
+        ''' Execute a sub-block of 'parent' (optionally through 'memo'),
+            recording its profile.
+        '''
+        record = self._records.get(block.uuid)
+        if record is None:
+            record = self._records[block.uuid] = _Record(block, parent)
+
+        peak = _peak_memory()
+        start = default_timer()
+        try:
+            if memo is not None:
+                memo.execute(block, local_context, global_context)
+            else:
+                block.execute(local_context, global_context)
+        finally:
+            record.total_time += default_timer() - start
+            record.calls += 1
+            if peak is not None:
+                record.peak_memory_delta = max(record.peak_memory_delta,
+                                               _peak_memory() - peak)
+
+    def report(self, sort=True):
+        ''' Return a list of SubBlockProfiles, with the slowest sub-blocks
+            first if 'sort', else in the order they first ran.
+        '''
+        profiles = [record.profile() for record in self._records.values()]
+        if sort:
+            profiles.sort(key=lambda p: p.total_time, reverse=True)
+        return profiles
+
+    def export_folded(self):
+        ''' Return the profile in the "folded stacks" format that
+            flamegraph.pl (and compatible tools like speedscope) read: one
+            line per sub-block with the parent block and the sub-block as
+            frames (the file, or the block if there's no file, and the line
+            number and first line of the sub-block), followed by the total
+            time in microseconds.
+        '''
+        lines = []
+        for record in self._records.values():
+            profile = record.profile()
+            frames = [_frame(record.parent_label),
+                      _frame('%s: %s' % (profile.lineno,
+                                         profile.source.split('\n')[0]))]
+            lines.append('%s %d' % (';'.join(frames),
+                                    round(profile.total_time * 1e6)))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def clear(self):
+        "Forget everything recorded so far"
+        self._records.clear()
+
+class _Record(object):
+    'What we know about a sub-block'
+
+    def __init__(self, block, parent):
+        self.block = block
+        self.calls = 0
+        self.total_time = 0.0
+        self.peak_memory_delta = 0 if resource is not None else None
+        # (Only atomic blocks keep their filenames, so the parent usually
+        # doesn't have one)
+        self.parent_label = block.filename or (parent and parent.filename) \
+                            or repr(parent or block)
+
+    def profile(self):
+        block = self.block
+        return SubBlockProfile(block, getattr(block.ast, 'lineno', None),
+                               block._unparse(block.ast).strip(),
+                               self.calls,
+                               self.total_time, self.peak_memory_delta,
+                               sorted(block.inputs),
+                               sorted(block.all_outputs | block.fromimports))
+
+def _frame(label):
+    # Frames can't contain the separators of the format
+    return label.replace(';', ',').replace('\n', ' ')
+
+def _peak_memory():
+    'The peak resident set size of the process in bytes, if we can tell'
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # (Linux reports kilobytes, OS X bytes)
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -44,4 +44,19 @@ class ErrorContinueTest(unittest.TestCase):
             assert len(e.exceptions) == 2
         return
 
+    def test_multi_exception_with_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        ctx = dict(raises_valuerror=raises_valuerror)
+        b = Block(block2)
+        executor = ThreadPoolExecutor(2)
+        try:
+            b.execute(ctx, continue_on_errors=True, executor=executor)
+            assert False #We should have thrown
+        except Exception, e:
+            assert isinstance(e, CompositeException)
+            assert [type(x) for x in e.exceptions] == [ValueError, NameError]
+            assert ctx.has_key('d') and ctx.has_key('f')
+        finally:
+            executor.shutdown()
+
 
@@ -100,3 +100,65 @@ a = 99
     assert_equal(set(shadow.keys()), set(['x', 'z', 'a', '_x', 'os', 'ff']))
 
 
+
+class _UncopyableContext(dict):
+    "A context that can only be indexed"
+
+    def keys(self):
+        raise AssertionError('the context was copied')
+
+    __iter__ = iteritems = items = keys
+
+def test_impure_execute_does_not_copy():
+    code = """
+def f(n):
+    return [scale * i for i in range(n)]
+x = f(count)
+y = sum(i * scale for i in x)
+del count
+"""
+    context = _UncopyableContext(('v%d' % i, i) for i in range(1000))
+    context.update(scale=2, count=3)
+    shadow = Block(code).execute_impure(context)
+    assert_equal(shadow, dict(x=[0, 2, 4], y=12))
+    assert_equal(context['count'], 3)
+
+def test_execute_impure_namespace():
+    """ Does code that looks at its namespace as a whole see the context?
+    """
+    code = """
+def f():
+    return eval("a")
+b = f()
+c = globals().get("a")
+d = locals().get("a")
+e = vars().get("a")
+f = "a" in dir()
+exec "g = a"
+"""
+    context = dict(a=1)
+    shadow = Block(code).execute_impure(context)
+    assert_equal([shadow[name] for name in 'bcdefg'],
+                 [1, 1, 1, 1, True, 1])
+    assert_equal(context, dict(a=1))
+
+def test_shadow_dict():
+    from codetools.blocks.block import ShadowDict
+    context = dict(a=1, b=2)
+    d = ShadowDict(context)
+    assert_equal(d, context)
+    d['c'] = 3
+    assert_equal(d.shadow, dict(c=3))
+    assert_equal(context, dict(a=1, b=2))
+
+def test_shadow_overlay():
+    from codetools.blocks.block import ShadowOverlay
+    context = dict(a=1, b=2)
+    d = ShadowOverlay(context, preload=['a', 'c'])
+    assert_equal(dict.items(d), [('a', 1)])
+    d['c'] = 3
+    del d['b']
+    assert 'b' not in d
+    assert_raises(KeyError, d.__getitem__, 'b')
+    assert_equal((d['a'], d['c'], d.shadow), (1, 3, dict(c=3)))
+    assert_equal(context, dict(a=1, b=2))
@@ -0,0 +1,91 @@
+"""Tests for executing Blocks in chunks."""
+
+import os
+import shutil
+import tempfile
+
+import numpy
+from numpy.testing import assert_array_equal
+from nose.tools import assert_equal, assert_false, assert_raises, assert_true
+from traits.testing.api import doctest_for_module
+
+import codetools.blocks.chunked as chunked
+from codetools.blocks.api import Block
+from codetools.blocks2.api import Block as AstBlock
+
+
+class ChunkedDocTestCase(doctest_for_module(chunked)):
+    pass
+
+
+CODE = """from numpy import sqrt
+ratio = vp / vs
+impedance = vp * rho
+poisson = (ratio ** 2 - 2) / (2 * (ratio ** 2 - 1))
+depth_km = depth / 1000.0
+"""
+
+def _logs(n):
+    return {'vp': numpy.linspace(3000.0, 4000.0, n),
+            'vs': numpy.linspace(1500.0, 2500.0, n),
+            'rho': 2.3, 'depth': numpy.arange(float(n))}
+
+def test_same_as_execute():
+    """Chunks give the same outputs as executing over whole arrays."""
+    for block_class in (Block, AstBlock):
+        block = block_class(CODE)
+        expected = _logs(1001)
+        block.execute(expected)
+        for chunk_size in (1, 100, 1001, 5000):
+            context = _logs(1001)
+            block.execute_chunked(context, ['poisson', 'impedance'],
+                                  chunk_size=chunk_size)
+            assert_array_equal(context['poisson'], expected['poisson'])
+            assert_array_equal(context['impedance'], expected['impedance'])
+            # Only the outputs are written
+            assert_false('ratio' in context)
+            assert_false('depth_km' in context)
+
+def test_out_memmap():
+    """Outputs can go into memory-mapped arrays."""
+    directory = tempfile.mkdtemp()
+    try:
+        context = _logs(1000)
+        path = os.path.join(directory, 'poisson.npy')
+        poisson = numpy.lib.format.open_memmap(path, mode='w+',
+                                               dtype=float, shape=(1000,))
+        Block(CODE).execute_chunked(context, 'poisson', chunk_size=64,
+                                    out={'poisson': poisson})
+        assert_true(context['poisson'] is poisson)
+        poisson.flush()
+        del context, poisson
+        expected = _logs(1000)
+        Block(CODE).execute(expected)
+        assert_array_equal(numpy.load(path), expected['poisson'])
+    finally:
+        shutil.rmtree(directory)
+
+def test_axis_and_sliced():
+    """Arrays can be sliced along another axis, and only those named."""
+    context = {'a': numpy.arange(12.0).reshape(3, 4),
+               'scale': numpy.array([[1.0], [2.0], [3.0]])}
+    Block('b = a * scale').execute_chunked(context, 'b', chunk_size=3,
+                                           axis=1, sliced=['a'])
+    assert_array_equal(context['b'], context['a'] * context['scale'])
+
+def test_errors():
+    """Inputs of different lengths and outputs that aren't sliced fail."""
+    context = {'a': numpy.arange(10), 'b': numpy.arange(5)}
+    block = Block('c = a + 1\nd = b + 1\ne = a.sum()')
+    assert_raises(ValueError, block.execute_chunked, context, ['c', 'd'])
+    assert_raises(ValueError, block.execute_chunked, context, 'e')
+    assert_raises(ValueError, block.execute_chunked, {'a': 1}, 'c')
+    # (Naming the sliced inputs resolves the ambiguity)
+    block.execute_chunked(context, 'c', sliced=['a'], chunk_size=3)
+    assert_array_equal(context['c'], numpy.arange(1, 11))
+
+def test_empty():
+    """Empty inputs give empty outputs."""
+    context = {'a': numpy.zeros((0, 3))}
+    Block('b = a * 2').execute_chunked(context, 'b')
+    assert_equal(context['b'].shape, (0, 3))
@@ -0,0 +1,156 @@
+"""Tests for memoized execution of Blocks."""
+
+from nose.tools import assert_equal, assert_raises
+from numpy import arange, zeros
+from numpy.testing import assert_array_equal
+
+from codetools.blocks.api import Block, SubBlockMemo
+from codetools.contexts.api import DataContext
+
+
+calls = []
+
+def f(x):
+    calls.append(x)
+    return x * 2
+
+
+def test_unchanged_inputs():
+    """Sub-blocks whose inputs didn't change aren't executed again."""
+    del calls[:]
+    b = Block('y = f(x)\nz = f(w)')
+    memo = SubBlockMemo()
+    context = dict(f=f, x=1, w=2)
+    b.execute(context, memo=memo)
+    assert_equal(calls, [1, 2])
+
+    context['x'] = 1
+    b.execute(context, memo=memo)
+    assert_equal(calls, [1, 2])
+
+    context['x'] = 3
+    del context['z']
+    b.execute(context, memo=memo)
+    assert_equal(calls, [1, 2, 3])
+    assert_equal((context['y'], context['z']), (6, 4))
+    assert_equal(memo.info()[:2], (3, 3))
+
+def test_arrays():
+    """Arrays are fingerprinted by identity and version."""
+    del calls[:]
+    b = Block('y = f(x)')
+    memo = SubBlockMemo()
+    x = arange(10)
+    context = DataContext(subcontext=dict(f=f, x=x))
+    b.execute(context, memo=memo)
+    b.execute(context, memo=memo)
+    assert_equal(len(calls), 1)
+
+    # Changes in place are noticed once the context reports them
+    x[0] = 5
+    context['x'] = x
+    b.execute(context, memo=memo)
+    assert_equal(len(calls), 2)
+    assert_array_equal(context['y'], x * 2)
+
+    x[0] = 6
+    memo.changed(x)
+    b.execute(context, memo=memo)
+    assert_equal(len(calls), 3)
+
+    context['x'] = x.copy()
+    b.execute(context, memo=memo)
+    assert_equal(len(calls), 4)
+
+def test_arrays_changed_by_sub_blocks():
+    """Sub-blocks that assign to items of arrays bump their versions."""
+    del calls[:]
+    b = Block('a[0] = x\ny = f(a)\nz = f(a[1:])')
+    memo = SubBlockMemo()
+    a = zeros(3)
+    context = dict(f=f, x=1, a=a)
+    b.execute(context, memo=memo)
+    b.execute(context, memo=memo)
+    assert_equal(len(calls), 4)
+    assert_array_equal(context['y'], [2, 0, 0])
+
+def test_outputs_changed_in_place():
+    """Outputs that later sub-blocks change in place aren't replayed."""
+    memo = SubBlockMemo()
+    b = Block('y = x * 1\ny += 1\nz = y.sum()')
+    context = dict(x=arange(3.0))
+    for i in range(3):
+        b.execute(context, memo=memo)
+        assert_array_equal(context['y'], [1, 2, 3])
+        assert_equal(context['z'], 6.0)
+
+    b = Block('y = [x]\ny.append(1)')
+    context = dict(x=0)
+    for i in range(3):
+        b.execute(context, memo=memo)
+        assert_equal(context['y'], [0, 1])
+
+    # (Methods that only read the object don't count)
+    b = Block('y = x * 2\nz = y.sum()')
+    memo = SubBlockMemo()
+    context = dict(x=arange(3.0))
+    for i in range(2):
+        b.execute(context, memo=memo)
+    assert_equal(memo.info().hits, 2)
+
+def test_hash_arrays():
+    """Arrays are fingerprinted by their contents with 'hash_arrays'."""
+    del calls[:]
+    b = Block('y = f(x)')
+    memo = SubBlockMemo(hash_arrays=True)
+    x = arange(10)
+    context = dict(f=f, x=x)
+    b.execute(context, memo=memo)
+    b.execute(context, memo=memo)
+    assert_equal(len(calls), 1)
+
+    x[0] = 5
+    b.execute(context, memo=memo)
+    assert_equal(len(calls), 2)
+    assert_array_equal(context['y'], x * 2)
+
+    # Without it, changes in place that nothing reports aren't noticed
+    memo.hash_arrays = False
+    b.execute(context, memo=memo)
+    x[0] = 6
+    b.execute(context, memo=memo)
+    assert_equal(len(calls), 3)
+
+def test_always_executed():
+    """Sub-blocks we can't fingerprint or that change things in place."""
+    del calls[:]
+    memo = SubBlockMemo()
+    context = dict(f=f, x=[1], a=zeros(3))
+    for i in range(2):
+        Block('y = f(x)').execute(context, memo=memo)
+    assert_equal(len(calls), 2)
+
+    b = Block('a[0] += 1')
+    b.execute(context, memo=memo)
+    b.execute(context, memo=memo)
+    assert_equal(context['a'][0], 2)
+
+def test_memory_cap():
+    """Outputs are evicted when they take too much memory."""
+    b = Block('y = x * 2\nz = x * 3')
+    memo = SubBlockMemo(max_bytes=1000)
+    b.execute(dict(x=arange(100.0)), memo=memo)
+    assert_equal(memo.info().size, 1)
+    memo.max_bytes = 100
+    assert_equal(memo.info().size, 0)
+    assert_equal(memo.info().evictions, 2)
+
+def test_errors():
+    """Errors are raised as without a memo."""
+    b = Block('a = 1\nb = x\nc = 2')
+    context = {}
+    assert_raises(NameError, b.execute, context, memo=SubBlockMemo())
+    assert_equal(context, {'a': 1})
+    assert_raises(NameError, b.execute, context, memo=SubBlockMemo(),
+                  continue_on_errors=True)
+    assert_equal(context, {'a': 1, 'c': 2})
@@ -0,0 +1,87 @@
+"""Tests for the cache of parsed source text."""
+
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from nose.tools import assert_equal
+from traits.testing.api import doctest_for_module
+
+from codetools.blocks import parse_cache
+from codetools.blocks.api import Block, ParseCache
+
+
+class ParseCacheDocTestCase(doctest_for_module(parse_cache)):
+    pass
+
+
+def test_fresh_copies():
+    """Every lookup returns a new copy of the entry."""
+    cache = ParseCache()
+    cache.set('a = 1', {'inputs': set()})
+    first = cache.get('a = 1')
+    first['inputs'].add('b')
+    assert_equal(cache.get('a = 1'), {'inputs': set()})
+    assert_equal(cache.get(u'a = 1'), None)
+
+def test_wants():
+    """Entries are wanted for text seen before, or for the directory."""
+    cache = ParseCache()
+    assert_equal([cache.wants('a = 1'), cache.wants('a = 1')], [False, True])
+    cache.clear()
+    assert_equal(cache.wants('a = 1'), False)
+    cache.directory = mkdtemp()
+    try:
+        assert_equal(cache.wants('b = 1'), True)
+    finally:
+        rmtree(cache.directory)
+
+def test_eviction_by_size():
+    """Entries are evicted when their pickles take too much space."""
+    cache = ParseCache(max_bytes=300)
+    cache.set('a', 'x' * 200)
+    cache.set('b', 'y' * 200)
+    assert_equal(cache.get('a'), None)
+    assert_equal(cache.get('b'), 'y' * 200)
+
+def test_directory():
+    """Entries written to a directory are read back by other caches."""
+    directory = mkdtemp()
+    try:
+        cache = ParseCache(directory=os.path.join(directory, 'parsed'))
+        cache.set('a = 1', ['entry'])
+
+        other = ParseCache(directory=cache.directory)
+        assert_equal(other.get('a = 1'), ['entry'])
+        assert_equal(other.disk_hits, 1)
+        assert_equal(other.get('b = 1'), None)
+
+        # Corrupt files are just misses
+        for filename in os.listdir(cache.directory):
+            with open(os.path.join(cache.directory, filename), 'wb') as f:
+                f.write('garbage')
+        assert_equal(ParseCache(directory=cache.directory).get('a = 1'),
+                     None)
+    finally:
+        rmtree(directory)
+
+def test_blocks_from_directory():
+    """Blocks use the entries another process left in the directory."""
+    directory = mkdtemp()
+    saved = parse_cache.parse_cache.directory
+    try:
+        parse_cache.parse_cache.directory = directory
+        code = 'import math\ny = math.sqrt(x)\n'
+        b1 = Block(code)
+        parse_cache.parse_cache.clear()
+        disk_hits = parse_cache.parse_cache.disk_hits
+        b2 = Block(code)
+        assert_equal(parse_cache.parse_cache.disk_hits, disk_hits + 1)
+        assert_equal(b2.inputs, b1.inputs)
+        assert_equal(b2.sub_blocks[1].outputs, set(['y']))
+        context = {'x': 4.0}
+        b2.execute(context)
+        assert_equal(context['y'], 2.0)
+    finally:
+        parse_cache.parse_cache.directory = saved
+        rmtree(directory)
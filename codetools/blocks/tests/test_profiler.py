@@ -0,0 +1,46 @@
+"""Tests for profiling the execution of Blocks."""
+
+from nose.tools import assert_equal, assert_raises, assert_true
+from traits.testing.api import doctest_for_module
+
+import codetools.blocks.profiler as profiler
+from codetools.blocks.api import Block, BlockProfiler, SubBlockMemo
+
+
+class ProfilerDocTestCase(doctest_for_module(profiler)):
+    pass
+
+
+def test_report():
+    """Each sub-block is recorded, even on the single code object path."""
+    b = Block('import math\nx = math.sqrt(a)\ny = [i for i in range(100000)]',
+              filename='model.py', no_filenames_in_tracebacks=True)
+    p = BlockProfiler()
+    for i in range(3):
+        b.execute({'a': 4}, profiler=p)
+    report = p.report()
+    assert_equal(report[0].source, 'y = [i for i in range(100000)]')
+    assert_equal([r.calls for r in report], [3, 3, 3])
+    assert_equal(sorted((r.lineno, r.inputs, r.outputs) for r in report),
+                 [(1, [], ['math']), (2, ['a', 'math'], ['x']),
+                  (3, [], ['i', 'y'])])
+    assert_true(all(r.total_time > 0 for r in report))
+
+def test_export_folded():
+    """Folded stacks have one line per sub-block."""
+    b = Block('x = 1; y = 2', filename='model.py')
+    p = BlockProfiler()
+    b.execute({}, profiler=p)
+    lines = p.export_folded().splitlines()
+    assert_equal([line.rsplit(' ', 1)[0] for line in lines],
+                 ['model.py;1: x = 1', 'model.py;1: y = 2'])
+    assert_true(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+
+def test_memo_and_errors():
+    """Profiling works with memos, and records failing sub-blocks."""
+    b = Block('x = 1\ny = z')
+    p = BlockProfiler()
+    assert_raises(NameError, b.execute, {}, profiler=p, memo=SubBlockMemo())
+    assert_equal([r.calls for r in p.report(sort=False)], [1, 1])
+    p.clear()
+    assert_equal(p.report(), [])
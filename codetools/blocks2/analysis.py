@@ -1,23 +1,24 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'Name analysis of ASTs from the ast module.'
+
+from __future__ import absolute_import
+
+import __builtin__
 import ast
-from ast import Assign, Dict, Expression, List, Name, AST, Tuple, Num, Str, Expr
-from ast import stmt, expr
-from ast import NodeVisitor
+from ast import (AST, Attribute, Dict, Expr, Expression, List, Name,
+                 NodeVisitor, Num, Set, Str, Tuple)
+from collections import namedtuple
 
-from copy import copy, deepcopy
-import logging
-logger = logging.getLogger(__name__)
-
-from ..util.dict import map_keys
-from ..util.functional import partial
 from ..util import graph
 from ..util.graph import closure
 from ..util.sequence import \
     all, disjoint, intersect, is_sequence, union
-from ..util import tree
-
-# Extend compiler.ast.Node with a structure-preserving children query
-#import \
-#    codetools.blocks.compiler_.ast.get_children_tree
 
 
 ###############################################################################
@@ -27,37 +28,33 @@ from ..util import tree
 ### Names #####################################################################
 
 def free_vars(node, *args, **kw):
-    nf = NameFinder(*args, **kw)
-    nf.visit(node)
-    return nf.free
+    return walk(node, NameFinder(*args, **kw)).free
 
 def local_vars(node, *args, **kw):
-    nf = NameFinder(*args, **kw)
-    nf.visit(node)
-    return nf.locals
+    return walk(node, NameFinder(*args, **kw)).locals
 
 def conditional_local_vars(node, *args, **kw):
-    nf = NameFinder(*args, **kw)
-    nf.visit(node)
-    return nf.conditional_locals
+    return walk(node, NameFinder(*args, **kw)).conditional_locals
 
+def analyse_statements(nodes):
+    ''' Analyse the names in a sequence of statements in one pass.
 
-### Structure #################################################################
+        Returns a NameSummary for each statement on its own, and one for the
+        whole sequence, which is folded together from the others (see
+        'NameFinder.extend') instead of visiting the statements again.
 
-def extract_const_assigns(node):
-    """ Transform an AST by extracting its constant assignment statements.
+        >>> ss, s = analyse_statements(ast.parse('a = b\\nc = a + d').body)
+        >>> [sorted(x.free) for x in ss], sorted(s.free), sorted(s.locals)
+        ([['b'], ['a', 'd']], ['b', 'd'], ['a', 'c'])
+    '''
+    summaries = [walk(node, NameFinder()).summary() for node in nodes]
+    nf = NameFinder()
+    for summary in summaries:
+        nf.extend(summary)
+    return summaries, nf.summary()
 
-        >>> from compiler import parse
-        >>> from compiler_.ast.api import similar
-        >>> node, const_for = extract_const_assigns(parse('a = 0'))
-        >>> similar(node, parse('a = __a'))
-        True
-        >>> const_for
-        {'__a': 0}
-    """
-    t = ConstAssignExtractor()
-    node = t.transform(node)
-    return node, t.const_for
+
+### Structure #################################################################
 
 def is_independent(node):
     """ Whether an AST represents a independent expression.
@@ -66,8 +63,8 @@ def is_independent(node):
         does not depend on any other dependency graph or on the context
         in which it executes. Here are some examples:
 
-            >>> from compiler import parse
-            >>> all(is_const(parse(s, mode='eval')) for s in (
+            >>> parse = lambda s: ast.parse(s, mode='eval')
+            >>> all(is_independent(parse(s)) for s in (
             ...     '0',
             ...     'True',
             ...     'None',
@@ -81,7 +78,7 @@ def is_independent(node):
 
         And some non-examples, some of which maybe should be reclassified:
 
-            >>> any(is_const(parse(s, mode='eval')) for s in (
+            >>> any(is_independent(parse(s)) for s in (
             ...     '0+1',
             ...     '~8',
             ...     '0 < 1',
@@ -102,28 +99,30 @@ def is_independent(node):
             False
     """
     return (
-        isinstance(node, Num) or isinstance(node, Str) or
+        isinstance(node, (Num, Str)) or
         isinstance(node, Name) and node.id in ['None', 'True', 'False'] or
-        isinstance(node, (List, Tuple, Dict)) and all(map(is_independent, node)) or
-        isinstance(node, expr) and all([is_independent(child) for child in node.iter_child_nodes()]) or
+        isinstance(node, (List, Tuple, Set)) and
+            all(map(is_independent, node.elts)) or
+        isinstance(node, Dict) and
+            all(map(is_independent, node.keys + node.values)) or
+        isinstance(node, Expression) and is_independent(node.body) or
         isinstance(node, Expr) and is_independent(node.value)
     )
 
-def dependency_graph(asts, to_ast=lambda x: x):
+def dependency_graph(nodes, to_ast=lambda x: x):
     """ Compute the dependency graph for a set of ASTs.
 
-        'asts' is a sequence of either ASTs or objects 'x' such that
+        'nodes' is a sequence of either ASTs or objects 'x' such that
         'to_ast(x)' is an AST. The returned value is the dependency graph: a
-        directed (acyclic) graph relating the elements of 'asts' such that a->b
-        iff a's AST uses names created by b's AST. We assume 'to_ast' is
-        injective and elements of 'asts' are hashable. Raises a CyclicGraph
+        directed (acyclic) graph relating the elements of 'nodes' such that
+        a->b iff a's AST uses names created by b's AST. We assume 'to_ast' is
+        injective and elements of 'nodes' are hashable. Raises a CyclicGraph
         exception when the output graph would have been cyclic.
 
-        If a name is created by multiple elements of 'asts', then the
+        If a name is created by multiple elements of 'nodes', then the
         dependency graph won't determine a well-defined program. e.g.
 
-            >>> from compiler import parse
-            >>> assert dependency_graph(to_ast=parse, asts=[
+            >>> assert dependency_graph(to_ast=ast.parse, nodes=[
             ...     'a = 1', 'a = 2'
             ... ]) == {
             ...     'a = 1' : [],
@@ -135,95 +134,103 @@ def dependency_graph(asts, to_ast=lambda x: x):
 
         Some examples:
 
-            >>> from compiler import parse
             >>> import codetools.util.graph as graph
             >>>
-            >>> assert graph.eq(dependency_graph(to_ast=parse, asts=[
+            >>> assert graph.eq(dependency_graph(to_ast=ast.parse, nodes=[
             ...     'a = b+c', 'c = 3', 'b = f(c)'
             ... ]), {
             ...     'a = b+c'  : ['c = 3', 'b = f(c)'],
             ...     'c = 3'    : [],
             ...     'b = f(c)' : ['c = 3'],
             ... })
-            >>> assert graph.eq(dependency_graph(to_ast=parse, asts=[
+            >>> assert graph.eq(dependency_graph(to_ast=ast.parse, nodes=[
             ...     'a = 1', 'print a', 'a = 2'
             ... ]), {
             ...     'a = 1'   : [],
             ...     'print a' : ['a = 1', 'a = 2'],
             ...     'a = 2'   : [],
             ... })
-            >>> assert graph.eq(dependency_graph(to_ast=parse, asts=[
+            >>> assert graph.eq(dependency_graph(to_ast=ast.parse, nodes=[
             ...     'a = 1', 'a = 0; print a', 'a = 2'
             ... ]), {
             ...     'a = 1'          : [],
             ...     'a = 0; print a' : [],
             ...     'a = 2'          : [],
             ... })
-
-        Sorting non-linear dependency graphs is useful (but non-deterministic):
-
-            >>> from codetools.util.graph import reverse, topological_sort
-            >>>
-            >>> assert topological_sort(reverse(
-            ...     dependency_graph(to_ast=parse, asts=[
-            ...         'c = h(a,b)',
-            ...         'a = f(z)',
-            ...         'b = g(z,y)',
-            ...         'd = k(b,c)',
-            ...     ])
-            ... )) in [
-            ...     [ 'a = f(z)', 'b = g(z,y)', 'c = h(a,b)', 'd = k(b,c)' ],
-            ...     [ 'b = g(z,y)', 'a = f(z)', 'c = h(a,b)', 'd = k(b,c)' ],
-            ... ]
     """
 
-    def _dependency_graph(asts):
+    def _dependency_graph(nodes):
 
         # Compute the dependency relation: nodes depend on their inputs, and
         # outputs depend on their nodes
         g = {}
-        for ast in asts:
-            v = walk(ast, NameFinder())
-            g.setdefault(ast, []).extend(v.free)
+        for node, v in zip(nodes, analyse_statements(nodes)[0]):
+            g.setdefault(node, []).extend(v.free)
             for o in v.locals | v.conditional_locals:
-                g.setdefault(o, []).append(ast)
+                g.setdefault(o, []).append(node)
 
         # Take the transitive closure of the relation and return just the
-        # Node-Node pairs
+        # AST-AST pairs
         g = closure(g)
         for k,vs in g.items():
-            if not isinstance(k, Node):
+            if not isinstance(k, AST):
                 del g[k]
             else:
-                g[k] = [ v for v in vs if isinstance(v, Node) ]
+                g[k] = [ v for v in vs if isinstance(v, AST) ]
         return g
 
-    # Push 'asts' through 'to_ast', build the graph, and then pull them back
-    d = dict( (to_ast(x), x) for x in asts )
-    assert len(d) == len(asts)
-    return graph.map(lambda ast: d[ast], _dependency_graph(list(d)))
+    # Push 'nodes' through 'to_ast', build the graph, and then pull them back
+    d = dict( (to_ast(x), x) for x in nodes )
+    assert len(d) == len(nodes)
+    return graph.map(lambda node: d[node], _dependency_graph(list(d)))
 
 ###############################################################################
 # analysis private interface
 ###############################################################################
 
-def walk(x, visitor, walker=None, verbose=None):
-    "Wrap ast.walk to handle 'None' and sequences."
+def walk(x, visitor):
+    "Visit 'x' (an AST, a sequence of them, or None) and return 'visitor'"
+    visitor.visit(x)
+    return visitor
 
-    # (Nodes are iterable and strings cause infinite regress)
-    if x is None:
-        return visitor
-    elif isinstance(x, AST):
-        return ast.walk(x, visitor, walker, verbose)
-    elif is_sequence(x) and not isinstance(x, basestring):
-        for n in x:
-            visitor = walk(n, visitor, walker, verbose)
-        return visitor
-    else:
-        raise ValueError(x)
+def dotted_name(node):
+    ''' The dotted name for a chain of attributes of a name, or None.
 
-class NameFinder (NodeVisitor):
-    """Find and classify variable names"""
+        >>> dotted_name(ast.parse('a.b.c', mode='eval').body)
+        'a.b.c'
+        >>> dotted_name(ast.parse('f(x).c', mode='eval').body) is None
+        True
+    '''
+    attributes = []
+    while isinstance(node, Attribute):
+        attributes.append(node.attr)
+        node = node.value
+    if not isinstance(node, Name):
+        return None
+    return '.'.join([node.id] + attributes[::-1])
+
+# What a NameFinder found, without its working state
+NameSummary = namedtuple('NameSummary', 'free locals conditional_locals '
+                         'global_reads constlist fromimports imports')
+
+# Built-in names are global to anything
+_builtin_names = frozenset(dir(__builtin__))
+
+class NameFinder(NodeVisitor):
+    """ Find and classify variable names.
+
+        This follows 'codetools.blocks.analysis.NameFinder', so that blocks
+        get the same inputs and outputs from either kind of AST. Unlike the
+        compiler package's walker, it also finds the names in keyword
+        arguments, in '*args' and '**kwargs', and in the callee of calls
+        like 'f(x)(y)', it only gives dotted names to attributes of plain
+        names ('a.b.c', but not 'f(x).c'), and generator expressions never
+        bind their variables.
+
+        >>> nf = walk(ast.parse('b = a.x + f(k=c)\\nif t: d = 1'), NameFinder())
+        >>> sorted(nf.free), sorted(nf.locals), sorted(nf.conditional_locals)
+        (['a.x', 'c', 'f', 't'], ['b'], ['d'])
+    """
 
     def __init__(self, free=(), locals=(), conditional_locals=(), globals=()):
         self.free = set(free)
@@ -234,26 +241,27 @@ class NameFinder (NodeVisitor):
         self.fromimports = []
         self.imports = []
 
-        # Consider built-in names as global to anything
-        import __builtin__
-        self.globals |= set(dir(__builtin__))
+        # Names we saw while they were global. (Code that runs before us
+        # might bind them, so 'extend' needs them.)
+        self.global_reads = set()
 
+        # Consider built-in names as global to anything
+        self.globals |= _builtin_names
 
     def visit(self, x):
-        """Wrap NodeVisitor.visit() to handle 'None' and sequences."""
+        "Visit an AST, a sequence of ASTs, or None"
 
-        # (Nodes are iterable and strings cause infinite regress)
+        # (Strings cause infinite regress)
         if x is None:
             pass
         elif isinstance(x, AST):
             super(NameFinder, self).visit(x)
         elif is_sequence(x) and not isinstance(x, basestring):
             for n in x:
-                super(NameFinder, self).visit(n)
+                self.visit(n)
         else:
             raise ValueError(x)
 
-
     ###########################################################################
     # NameFinder interface
     ###########################################################################
@@ -261,8 +269,35 @@ class NameFinder (NodeVisitor):
     def all_locals(self):
         return self.locals | self.conditional_locals
 
-    def _see_unbound(self, names): # TODO I dislike this name...
-        for name in set(names) - self.globals - self.locals:
+    def summary(self):
+        """Return what we found as a NameSummary"""
+        return NameSummary(self.free, self.locals, self.conditional_locals,
+                           self.global_reads, self.constlist,
+                           self.fromimports, self.imports)
+
+    def extend(self, other):
+        """ Update our names as if we had gone on to visit the code that
+            'other' (a NameFinder or NameSummary) visited, starting from
+            scratch.
+        """
+        # Names that were free in 'other' are free for us unless we bind
+        # them, and names that were global in 'other' might not be global
+        # for us
+        self._see_unbound(other.free, ())
+        self._see_unbound(other.global_reads)
+        self._bind(other.locals)
+        self._bind_conditional(other.conditional_locals)
+        self.constlist.extend(other.constlist)
+        self.fromimports.extend(other.fromimports)
+        self.imports.extend(other.imports)
+
+    def _see_unbound(self, names, globals=None): # TODO I dislike this name...
+        if globals is None:
+            globals = self.globals
+        for name in set(names) - self.locals:
+            if name in globals:
+                self.global_reads.add(name)
+                continue
             # (Conditional locals don't bind free names)
 
             # We need to check if the name is a dotted name.
@@ -276,10 +311,10 @@ class NameFinder (NodeVisitor):
                     prefix += suffix[:suffix.find('.')]
 
                 if prefix in self.locals:
-                    return
+                    break
                 suffix = suffix[suffix.find('.')+1:]
-
-            self.free.add(name)
+            else:
+                self.free.add(name)
 
     def _bind(self, names):
 
@@ -300,20 +335,17 @@ class NameFinder (NodeVisitor):
         assert disjoint(self.globals, self.locals, self.conditional_locals)
 
     ###########################################################################
-    # Visitor interface
+    # NodeVisitor interface
     ###########################################################################
 
-    ### Variable occurrances ##################################################
+    ### Variable and binding occurrances ######################################
 
     def visit_Name(self, node):
-        self._see_unbound([node.id])
-
-    ### Binding occurrances ###################################################
-
-    def visit_AssName(self, node):
-        if node.flags == 'OP_ASSIGN':
-            self._bind([node.name])
-        elif node.flags == 'OP_DELETE':
+        if isinstance(node.ctx, ast.Load):
+            self._see_unbound([node.id])
+        elif isinstance(node.ctx, (ast.Store, ast.Param)):
+            self._bind([node.id])
+        else:
             # This is complicated. '"x" in v.conditional_locals' means, "x
             # might be bound locally, or it might be bound globally, or it
             # might be unbound." If a conditional local 'x' gets deleted, then
@@ -322,76 +354,65 @@ class NameFinder (NodeVisitor):
             # yet, and I'm afraid to explore its consequences... (However,
             # deleting attributes is fine because it doesn't affect name
             # analysis.)
-            raise NotImplementedError("'del %s'" % node.name)
+            raise NotImplementedError("'del %s'" % node.id)
+
+    def visit_Attribute(self, node):
+        name = dotted_name(node)
+        if name is None:
+            self.visit(node.value)
+        elif isinstance(node.ctx, ast.Load):
+            self._see_unbound([name])
         else:
-            assert False, 'Unexpected: node.flags = %r' % node.flags
+            self._bind([name])
 
     def visit_AugAssign(self, node):
 
-        # AugAssigns are things like 'a += b'. They don't use AssName, so we
-        # have to handle them manually since visitAssName won't see them. (Is
-        # this over-engineered? We are equating 'a += b' with 'a = a + b', but
-        # should we think about it as something like 'a.add_update(b)'
-        # instead?)
-
-        # Walk the rhs normally (first)
-        walk(node.expr, self)
-
-        # Then walk the lhs. All of its names will appear free, so we have to
-        # discern which are really bindings. 'a += b' binds 'a', but 'a.x += b'
-        # and 'a[i] += b' don't. Augmented assign only allows Names,
-        # Subscripts, and Getattrs (afaict), so we only create a new binding if
-        # we have a Name lhs.
-        v = walk(node.node, NameFinder())
-        assert not (v.locals or v.conditional_locals)
-        self._see_unbound(v.free)
-        if isinstance(node.node, Name):
-            self._bind(v.free)
-        elif isinstance(node.node, Getattr):
-            self.visitAssAttr(node.node)
-
-    def visit_Getattr(self, node):
-        v = walk(node.expr, NameFinder())
-        self._see_unbound([v.free.pop() + "." + node.attrname])
-
-    def visit_AssAttr(self, node):
-        v = walk(node.expr, NameFinder())
-        self._bind([v.free.pop() + "." + node.attrname])
+        # We are equating 'a += b' with 'a = a + b'. (Is this over-engineered?
+        # Should we think about it as something like 'a.add_update(b)'
+        # instead?) 'a += b' binds 'a' and 'a.x += b' binds 'a.x', but
+        # 'a[i] += b' only reads 'a' and 'i'.
+
+        # Visit the rhs first
+        self.visit(node.value)
+
+        target = node.target
+        name = target.id if isinstance(target, Name) else dotted_name(target)
+        if name is not None:
+            self._see_unbound([name])
+            self._bind([name])
+        elif isinstance(target, Attribute):
+            self.visit(target.value)
+        else:
+            self.visit(target.value)
+            self.visit(target.slice)
 
     def visit_Call(self, node):
-        if isinstance(node.node, Name):
-            self._see_unbound([node.node.name])
-        elif isinstance(node.node, Getattr):
-            v = walk(node.node.expr, NameFinder())
-            self._see_unbound(v.free)
-
-        for arg in node.args:
-            if isinstance(arg, Name):
-                self._see_unbound([arg.name])
-            elif isinstance(arg, Getattr):
-                v = walk(arg, NameFinder())
-                self._see_unbound([v.free.pop() + "." + arg.attrname])
-            else:
-                v = walk(arg, NameFinder())
-                self._see_unbound(v.free)
-
+        # (Calling a method reads its object, not the method)
+        if isinstance(node.func, Attribute):
+            self.visit(node.func.value)
+        else:
+            self.visit(node.func)
+        self.visit(node.args)
+        self.visit([keyword.value for keyword in node.keywords])
+        self.visit(node.starargs)
+        self.visit(node.kwargs)
 
     def visit_Import(self, node):
         self.imports.append(node)
-        for name, alias in node.names:
+        for alias in node.names:
             # If 'name' is dotted (e.g. 'os.path'), then we only introduce a
             # binding for the first name in the dotted chain (i.e. 'os'). (If
             # 'name' isn't dotted, then 'name.split(".") == [name]'.)
-            name = name.split('.')[0]
-            val = alias or name
+            name = alias.name.split('.')[0]
+            val = alias.asname or name
             self._bind([val])
             self.fromimports.append(val)
 
     def visit_ImportFrom(self, node):
         self.imports.append(node)
-        if node.names[0][0] != '*':
-            for name, alias in node.names:
-                val = alias or name
+        if node.names[0].name != '*':
+            for alias in node.names:
+                val = alias.asname or alias.name
                 self._bind([val])
                 self.fromimports.append(val)
 
@@ -403,23 +424,17 @@ class NameFinder (NodeVisitor):
 
     def visit_If(self, node):
 
-        unzip = lambda l: map(list, zip(*l))
-
-        # Gather children
-        tests, bodies = unzip(node.tests)
-        bodies.append(node.else_)
-
-        # Visit children
-        tests_v = walk(tests, NameFinder())
-        body_vs = [ walk(b, NameFinder()) for b in bodies ]
-        assert not (tests_v.locals or tests_v.conditional_locals)
+        # Visit children. (An 'elif' is an 'if' in the 'else' branch.)
+        test_v = walk(node.test, NameFinder())
+        body_vs = [ walk(b, NameFinder()) for b in (node.body, node.orelse) ]
+        assert not (test_v.locals or test_v.conditional_locals)
 
-        # Free names come from tests and bodies
-        self._see_unbound(tests_v.free | union(v.free for v in body_vs))
+        # Free names come from the test and bodies
+        self._see_unbound(test_v.free | union(v.free for v in body_vs))
 
-        # Unconditional locals come from locals that appear in every body
-        # including 'else'. (If we have no 'else', then its empty visitor will
-        # nullify the intersection.)
+        # Unconditional locals come from locals that appear in both bodies.
+        # (If we have no 'else', then its empty visitor will nullify the
+        # intersection.)
         locals = intersect(v.locals for v in body_vs)
 
         # Conditional locals come from conditional locals plus the rest of the
@@ -432,23 +447,22 @@ class NameFinder (NodeVisitor):
     def visit_For(self, node):
 
         # Visit children
-        assign_v = walk(node.assign, NameFinder())
-        list_v = walk(node.list, NameFinder())
+        target_v = walk(node.target, NameFinder())
+        iter_v = walk(node.iter, NameFinder())
         body_v = walk(node.body, NameFinder())
-        else_v = walk(node.else_, NameFinder())
-        assert not (assign_v.free or assign_v.conditional_locals)
-        assert not (list_v.locals or list_v.conditional_locals)
+        else_v = walk(node.orelse, NameFinder())
+        assert not (iter_v.locals or iter_v.conditional_locals)
 
-        # Free names come from 'list', 'body' and 'else', and 'assign' binds
-        # names in 'body' and 'else' (but not 'list'!)
-        self._see_unbound(list_v.free)
-        self._see_unbound((body_v.free | else_v.free) - assign_v.locals)
+        # Free names come from 'iter', 'body' and 'else', and 'target' binds
+        # names in 'body' and 'else' (but not 'iter'!)
+        self._see_unbound(target_v.free | iter_v.free)
+        self._see_unbound((body_v.free | else_v.free) - target_v.locals)
 
         # 'for' only produces unconditional locals when the same name is
         # bound both as a loop iterator and as an unconditional local in the
         # 'else' branch. All other bindings are conditional.
-        locals = assign_v.locals & else_v.locals
-        conditional_locals = (assign_v.locals | body_v.all_locals() |
+        locals = target_v.locals & else_v.locals
+        conditional_locals = (target_v.locals | body_v.all_locals() |
                               else_v.all_locals()) - locals
 
         self._bind(locals)
@@ -456,7 +470,7 @@ class NameFinder (NodeVisitor):
 
     def visit_While(self, node):
 
-        v = walk(node.getChildNodes(), NameFinder())
+        v = walk([node.test, node.body, node.orelse], NameFinder())
 
         # 'while' produces no unconditional locals
         self._see_unbound(v.free)
@@ -472,15 +486,13 @@ class NameFinder (NodeVisitor):
         # name is local to 'try'/'else' and every handler. All other bindings
         # are conditional.
 
-        # Visit children
-        body_v = walk([node.body, node.else_], NameFinder())
-        # (A handler is (type, name, body) where 'type' and 'name' can be None)
-        handler_vs = [ walk(h, NameFinder()) for h in node.handlers ]
-        assert all(not v.conditional_locals for v in handler_vs)
+        # Visit children. (A handler's type is visited before its name binds.)
+        body_v = walk([node.body, node.orelse], NameFinder())
+        handler_vs = [ walk([h.type, h.name, h.body], NameFinder())
+                       for h in node.handlers ]
 
         # Free names come from 'try', 'else', and names in 'except' that aren't
-        # bound by the exception name. Since 'handlers' bundles each 'except'
-        # body with its exception name, the bindings are already computed.
+        # bound by the exception name.
         self._see_unbound(body_v.free | union(v.free for v in handler_vs))
 
         # Unconditional locals only come from locals in both the 'try'/'else'
@@ -497,7 +509,7 @@ class NameFinder (NodeVisitor):
 
         # Visit children
         body_v = walk(node.body, NameFinder())
-        final_v = walk(node.final, NameFinder())
+        final_v = walk(node.finalbody, NameFinder())
 
         # Free names are straightforward
         self._see_unbound(body_v.free | final_v.free)
@@ -509,115 +521,85 @@ class NameFinder (NodeVisitor):
         self._bind(locals)
         self._bind_conditional(conditional_locals)
 
-    # These structures are similar:
-    #
-    #   ListComp(expr, quals)
-    #   ListCompFor(assign, list, ifs)
-    #   ListCompIf(test)
-    #
-    #   GenExpr(code)
-    #   GenExprInner(expr, quals)
-    #   GenExprFor(assign, iter, ifs)
-    #   GenExprIf(test)
-    #
     def visit_ListComp(self, node):
-        self._visit_ListCompGenExpr(node)
+        self._visit_comprehension(node.generators, [node.elt], leaks=True)
 
     def visit_GeneratorExp(self, node):
-        self._visit_ListCompGenExpr(node.code)
+        self._visit_comprehension(node.generators, [node.elt])
+
+    def visit_SetComp(self, node):
+        self._visit_comprehension(node.generators, [node.elt])
 
-    def _visitListCompGenExpr(self, node):
+    def visit_DictComp(self, node):
+        self._visit_comprehension(node.generators, [node.key, node.value])
 
-        def seq(node):
-            try:
-                return node.list
-            except AttributeError:
-                return node.iter
+    def _visit_comprehension(self, generators, elements, leaks=False):
 
         # Bindings scope over everything that's not a sequence, and they scope
         # over sequences to the right of their own (not including their own!).
-        # All locals are conditional.
+        # Only list comprehensions leak their bindings, and all of those are
+        # conditional.
 
         # Visit children
-        node = [ (seq(n), n.assign, n.ifs) for n in node.quals ] + [node.expr]
-        v = walk(node, NameFinder())
+        v = walk([ (g.iter, g.target, g.ifs) for g in generators ] + elements,
+                 NameFinder())
         assert not v.conditional_locals
 
         self._see_unbound(v.free)
-        self._bind_conditional(v.locals)
-
-    #def visitWith(self, node) # TODO (2.5)
+        if leaks:
+            self._bind_conditional(v.locals)
 
     ### Nested expressions that introduce bindings ############################
 
     def visit_Lambda(self, node):
 
         # Find free vars nearby
-        walk(node.defaults, self)
+        self.visit(node.args.defaults)
 
         # Find free vars in lambda body (which should introduce no new
         # bindings)
-        g = self.globals - set(node.argnames)
-        l = self.locals | set(node.argnames)
+        argnames = _argument_names(node.args)
+        g = self.globals - argnames
+        l = self.locals | argnames
         c = self.conditional_locals
-        v = walk(node.code,
+        v = walk(node.body,
                  NameFinder(globals=g, locals=l, conditional_locals=c))
         assert v.globals == g
         assert v.locals == l
         assert v.conditional_locals == c
         self._see_unbound(v.free)
 
-    # (Defined above)
-    #def visitListComp(self, node)
-    #def visitGenExpr(self, node)
-
     ### Specialize traversal order ############################################
 
     def visit_Assign(self, node):
 
         # Save Nodes corresponding to constant assignment
         #  For later processing in blocks.
-        if is_independent(node):
+        if isinstance(node.value, (Num, Str)):
             self.constlist.append(node)
 
-        # Walk 'value' before 'targets' so that lhs bindings don't capture rhs
-        # free vars
+        # Visit 'value' before 'targets' so that lhs bindings don't capture
+        # rhs free vars
         self.visit([node.value] + node.targets)
-#        self.visit(node.value)
-#        for target in node.targets:
-#            self.visit(target)
-
 
     ### Nested blocks #########################################################
 
-    def visit_keyword(self, node):
-        # kwargs are not supported due to difficulty in managing these in the graph
-        logger.warn("Keyword arguments may not be correctly identified in call graph for \"%s\"" \
-                    % node.name )
-
     def visit_FunctionDef(self, node):
         # varargs are not supported due to difficulty in managing these in the graph
-        if node.varargs == 1:
+        if node.args.vararg is not None:
             raise TypeError("varargs not supported")
 
         # kwargs are not supported due to difficulty in managing these in the graph
-        if node.kwargs == 1:
+        if node.args.kwarg is not None:
             raise TypeError("keyword args not supported")
 
         # Find free vars nearby
-        walk(node.defaults, self)
-
-        globals      = self.globals - set(node.argnames)
-        locals       = self.locals | set(node.argnames)
-        conditionals = self.conditional_locals
+        self.visit(node.decorator_list)
+        self.visit(node.args.defaults)
 
         self._bind([node.name])
 
         # fixme: the inputs/outputs of functions are not set. This may cause graph errors
-        #v = walk(node.code,
-        #         NameFinder(globals=globals, locals=locals, conditional_locals=conditionals))
-        #self._see_unbound(node.argnames)
-        #self._bind(v.locals - set(node.argnames))
 
     # Nothing needs nested blocks yet, so we punt because the global/local
     # scoping rules are complicated. (A partially correct implementation lives
@@ -625,108 +607,10 @@ class NameFinder (NodeVisitor):
     def visit_ClassDef(self, node):
         raise NotImplementedError('Nested block: %s' % node.name)
 
-# A variation on the compiler module's visitor pattern
-class Transformer(object):
-    r"""...
-
-        >>> from compiler import parse
-        >>> from compiler_.ast.api import similar
-        >>> ast = parse('if t == u: a,b = [1]+[2]\nreturn sum(b,a)')
-        >>> similar(ast, Transformer().transform(ast))
-        True
-        >>> id(ast) == id(Transformer().transform(ast))
-        False
-
-        Transforming produces a deep copy of the input AST.
-    """
-
-    def transform(self, x):
-        if isinstance(x, Node):
-            method = 'transform' + x.__class__.__name__
-            if hasattr(self, method):
-                return getattr(self, method)(x)
-            else:
-                return self._transform_children(x)
-        elif is_sequence(x) and not isinstance(x, basestring):
-            return x.__class__(map(self.transform, x))
-        else:
-            return deepcopy(x)
-
-    def _transform_children(self, node):
-        if not isinstance(node, Node):
-            raise ValueError('Expected a Node, got %r' % node)
-
-        # In these trees, strings and Nodes are leaves
-        leaves = (str, Node)
-        tree_map = partial(tree.tree_map, leaves=leaves)
-
-        children = tree_map(partial(self.transform), node.getChildrenTree())
-        return node.__class__(*children)
-
-class ConstAssignExtractor(Transformer):
-
-    def __init__(self):
-        super(ConstAssignExtractor, self).__init__()
-        self.const_for = {}
-
-    def transformAssign(self, node):
-
-        # Only transform constant assignments
-        if not is_const(node.expr):
-            return self._transform_children(node)
-
-        # '__foo' names come from each lhs name at the head of the assignment:
-        #   'l = a,b = 0,1' -> 'l = a,b = __a,__b', { '__a':0, '__b':1 }
-        #
-        # Unpack the rhs enough to map each '__foo' name to a value.
-        #   'a,l = 0,[1,2]' -> 'a,l = __a,__l', { '__a':0, '__l':[1,2] }
-        #   'a,l = 2'       -> SyntaxError
-
-        def lvalue_name(node):
-            'Construct a "magic" name to represent an l-value.'
-            prefix = sep = '__'
-            dot = '_'
-            if isinstance(node, AssName):
-                return prefix + node.name
-            elif isinstance(node, AssAttr):
-                name = node.attrname
-                expr = node.expr
-                while isinstance(expr, Getattr):
-                    name = sep.join([expr.attrname, name])
-                    expr = expr.expr
-                if isinstance(expr, Name):
-                    expr_name = expr.name
-                else:
-                    expr_name = dot
-                return prefix + sep.join([expr_name, name])
-
-        # In these trees, strings and tuples are leaves
-        leaves = (str, tuple, AssAttr, AssName)
-        tree_zip = partial(tree.tree_zip, leaves=leaves)
-        flatten = partial(tree.flatten, leaves=leaves)
-        tree_embeds = partial(tree.tree_embeds, leaves=leaves)
-
-        # Grab the (right-most) lhs and the rhs
-        lhs, rhs = node.nodes[-1], node.expr
-
-        # Associate constants with l-value names
-        if not tree_embeds(lhs, rhs):
-            raise SyntaxError('Not enough r-values to unpack: %s' % node)
-        zipped = flatten(tree_zip(lhs, rhs))
-        const_ast_for = map_keys(lambda v: lvalue_name(v), dict(zipped))
-
-        # Gather name<->const mappings for names we haven't seen before
-        name_for = {}
-        for name in const_ast_for.keys():
-            if name not in self.const_for.keys():
-                self.const_for[name] = eval_ast(Expression(const_ast_for[name]))
-                assert const_ast_for[name] not in name_for
-                name_for[const_ast_for[name]] = name
-
-        class C(Transformer):
-            def transform(self, node):
-                if isinstance(node, Node) and node in name_for.keys():
-                    return Name(name_for[node])
-                else:
-                    return super(C, self).transform(node)
-        return Assign(node.nodes, C().transform(rhs))
+def _argument_names(arguments):
+    "The names that an 'arguments' node binds"
+    names = set(walk(arguments.args, NameFinder()).locals)
+    for name in (arguments.vararg, arguments.kwarg):
+        if name is not None:
+            names.add(name)
+    return names
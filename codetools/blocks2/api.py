@@ -0,0 +1,14 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+from __future__ import absolute_import
+
+from .analysis import NameFinder, free_vars, local_vars, conditional_local_vars
+from .block import (Block, CompositeException, Expression, ShadowDict,
+                    parse_cache, to_block)
+from .block_transformer import BlockTransformer
+from .unparse import unparse
@@ -1,8 +1,17 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+from __future__ import absolute_import
+
 import ast
-from ast import Module, NodeTransformer
-import token
+from ast import NodeTransformer
+
 
-class BlockTransformer(NodeTransformer, object):
+class BlockTransformer(NodeTransformer):
     """Specialize how code parses into ASTs for Blocks."""
 
     ###########################################################################
@@ -16,10 +25,10 @@ class BlockTransformer(NodeTransformer, object):
                               "del __module\n")
 
     ###########################################################################
-    # Transformer public interface
+    # NodeTransformer interface
     ###########################################################################
 
-    def visit_ImportFrom(self, nodelist):
+    def visit_ImportFrom(self, node):
         r'''Translate 'from ... import \*' statements into 'import ...'.
 
             We avoid 'from ... import \*' because they only seem to work on
@@ -35,33 +44,27 @@ class BlockTransformer(NodeTransformer, object):
             This translation is equivalent except it leaves the name '__module'
             in the namespace.
 
-            This implementation assumes that the compiler equates nested 'Stmt'
-            nodes with flat ones, e.g.:
+            The statements replace the 'from' statement in the body that
+            contains it, on its line:
 
-            >>> from compiler.ast import Assign, AssName, Const, Stmt
-            >>> from codetools.blocks.compiler_.api\
-            ...     import compile_ast
-            >>>
-            >>> def ass(**kw):
-            ...     [(name, n)] = kw.items()
-            ...     return Assign([AssName(name, 'OP_ASSIGN')], Const(n))
-            >>>
-            >>> s1 = Stmt([ass(a=1), ass(b=2), ass(c=3)])
-            >>> s2 = Stmt([ass(a=1), Stmt([ass(b=2)]), ass(c=3)])
-            >>>
-            >>> assert compile_ast(Module(None, s1)) == \
-            ...        compile_ast(Module(None, s2))
+            >>> from codetools.blocks2.unparse import unparse
+            >>> tree = BlockTransformer().visit(ast.parse('a = 1\nfrom os import *'))
+            >>> print unparse(tree),
+            a = 1
+            import os as __module
+            for name in dir(__module):
+                exec ('%s = __module.%s' % (name, name))
+            del __module
+            >>> tree.body[1].lineno, tree.body[2].body[0].lineno
+            (2, 2)
         '''
-
-        if nodelist[3][0] == token.STAR:
-
-            ast = self.parsesuite(self._rewrite_wildcard_into %
-                                  self.com_dotted_name(nodelist[1]))
-
-            # Puts 'Stmt([Import(...), For(...)])' where 'From(...)' would have
-            # gone. (See assumption above.)
-            assert isinstance(ast, Module)
-            return ast.node
-
+        if node.names[0].name == '*' and not node.level:
+            statements = ast.parse(self._rewrite_wildcard_into %
+                                   node.module).body
+            for statement in statements:
+                for child in ast.walk(statement):
+                    if 'lineno' in child._attributes:
+                        ast.copy_location(child, node)
+            return statements
         else:
-            return super(BlockTransformer, self).visit_ImportFrom(nodelist)
+            return node
@@ -0,0 +1,522 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+''' Turn ASTs from the 'ast' module back into source text.
+
+    Based on the unparser in Python 2.7's Demo/parser/unparse.py. The text
+    parses back into an equivalent AST, but formatting and comments are
+    lost, and expressions are fully parenthesised where precedence might
+    matter.
+
+    >>> import ast
+    >>> print unparse(ast.parse('if a:\\n  b = f(x, *y)\\nelse: del c[1:2]')),
+    if a:
+        b = f(x, *y)
+    else:
+        del c[1:2]
+'''
+
+from __future__ import absolute_import
+
+import ast
+from cStringIO import StringIO
+
+
+def unparse(tree):
+    "Return source text for an AST, or a list of ASTs"
+    f = StringIO()
+    Unparser(tree, f)
+    return f.getvalue()
+
+class Unparser(object):
+    ''' Writes the source text for an AST to a file.
+
+        There is one method per kind of node, named after its class with a
+        leading underscore. Statements start on a new line.
+    '''
+
+    # Binary, unary, comparison and boolean operators
+    binop = {'Add': '+', 'Sub': '-', 'Mult': '*', 'Div': '/', 'Mod': '%',
+             'LShift': '<<', 'RShift': '>>', 'BitOr': '|', 'BitXor': '^',
+             'BitAnd': '&', 'FloorDiv': '//', 'Pow': '**'}
+    unop = {'Invert': '~', 'Not': 'not', 'UAdd': '+', 'USub': '-'}
+    cmpops = {'Eq': '==', 'NotEq': '!=', 'Lt': '<', 'LtE': '<=', 'Gt': '>',
+              'GtE': '>=', 'Is': 'is', 'IsNot': 'is not', 'In': 'in',
+              'NotIn': 'not in'}
+    boolops = {ast.And: 'and', ast.Or: 'or'}
+
+    def __init__(self, tree, file):
+        self.f = file
+        self._indent = 0
+        self._first = True
+        # Whether string literals are unicode unless we say otherwise
+        self._unicode_literals = False
+        self.dispatch(tree)
+        self.f.write('\n')
+
+    ###########################################################################
+    # Unparser protected interface
+    ###########################################################################
+
+    def fill(self, text=''):
+        "Start a new, indented line with 'text'"
+        if self._first:
+            self._first = False
+        else:
+            self.f.write('\n')
+        self.f.write('    ' * self._indent + text)
+
+    def write(self, text):
+        "Append 'text' to the current line"
+        self.f.write(text)
+
+    def enter(self):
+        "Write ':' and indent the lines that follow"
+        self.write(':')
+        self._indent += 1
+
+    def leave(self):
+        "Undo 'enter'"
+        self._indent -= 1
+
+    def dispatch(self, tree):
+        if isinstance(tree, list):
+            for t in tree:
+                self.dispatch(t)
+            return
+        getattr(self, '_' + tree.__class__.__name__)(tree)
+
+    def commas(self, nodes):
+        "Write 'nodes' separated by commas"
+        for i, node in enumerate(nodes):
+            if i:
+                self.write(', ')
+            self.dispatch(node)
+
+    def body(self, statements):
+        self.enter()
+        self.dispatch(statements)
+        self.leave()
+
+    ### Modules and statements ################################################
+
+    def _Module(self, tree):
+        self.dispatch(tree.body)
+
+    def _Interactive(self, tree):
+        self.dispatch(tree.body)
+
+    def _Expression(self, tree):
+        self.dispatch(tree.body)
+
+    def _Expr(self, tree):
+        self.fill()
+        self.dispatch(tree.value)
+
+    def _Import(self, t):
+        self.fill('import ')
+        self.commas(t.names)
+
+    def _ImportFrom(self, t):
+        if t.module == '__future__' and \
+               any(alias.name == 'unicode_literals' for alias in t.names):
+            self._unicode_literals = True
+        self.fill('from ' + '.' * (t.level or 0) + (t.module or '') +
+                  ' import ')
+        self.commas(t.names)
+
+    def _Assign(self, t):
+        self.fill()
+        for target in t.targets:
+            self.dispatch(target)
+            self.write(' = ')
+        self.dispatch(t.value)
+
+    def _AugAssign(self, t):
+        self.fill()
+        self.dispatch(t.target)
+        self.write(' %s= ' % self.binop[t.op.__class__.__name__])
+        self.dispatch(t.value)
+
+    def _Return(self, t):
+        self.fill('return')
+        if t.value is not None:
+            self.write(' ')
+            self.dispatch(t.value)
+
+    def _Pass(self, t):
+        self.fill('pass')
+
+    def _Break(self, t):
+        self.fill('break')
+
+    def _Continue(self, t):
+        self.fill('continue')
+
+    def _Delete(self, t):
+        self.fill('del ')
+        self.commas(t.targets)
+
+    def _Assert(self, t):
+        self.fill('assert ')
+        self.dispatch(t.test)
+        if t.msg is not None:
+            self.write(', ')
+            self.dispatch(t.msg)
+
+    def _Exec(self, t):
+        self.fill('exec ')
+        self.dispatch(t.body)
+        if t.globals is not None:
+            self.write(' in ')
+            self.dispatch(t.globals)
+        if t.locals is not None:
+            self.write(', ')
+            self.dispatch(t.locals)
+
+    def _Print(self, t):
+        self.fill('print ')
+        do_comma = False
+        if t.dest is not None:
+            self.write('>>')
+            self.dispatch(t.dest)
+            do_comma = True
+        for value in t.values:
+            if do_comma:
+                self.write(', ')
+            do_comma = True
+            self.dispatch(value)
+        if not t.nl:
+            self.write(',')
+
+    def _Global(self, t):
+        self.fill('global ' + ', '.join(t.names))
+
+    def _Raise(self, t):
+        self.fill('raise')
+        for i, value in enumerate([t.type, t.inst, t.tback]):
+            if value is None:
+                break
+            self.write(' ' if i == 0 else ', ')
+            self.dispatch(value)
+
+    def _TryExcept(self, t):
+        self.fill('try')
+        self.body(t.body)
+        for handler in t.handlers:
+            self.dispatch(handler)
+        if t.orelse:
+            self.fill('else')
+            self.body(t.orelse)
+
+    def _TryFinally(self, t):
+        # ('try'/'except'/'finally' nests a TryExcept in a TryFinally)
+        if len(t.body) == 1 and isinstance(t.body[0], ast.TryExcept):
+            self.dispatch(t.body)
+        else:
+            self.fill('try')
+            self.body(t.body)
+        self.fill('finally')
+        self.body(t.finalbody)
+
+    def _ExceptHandler(self, t):
+        self.fill('except')
+        if t.type is not None:
+            self.write(' ')
+            self.dispatch(t.type)
+        if t.name is not None:
+            self.write(' as ')
+            self.dispatch(t.name)
+        self.body(t.body)
+
+    def _ClassDef(self, t):
+        for decorator in t.decorator_list:
+            self.fill('@')
+            self.dispatch(decorator)
+        self.fill('class ' + t.name)
+        if t.bases:
+            self.write('(')
+            self.commas(t.bases)
+            self.write(')')
+        self.body(t.body)
+
+    def _FunctionDef(self, t):
+        for decorator in t.decorator_list:
+            self.fill('@')
+            self.dispatch(decorator)
+        self.fill('def ' + t.name + '(')
+        self.dispatch(t.args)
+        self.write(')')
+        self.body(t.body)
+
+    def _For(self, t):
+        self.fill('for ')
+        self.dispatch(t.target)
+        self.write(' in ')
+        self.dispatch(t.iter)
+        self.body(t.body)
+        if t.orelse:
+            self.fill('else')
+            self.body(t.orelse)
+
+    def _If(self, t):
+        self.fill('if ')
+        self.dispatch(t.test)
+        self.body(t.body)
+        # Collapse nested ifs into 'elif's
+        while len(t.orelse) == 1 and isinstance(t.orelse[0], ast.If):
+            t = t.orelse[0]
+            self.fill('elif ')
+            self.dispatch(t.test)
+            self.body(t.body)
+        if t.orelse:
+            self.fill('else')
+            self.body(t.orelse)
+
+    def _While(self, t):
+        self.fill('while ')
+        self.dispatch(t.test)
+        self.body(t.body)
+        if t.orelse:
+            self.fill('else')
+            self.body(t.orelse)
+
+    def _With(self, t):
+        self.fill('with ')
+        self.dispatch(t.context_expr)
+        if t.optional_vars is not None:
+            self.write(' as ')
+            self.dispatch(t.optional_vars)
+        self.body(t.body)
+
+    ### Expressions ###########################################################
+
+    def _Str(self, tree):
+        if self._unicode_literals and isinstance(tree.s, str):
+            self.write('b')
+        self.write(repr(tree.s))
+
+    def _Name(self, t):
+        self.write(t.id)
+
+    def _Repr(self, t):
+        self.write('`')
+        self.dispatch(t.value)
+        self.write('`')
+
+    def _Num(self, t):
+        text = repr(t.n)
+        # Parenthesise negative numbers (for '(-1) ** 2' and '(-1).real')
+        # and turn infinities into something that parses back
+        text = text.replace('inf', '1e309')
+        if text.startswith('-'):
+            text = '(' + text + ')'
+        self.write(text)
+
+    def _List(self, t):
+        self.write('[')
+        self.commas(t.elts)
+        self.write(']')
+
+    def _ListComp(self, t):
+        self.write('[')
+        self.dispatch(t.elt)
+        self.dispatch(t.generators)
+        self.write(']')
+
+    def _GeneratorExp(self, t):
+        self.write('(')
+        self.dispatch(t.elt)
+        self.dispatch(t.generators)
+        self.write(')')
+
+    def _SetComp(self, t):
+        self.write('{')
+        self.dispatch(t.elt)
+        self.dispatch(t.generators)
+        self.write('}')
+
+    def _DictComp(self, t):
+        self.write('{')
+        self.dispatch(t.key)
+        self.write(': ')
+        self.dispatch(t.value)
+        self.dispatch(t.generators)
+        self.write('}')
+
+    def _comprehension(self, t):
+        self.write(' for ')
+        self.dispatch(t.target)
+        self.write(' in ')
+        self.dispatch(t.iter)
+        for condition in t.ifs:
+            self.write(' if ')
+            self.dispatch(condition)
+
+    def _IfExp(self, t):
+        self.write('(')
+        self.dispatch(t.body)
+        self.write(' if ')
+        self.dispatch(t.test)
+        self.write(' else ')
+        self.dispatch(t.orelse)
+        self.write(')')
+
+    def _Set(self, t):
+        self.write('{')
+        self.commas(t.elts)
+        self.write('}')
+
+    def _Dict(self, t):
+        self.write('{')
+        for i, (key, value) in enumerate(zip(t.keys, t.values)):
+            if i:
+                self.write(', ')
+            self.dispatch(key)
+            self.write(': ')
+            self.dispatch(value)
+        self.write('}')
+
+    def _Tuple(self, t):
+        self.write('(')
+        if len(t.elts) == 1:
+            self.dispatch(t.elts[0])
+            self.write(',')
+        else:
+            self.commas(t.elts)
+        self.write(')')
+
+    def _UnaryOp(self, t):
+        self.write('(')
+        self.write(self.unop[t.op.__class__.__name__])
+        self.write(' ')
+        self.dispatch(t.operand)
+        self.write(')')
+
+    def _BinOp(self, t):
+        self.write('(')
+        self.dispatch(t.left)
+        self.write(' ' + self.binop[t.op.__class__.__name__] + ' ')
+        self.dispatch(t.right)
+        self.write(')')
+
+    def _Compare(self, t):
+        self.write('(')
+        self.dispatch(t.left)
+        for op, comparator in zip(t.ops, t.comparators):
+            self.write(' ' + self.cmpops[op.__class__.__name__] + ' ')
+            self.dispatch(comparator)
+        self.write(')')
+
+    def _BoolOp(self, t):
+        self.write('(')
+        for i, value in enumerate(t.values):
+            if i:
+                self.write(' %s ' % self.boolops[t.op.__class__])
+            self.dispatch(value)
+        self.write(')')
+
+    def _Attribute(self, t):
+        self.dispatch(t.value)
+        # An integer needs a space before the dot ('1 .real')
+        if isinstance(t.value, ast.Num) and isinstance(t.value.n, int):
+            self.write(' ')
+        self.write('.')
+        self.write(t.attr)
+
+    def _Call(self, t):
+        self.dispatch(t.func)
+        self.write('(')
+        arguments = list(t.args) + list(t.keywords)
+        self.commas(arguments)
+        comma = bool(arguments)
+        if t.starargs is not None:
+            self.write(', *' if comma else '*')
+            self.dispatch(t.starargs)
+            comma = True
+        if t.kwargs is not None:
+            self.write(', **' if comma else '**')
+            self.dispatch(t.kwargs)
+        self.write(')')
+
+    def _Subscript(self, t):
+        self.dispatch(t.value)
+        self.write('[')
+        self.dispatch(t.slice)
+        self.write(']')
+
+    def _Yield(self, t):
+        self.write('(yield')
+        if t.value is not None:
+            self.write(' ')
+            self.dispatch(t.value)
+        self.write(')')
+
+    def _Lambda(self, t):
+        self.write('(lambda ')
+        self.dispatch(t.args)
+        self.write(': ')
+        self.dispatch(t.body)
+        self.write(')')
+
+    ### Slices ################################################################
+
+    def _Ellipsis(self, t):
+        self.write('...')
+
+    def _Index(self, t):
+        self.dispatch(t.value)
+
+    def _Slice(self, t):
+        if t.lower is not None:
+            self.dispatch(t.lower)
+        self.write(':')
+        if t.upper is not None:
+            self.dispatch(t.upper)
+        if t.step is not None:
+            self.write(':')
+            self.dispatch(t.step)
+
+    def _ExtSlice(self, t):
+        for i, dimension in enumerate(t.dims):
+            if i:
+                self.write(', ')
+            self.dispatch(dimension)
+        if len(t.dims) == 1:
+            self.write(',')
+
+    ### Other nodes ###########################################################
+
+    def _arguments(self, t):
+        defaults = [None] * (len(t.args) - len(t.defaults)) + list(t.defaults)
+        parts = []
+        for arg, default in zip(t.args, defaults):
+            parts.append((None, arg, default))
+        if t.vararg:
+            parts.append(('*' + t.vararg, None, None))
+        if t.kwarg:
+            parts.append(('**' + t.kwarg, None, None))
+        for i, (text, arg, default) in enumerate(parts):
+            if i:
+                self.write(', ')
+            if text is not None:
+                self.write(text)
+                continue
+            self.dispatch(arg)
+            if default is not None:
+                self.write('=')
+                self.dispatch(default)
+
+    def _keyword(self, t):
+        self.write(t.arg)
+        self.write('=')
+        self.dispatch(t.value)
+
+    def _alias(self, t):
+        self.write(t.name)
+        if t.asname:
+            self.write(' as ' + t.asname)
@@ -8,7 +8,7 @@
 from __future__ import absolute_import
 
 # Enthought imports
-from traits.api import HasTraits, List, implements
+from traits.api import Any, HasTraits, List, implements
 
 # Local imports
 from .i_adapter_manager import IAdapterManager
@@ -28,6 +28,10 @@ class AdapterManagerMixin(HasTraits):
     # closest to the context data.
     _adapters = List
 
+    # The LookupProfiler counting our adapter calls, if any (see
+    # 'codetools.contexts.lookup_profiler')
+    _lookup_profiler = Any(transient=True)
+
 
     ############################################################################
     # IAdapterManager public interface
@@ -53,8 +57,11 @@ class AdapterManagerMixin(HasTraits):
         """
         # Call adapt_name for each adapter.  The output of each adapter becomes
         # the input for the next adapter.
+        profiler = self._lookup_profiler
         for adapter in self._adapters[::-1]:
             if hasattr(adapter, "adapt_name"):
+                if profiler is not None:
+                    profiler.count_adapter_call(adapter, "adapt_name")
                 name = adapter.adapt_name(context, name)
 
         return name
@@ -64,9 +71,12 @@ class AdapterManagerMixin(HasTraits):
         """
         # Call get_item for each adapter.  The output of each adapter becomes
         # the input for the next adapter.
+        profiler = self._lookup_profiler
         for adapter in self._adapters:
             # E.g: a simple NameAdapter need not declare its own adapt_getitem
             if hasattr(adapter, "adapt_getitem"):
+                if profiler is not None:
+                    profiler.count_adapter_call(adapter, "adapt_getitem")
                 name, value = adapter.adapt_getitem(context, name, value)
 
         return name, value
@@ -77,9 +87,12 @@ class AdapterManagerMixin(HasTraits):
         """
         # Call set_item for each adapter in reverse order.  The output of each
         # adapter becomes the input for the next adapter.
+        profiler = self._lookup_profiler
         for adapter in self._adapters[::-1]:
             # E.g: a simple NameAdapter need not declare its own adapt_setitem
             if hasattr(adapter, "adapt_setitem"):
+                if profiler is not None:
+                    profiler.count_adapter_call(adapter, "adapt_setitem")
                 name, value = adapter.adapt_setitem(context, name, value)
 
         return name, value
@@ -1,12 +1,15 @@
 from __future__ import absolute_import
 
 from .adapted_data_context import AdaptedDataContext
+from .columnar_context import ColumnarContext
 from .data_context import DataContext, ListenableMixin, PersistableMixin
+from .fast_data_context import FastDataContext
 from .function_filter_context import FunctionFilterContext
 from .geo_context import GeoContext
 from .i_context import (ICheckpointable, IContext, IDataContext,
     IListenableContext, IPersistableContext, IRestrictedContext, defer_events)
 from .iterable_adapted_data_context import IterableAdaptedDataContext
+from .lookup_profiler import LookupProfiler, LookupReport, NameLookups
 from .multi_context import MultiContext
 from .traitslike_context_wrapper import TraitslikeContextWrapper
 from .context_function import local_context, context_function
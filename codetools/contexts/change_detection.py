@@ -0,0 +1,101 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+""" Strategies for deciding whether assigning a value changes a context.
+
+A strategy is a function 'is_modified(old, new)' that returns whether
+replacing 'old' with 'new' is a modification. MultiContext takes one in its
+'is_modified' trait, and only assigns (and so only fires 'items_modified'
+for) the values that it says are modifications.
+"""
+
+from __future__ import absolute_import
+
+import numpy
+
+# How many items 'items_differ' compares at a time
+CHUNK_SIZE = 1 << 16
+
+
+def is_modified(old, new):
+    """ Whether 'new' is a different value from 'old', decided cheaply.
+
+    Identical objects are the same. Arrays are the same if they have the
+    same shape, dtype and strides and start at the same address (so that
+    they are views of the same memory), and different otherwise: we never
+    compare their items. Other values are compared with '!='.
+
+    >>> a = numpy.arange(5)
+    >>> is_modified(a, a[:]), is_modified(a, a.copy()), is_modified(1, 1.0)
+    (False, True, False)
+    """
+    if old is new:
+        return False
+    if isinstance(old, numpy.ndarray) or isinstance(new, numpy.ndarray):
+        return not _same_memory(old, new)
+    try:
+        return bool(old != new)
+    except Exception:
+        return True
+
+def items_differ(old, new):
+    """ Like 'is_modified', but arrays in different memory with the same
+    shape and dtype are compared item by item, a chunk at a time, up to the
+    first difference.
+
+    >>> a = numpy.arange(5)
+    >>> items_differ(a, a.copy()), items_differ(a, a + 1)
+    (False, True)
+    """
+    if not is_modified(old, new):
+        return False
+    if not (isinstance(old, numpy.ndarray) and isinstance(new, numpy.ndarray)
+            and _same_layout(old, new, strides=False)):
+        return True
+    # (Slices of 'flat' copy just the slice, whatever the layout)
+    for start in xrange(0, old.size, CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        if not numpy.array_equal(old.flat[start:stop], new.flat[start:stop]):
+            return True
+    return False
+
+def sampled_items_differ(samples=1024):
+    """ Return a strategy like 'items_differ' that only compares about
+    'samples' items of arrays, evenly spaced.
+
+    It misses changes to the other items, so it's only for arrays that are
+    replaced as a whole, where a change shows in any sample.
+
+    >>> a = numpy.zeros(10000)
+    >>> b = a.copy()
+    >>> b[1] = 1
+    >>> sampled_items_differ(100)(a, b), sampled_items_differ(100)(a, a + 1)
+    (False, True)
+    """
+    def is_modified_sampled(old, new):
+        if not is_modified(old, new):
+            return False
+        if not (isinstance(old, numpy.ndarray) and
+                isinstance(new, numpy.ndarray) and
+                _same_layout(old, new, strides=False)):
+            return True
+        step = max(1, old.size // samples)
+        return not numpy.array_equal(old.flat[::step], new.flat[::step])
+    return is_modified_sampled
+
+def _same_layout(old, new, strides=True):
+    "Whether 'old' and 'new' are arrays with the same shape and dtype"
+    return (isinstance(old, numpy.ndarray) and
+            isinstance(new, numpy.ndarray) and old.shape == new.shape and
+            old.dtype == new.dtype and
+            (not strides or old.strides == new.strides))
+
+def _same_memory(old, new):
+    "Whether 'old' and 'new' are arrays that are the same view of memory"
+    return _same_layout(old, new) and \
+           old.__array_interface__['data'][0] == \
+           new.__array_interface__['data'][0]
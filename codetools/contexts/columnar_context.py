@@ -0,0 +1,352 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+
+""" A DataContext that is saved in a directory, one file per array, and that
+reads its values from there on first access.
+
+A saved directory holds:
+
+- 'manifest.pickle', which maps names to the files that hold their values;
+- a '.npy' file for each large array, which is memory-mapped when it is read;
+- a pickle of all the other values, which is read when the first of them is.
+
+Saving writes new files under new names and replaces the manifest last, so a
+directory always holds a complete save.
+"""
+
+from __future__ import absolute_import
+
+import cPickle
+import os
+from UserDict import DictMixin
+
+import numpy
+from traits.api import Any, Enum, Instance, Str, provides
+
+from .data_context import DataContext, NonPickleable
+from .i_context import ICheckpointable, IContext, IDataContext
+
+#: The name of the manifest in a saved directory.
+MANIFEST = 'manifest.pickle'
+
+#: The version of the format.
+FORMAT_VERSION = 1
+
+#: Arrays with fewer bytes than this are pickled with the other values.
+MIN_MAPPED_BYTES = 1 << 16
+
+
+@provides(IContext, ICheckpointable)
+class _ColumnarValues(DictMixin):
+    """ The values of a ColumnarContext: the ones in memory, and the ones that
+    are still only in their files.
+    """
+
+    def __init__(self, mmap_mode='r'):
+        self.mmap_mode = mmap_mode
+        # The values in memory
+        self.values = {}
+        # The files of the arrays that haven't been read
+        self.array_files = {}
+        # The names of the other values that haven't been read, and the file
+        # that holds them
+        self.object_names = set()
+        self.objects_file = None
+
+    def open(self, path, manifest):
+        "Refer to the values saved in 'path' with 'manifest'"
+        self.array_files = dict(
+            (name, os.path.join(path, file_name))
+            for name, file_name in manifest['arrays'].iteritems())
+        self.object_names = set(manifest['objects'])
+        if manifest['objects_file'] is not None:
+            self.objects_file = os.path.join(path, manifest['objects_file'])
+
+    #### IContext interface ####################################################
+
+    def __getitem__(self, key):
+        try:
+            return self.values[key]
+        except KeyError:
+            pass
+        if key in self.array_files:
+            value = numpy.load(self.array_files.pop(key),
+                               mmap_mode=self.mmap_mode)
+            self.values[key] = value
+            return value
+        elif key in self.object_names:
+            self._read_objects()
+            return self.values[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._forget(key)
+        self.values[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._forget(key)
+        self.values.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self.values or key in self.array_files or \
+               key in self.object_names
+
+    def keys(self):
+        return self.values.keys() + self.array_files.keys() + \
+               list(self.object_names)
+
+    #### ICheckpointable interface ############################################
+
+    def checkpoint(self):
+        # (Map the arrays, and read the objects, so that the copy doesn't
+        # depend on files that later saves replace)
+        for key in self.array_files.keys():
+            self[key]
+        if self.object_names:
+            self._read_objects()
+        copy = _ColumnarValues(self.mmap_mode)
+        copy.values = self.values.copy()
+        return copy
+
+    #### Private interface ####################################################
+
+    def _forget(self, key):
+        "Forget the file of 'key'"
+        self.array_files.pop(key, None)
+        self.object_names.discard(key)
+
+    def _read_objects(self):
+        "Read the values that aren't arrays"
+        with open(self.objects_file, 'rb') as objects_file:
+            objects = cPickle.load(objects_file)
+        for name in self.object_names:
+            self.values[name] = objects[name]
+        self.object_names = set()
+
+
+@provides(IDataContext)
+class ColumnarContext(DataContext):
+    """ A DataContext that is saved in a directory, and read from it lazily.
+
+    Arrays are memory-mapped, with 'mmap_mode', when they are first read, and
+    other values are unpickled when the first of them is read. 'save' only
+    writes the names that were reported in 'items_modified' events since the
+    last save (or load), so changing a value in place (with 'mmap_mode'
+    'c', say) is only saved after an event for it.
+
+    >>> import shutil, tempfile
+    >>> path = tempfile.mkdtemp()
+    >>> context = ColumnarContext()
+    >>> context.update_many({'depth': numpy.arange(1e5), 'units': 'm'})
+    >>> context.save(path)
+    >>> context = ColumnarContext.load(path)
+    >>> type(context['depth']).__name__, context['units']
+    ('memmap', 'm')
+    >>> shutil.rmtree(path)
+    """
+
+    # The directory that the context was loaded from or last saved to.
+    path = Str
+
+    # How to memory-map arrays (see 'numpy.load'). With 'r+', changes to the
+    # arrays are written to the files directly.
+    mmap_mode = Enum('r', 'c', 'r+')
+
+    # The underlying dictionary.
+    subcontext = Instance(_ColumnarValues, ())
+
+    # The manifest of 'path', or None if the context isn't saved there
+    _manifest = Any(transient=True)
+
+    # The names that changed since the last save
+    _dirty = Instance(set, (), transient=True)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """ Open a context saved in a directory, without reading its values.
+
+        Parameters
+        ----------
+        path : str
+            The directory.
+        mmap_mode : 'r', 'c' or 'r+', optional
+            How to memory-map arrays.
+
+        Returns
+        -------
+        context : ColumnarContext
+        """
+        manifest = _read_manifest(path)
+        if manifest is None:
+            raise IOError('no saved context in %s' % path)
+
+        values = _ColumnarValues(mmap_mode)
+        values.open(path, manifest)
+        return cls(subcontext=values, path=path, mmap_mode=mmap_mode,
+                   name=manifest['name'], _manifest=manifest)
+
+    def save(self, path=None):
+        """ Save the context in a directory.
+
+        Only the names changed since the last save are written, unless the
+        context is saved somewhere new, or something else saved there since
+        (a checkpoint, say), in which case every name is. Values whose types
+        can't be pickled (see 'cannot_pickle') are skipped, but stay in the
+        context.
+
+        Parameters
+        ----------
+        path : str, optional
+            The directory, which is created if necessary. By default, 'path'.
+        """
+        if path is None:
+            path = self.path
+        if not path:
+            raise ValueError('no path to save %r in' % self)
+
+        old = None
+        if self._manifest is not None and \
+               os.path.abspath(path) == os.path.abspath(self.path):
+            old = _read_manifest(path)
+        # (An incremental save relies on the files of our last save)
+        incremental = old is not None and old == self._manifest
+        if incremental:
+            manifest = _copy_manifest(old)
+            names = set(self._dirty)
+            # (And the names in events that haven't been fired yet)
+            for event in self._deferred_events.values():
+                names.update(event.added, event.removed, event.modified)
+        else:
+            # (Reading every value, so that none refers to the old files)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            if old is None:
+                old = _read_manifest(path)
+            # (Numbering the files after those of any earlier save there,
+            # which may still be mapped)
+            manifest = {'version': FORMAT_VERSION,
+                        'next_file': old['next_file'] if old else 0,
+                        'arrays': {}, 'objects': set(),
+                        'objects_file': None}
+            names = self.keys()
+        manifest['name'] = self.name
+
+        values = self.subcontext
+        objects_changed = False
+        for name in names:
+            manifest['arrays'].pop(name, None)
+            if name in manifest['objects']:
+                manifest['objects'].discard(name)
+                objects_changed = True
+            if name not in values:
+                continue
+            value = values[name]
+            if _is_mapped(value):
+                file_name = _next_file(manifest, '.npy')
+                numpy.save(os.path.join(path, file_name), value)
+                manifest['arrays'][name] = file_name
+            elif not isinstance(value, tuple(NonPickleable)):
+                manifest['objects'].add(name)
+                objects_changed = True
+
+        if objects_changed:
+            objects = dict((name, values[name])
+                           for name in manifest['objects'])
+            manifest['objects_file'] = _next_file(manifest, '.pickle')
+            with open(os.path.join(path, manifest['objects_file']),
+                      'wb') as objects_file:
+                cPickle.dump(objects, objects_file, 2)
+
+        # (Replacing the manifest commits the save)
+        temporary = os.path.join(path, MANIFEST + '.tmp')
+        with open(temporary, 'wb') as manifest_file:
+            cPickle.dump(manifest, manifest_file, 2)
+        _replace(temporary, os.path.join(path, MANIFEST))
+
+        if old is not None:
+            _remove_stale_files(path, old, manifest)
+        self._manifest = manifest
+        self._dirty = set()
+        self.path = path
+
+    #### ICheckpointable interface ############################################
+
+    def checkpoint(self):
+        # (The copy isn't saved anywhere: saving it over our directory would
+        # replace our save)
+        copy = super(ColumnarContext, self).checkpoint()
+        copy.path = ''
+        return copy
+
+    #### Trait Event Handlers ##################################################
+
+    def _items_modified_fired(self, event):
+        # (A static handler, so that it runs before any listener vetoes the
+        # event)
+        self._dirty.update(event.added)
+        self._dirty.update(event.modified)
+        self._dirty.update(event.removed)
+
+    def _mmap_mode_changed(self, new):
+        self.subcontext.mmap_mode = new
+
+
+def _is_mapped(value):
+    "Whether 'value' is saved in a file of its own"
+    # (Subclasses, like unit arrays, are pickled to keep what they add)
+    return type(value) in (numpy.ndarray, numpy.memmap) and \
+           not value.dtype.hasobject and value.nbytes >= MIN_MAPPED_BYTES
+
+def _next_file(manifest, extension):
+    "Return the name of a new file for 'manifest'"
+    file_name = '%d%s' % (manifest['next_file'], extension)
+    manifest['next_file'] += 1
+    return file_name
+
+def _read_manifest(path):
+    "Return the manifest of the context saved in 'path', or None"
+    try:
+        manifest_file = open(os.path.join(path, MANIFEST), 'rb')
+    except IOError:
+        return None
+    with manifest_file:
+        manifest = cPickle.load(manifest_file)
+    if manifest['version'] > FORMAT_VERSION:
+        raise ValueError('unknown format version %r in %s' %
+                         (manifest['version'], path))
+    return manifest
+
+def _copy_manifest(manifest):
+    copy = dict(manifest)
+    copy['arrays'] = dict(manifest['arrays'])
+    copy['objects'] = set(manifest['objects'])
+    return copy
+
+def _remove_stale_files(path, old, new):
+    "Remove the files in 'path' of manifest 'old' that manifest 'new' dropped"
+    stale = set(old['arrays'].values()).difference(new['arrays'].values())
+    if old['objects_file'] != new['objects_file']:
+        stale.add(old['objects_file'])
+    stale.discard(None)
+    for file_name in stale:
+        try:
+            os.remove(os.path.join(path, file_name))
+        except OSError:
+            # (Windows doesn't remove files that are memory-mapped)
+            pass
+
+def _replace(source, destination):
+    "Rename 'source' to 'destination', replacing it"
+    try:
+        os.rename(source, destination)
+    except OSError:
+        # (Windows doesn't rename over existing files)
+        os.remove(destination)
+        os.rename(source, destination)
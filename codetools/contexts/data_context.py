@@ -59,6 +59,36 @@ class ListenableMixin(HasTraits):
         finally:
             self.defer_events = _old_defer_events
 
+    def update_many(self, mapping):
+        """ Set all the items in a mapping, firing a single 'items_modified'
+        event for them all (or adding them to the deferred event).
+
+        Parameters
+        ----------
+        mapping : mapping of str to object
+        """
+        with self._coalesced_events():
+            for key in mapping:
+                self[key] = mapping[key]
+
+    def delete_many(self, keys):
+        """ Delete the items with the given names, firing a single
+        'items_modified' event for them all (or adding them to the deferred
+        event).
+
+        Parameters
+        ----------
+        keys : iterable of str
+
+        Raises
+        ------
+        KeyError if a name is not in the context. The items before it are
+        deleted, and reported.
+        """
+        with self._coalesced_events():
+            for key in keys:
+                del self[key]
+
     #### Trait Event Handlers ##################################################
 
     @on_trait_change('defer_events')
@@ -69,9 +99,9 @@ class ListenableMixin(HasTraits):
         if not new:
             for key, event in self._deferred_events.items():
 
-                added = event.added
-                removed = event.removed
-                modified = event.modified
+                added = list(event.added)
+                removed = list(event.removed)
+                modified = list(event.modified)
 
                 if (len(added) + len(removed) + len(modified)) > 0:
                     new_event = ItemsModified(
@@ -90,6 +120,18 @@ class ListenableMixin(HasTraits):
 
     #### Private API ###########################################################
 
+    @contextmanager
+    def _coalesced_events(self):
+        """ Context manager that defers events, and fires the ones deferred
+        in it as one when it exits (unless events were already deferred).
+        """
+        _old_defer_events = self.defer_events
+        self.defer_events = True
+        try:
+            yield
+        finally:
+            self.defer_events = _old_defer_events
+
     def _fire_event(self, added=None, removed=None, modified=None,
         event_attribute='items_modified', context=None):
         """ Fire an ItemsModifiedEvent.
@@ -139,28 +181,39 @@ class ListenableMixin(HasTraits):
         removed : list of str
         modified : list of str
         """
-        if id(context) not in self._deferred_events:
-            self._deferred_events[id(context)] = ItemsModified(context=context)
-
-        event = self._deferred_events[id(context)]
-
-        event.added = list(set(event.added) | set(added))
+        event = self._deferred_events.get(id(context))
+        if event is None:
+            event = self._deferred_events[id(context)] = \
+                _DeferredEvent(context)
+
+        # (Accumulate in sets: rebuilding the lists of an ItemsModified for
+        # every change is quadratic in the number of names)
+        event.added.update(added)
         for key in removed:
             if key in event.added:
                 # If we've already deferred the addition of this key, then
                 # removing the key should cancel the addition.
-                event.added.remove(key)
+                event.added.discard(key)
             else:
-                event.removed.append(key)
+                event.removed.add(key)
                 # Don't record prior modifications.
-                if key in event.modified:
-                    event.modified.remove(key)
-        event.removed = list(set(event.removed))
+                event.modified.discard(key)
         for key in modified:
             if key not in event.added:
-                event.modified.append(key)
-        event.modified = list(set(event.modified))
+                event.modified.add(key)
+
+
+class _DeferredEvent(object):
+    """ The net change in a context while events are deferred.
+    """
+
+    __slots__ = ('context', 'added', 'removed', 'modified')
 
+    def __init__(self, context):
+        self.context = context
+        self.added = set()
+        self.removed = set()
+        self.modified = set()
 
 
 class PersistableMixin(HasTraits):
@@ -255,7 +308,7 @@ class DataContext(ListenableMixin, PersistableMixin, DictMixin):
         # Figure out if the item was added or modified
         added = []
         modified = []
-        if key in self.subcontext.keys():
+        if key in self.subcontext:
             modified = [key]
         else:
             added = [key]
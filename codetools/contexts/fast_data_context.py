@@ -0,0 +1,131 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+
+""" A DataContext for high-throughput reads and writes.
+"""
+
+from __future__ import absolute_import
+
+from traits.api import Instance, provides
+
+from .data_context import DataContext
+from .i_context import IDataContext
+
+
+@provides(IDataContext)
+class FastDataContext(DataContext):
+    """ A DataContext that stores its items in a plain dict.
+
+    It has the same interface as DataContext, but it is cheaper to use:
+    membership is a dict lookup, no 'items_modified' event is built unless
+    something listens for it (or events are deferred), and 'update' sets many
+    items with a single event for them all.
+
+    It allows any value for any name, and doesn't call 'allows' when items
+    are set, so subclasses that restrict values have to check them in
+    '__setitem__' too.
+
+    >>> context = FastDataContext()
+    >>> context.update(a=1, b=2)
+    >>> sorted(context.items())
+    [('a', 1), ('b', 2)]
+    """
+
+    # The underlying dictionary.
+    subcontext = Instance(dict, args=())
+
+    #### IContext interface ####################################################
+
+    def __contains__(self, key):
+        return key in self.subcontext
+
+    has_key = __contains__
+
+    def __getitem__(self, key):
+        return self.subcontext[key]
+
+    def __setitem__(self, key, value):
+        subcontext = self.subcontext
+        if key in subcontext:
+            subcontext[key] = value
+            self._fire_event(modified=[key])
+        else:
+            subcontext[key] = value
+            self._fire_event(added=[key])
+
+    def __delitem__(self, key):
+        del self.subcontext[key]
+        self._fire_event(removed=[key])
+
+    def __iter__(self):
+        return iter(self.subcontext)
+
+    def __len__(self):
+        return len(self.subcontext)
+
+    def keys(self):
+        return self.subcontext.keys()
+
+    def get(self, key, default=None):
+        return self.subcontext.get(key, default)
+
+    #### DictMixin interface ##################################################
+
+    def update(self, other=(), **kwargs):
+        """ Set many items at once, firing one 'items_modified' event for
+        them all.
+
+        Parameters
+        ----------
+        other : mapping or iterable of (key, value) pairs, optional
+        **kwargs
+            More items.
+        """
+        self.update_many(dict(other, **kwargs))
+
+    #### ListenableMixin interface ############################################
+
+    def update_many(self, mapping):
+        subcontext = self.subcontext
+        if not self._should_fire('items_modified'):
+            subcontext.update(mapping)
+            return
+
+        added = []
+        modified = []
+        for key in mapping:
+            if key in subcontext:
+                modified.append(key)
+            else:
+                added.append(key)
+        subcontext.update(mapping)
+        self._fire_event(added=added, modified=modified)
+
+    #### IRestrictedContext interface ##########################################
+
+    def allows(self, value, name=None):
+        return True
+
+    #### Private API ###########################################################
+
+    def _fire_event(self, added=None, removed=None, modified=None,
+        event_attribute='items_modified', context=None):
+        # (Building the event is most of the cost of a change, so only do it
+        # when it has somewhere to go)
+        if self._should_fire(event_attribute):
+            super(FastDataContext, self)._fire_event(added=added,
+                removed=removed, modified=modified,
+                event_attribute=event_attribute, context=context)
+
+    def _should_fire(self, event_attribute):
+        """ Whether an event on 'event_attribute' has to be fired (or
+        deferred): whether events are deferred or anything listens for it.
+        """
+        return bool(self.defer_events or
+                    self._trait(event_attribute, 0)._notifiers(0) or
+                    self._notifiers(0))
@@ -0,0 +1,195 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'Counting and timing the lookups that code makes in a context.'
+
+from __future__ import absolute_import
+
+from collections import namedtuple
+from contextlib import contextmanager
+from timeit import default_timer
+from UserDict import DictMixin
+
+from traits.api import HasTraits, provides
+
+from .i_context import IContext
+
+# What a LookupProfiler found for a name. ('read_time' includes the time in
+# '__contains__', and 'misses' counts the reads that raised KeyError.)
+NameLookups = namedtuple('NameLookups',
+    'name reads writes checks misses read_time write_time')
+
+# What a LookupProfiler found for a run: the NameLookups with the slowest
+# names first, the number of calls of each adapter method by
+# 'AdapterClass.method', the number of 'items_modified' events the contexts
+# fired, and the total time of the run
+LookupReport = namedtuple('LookupReport',
+    'names adapter_calls events total_time')
+
+
+class LookupProfiler(object):
+    ''' Counts and times the lookups that code executing in a context makes.
+
+        'profiling(context)' gives a namespace that wraps the context, to
+        execute code in. While it is in use, we record, for each name, the
+        reads ('__getitem__'), writes ('__setitem__' and '__delitem__') and
+        membership checks ('__contains__') made through the namespace and
+        the time they take. We also count the calls of the adapters of the
+        adapted contexts (see 'AdapterManagerMixin') and the 'items_modified'
+        events fired by the contexts under 'context'.
+
+        >>> from codetools.contexts.api import DataContext
+        >>> profiler = LookupProfiler()
+        >>> context = DataContext(subcontext={'a': 1})
+        >>> with profiler.profiling(context) as namespace:
+        ...     exec 'b = a + 1\\nc = b * len([b])' in {}, namespace
+        >>> report = profiler.report()
+        >>> [(n.name, n.reads, n.writes, n.misses)
+        ...  for n in sorted(report.names)]
+        [('a', 1, 0, 0), ('b', 2, 1, 0), ('c', 0, 1, 0), ('len', 1, 0, 1)]
+        >>> report.events
+        2
+    '''
+
+    def __init__(self):
+        self.clear()
+
+    @contextmanager
+    def profiling(self, context):
+        ''' Return a context manager that records the lookups made through
+            the namespace it gives, and the adapter calls and events of
+            'context' and its subcontexts, until it exits.
+        '''
+        listened, managers = [], []
+        for c in _contexts(context):
+            if c.trait('items_modified') is not None:
+                # (Listen first: a listener that vetoes the event, like
+                # ExecutingContext, stops the rest from hearing it)
+                c.on_trait_change(self._event_fired, 'items_modified',
+                                  priority=True)
+                listened.append(c)
+            if c.trait('_lookup_profiler') is not None:
+                c._lookup_profiler = self
+                managers.append(c)
+        start = default_timer()
+        try:
+            yield _ProfilingNamespace(context, self)
+        finally:
+            self._total_time += default_timer() - start
+            for c in listened:
+                c.on_trait_change(self._event_fired, 'items_modified',
+                                  remove=True)
+            for c in managers:
+                c._lookup_profiler = None
+
+    def report(self):
+        "Return what we recorded, as a LookupReport"
+        names = [NameLookups(name, *record.values())
+                 for name, record in self._records.items()]
+        names.sort(key=lambda n: n.read_time + n.write_time, reverse=True)
+        return LookupReport(names, dict(self._adapter_calls), self._events,
+                            self._total_time)
+
+    def clear(self):
+        "Forget what we recorded"
+        self._records = {}
+        self._adapter_calls = {}
+        self._events = 0
+        self._total_time = 0.0
+
+    def count_adapter_call(self, adapter, method):
+        "Count a call of the method named 'method' of 'adapter'"
+        key = '%s.%s' % (type(adapter).__name__, method)
+        self._adapter_calls[key] = self._adapter_calls.get(key, 0) + 1
+
+    def _record(self, name):
+        record = self._records.get(name)
+        if record is None:
+            record = self._records[name] = _Record()
+        return record
+
+    def _event_fired(self):
+        self._events += 1
+
+@provides(IContext)
+class _ProfilingNamespace(DictMixin):
+    'A namespace over a context that records its lookups in a LookupProfiler'
+
+    def __init__(self, context, profiler):
+        self._context = context
+        self._profiler = profiler
+
+    def __getitem__(self, name):
+        record = self._profiler._record(name)
+        start = default_timer()
+        try:
+            return self._context[name]
+        except KeyError:
+            record.misses += 1
+            raise
+        finally:
+            record.read_time += default_timer() - start
+            record.reads += 1
+
+    def __contains__(self, name):
+        record = self._profiler._record(name)
+        start = default_timer()
+        try:
+            return name in self._context
+        finally:
+            record.read_time += default_timer() - start
+            record.checks += 1
+
+    def __setitem__(self, name, value):
+        record = self._profiler._record(name)
+        start = default_timer()
+        try:
+            self._context[name] = value
+        finally:
+            record.write_time += default_timer() - start
+            record.writes += 1
+
+    def __delitem__(self, name):
+        record = self._profiler._record(name)
+        start = default_timer()
+        try:
+            del self._context[name]
+        finally:
+            record.write_time += default_timer() - start
+            record.writes += 1
+
+    def keys(self):
+        return self._context.keys()
+
+class _Record(object):
+    'What we know about a name'
+
+    __slots__ = ('reads', 'writes', 'checks', 'misses', 'read_time',
+                 'write_time')
+
+    def __init__(self):
+        self.reads = self.writes = self.checks = self.misses = 0
+        self.read_time = self.write_time = 0.0
+
+    def values(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+def _contexts(context):
+    "The HasTraits among the context and its subcontexts, each once"
+    seen = set()
+    todo = [context]
+    while todo:
+        c = todo.pop()
+        if id(c) in seen or not isinstance(c, HasTraits):
+            continue
+        seen.add(id(c))
+        yield c
+        for name in ('subcontext', 'underlying_context'):
+            if c.trait(name) is not None:
+                todo.append(getattr(c, name))
+        if c.trait('subcontexts') is not None:
+            todo.extend(c.subcontexts)
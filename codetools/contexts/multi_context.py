@@ -14,9 +14,11 @@ from __future__ import absolute_import
 from itertools import chain
 from UserDict import DictMixin
 
-from traits.api import (Bool, List, Str, Undefined, Supports,
-    adapt, provides, on_trait_change)
+from traits.api import (Any, Bool, Callable, HasTraits, List, Str,
+    Undefined, Supports, adapt, provides, on_trait_change)
 
+from .adapter.adapter_manager_mixin import AdapterManagerMixin
+from .change_detection import is_modified
 from .data_context import DataContext, ListenableMixin, PersistableMixin
 from .i_context import ICheckpointable, IDataContext, IRestrictedContext
 from .utils import safe_repr
@@ -36,6 +38,24 @@ class MultiContext(ListenableMixin, PersistableMixin, DictMixin):
     #: Suppress subcontext modified events
     veto_subcontext_modified = Bool(True)
 
+    #: Whether assigning a new value over an old one is a modification, as
+    #: 'is_modified(old, new)' (see 'change_detection'). Assignments that
+    #: aren't modifications are skipped, and fire no events.
+    is_modified = Callable(is_modified)
+
+    # The position and the subcontext of the first subcontext that has each
+    # name, among the subcontexts that report their changes in
+    # 'items_modified' events, and the positions and subcontexts of the
+    # others, which we have to search (see '_lookup'). The events keep the
+    # index up to date; 'None' means we have to rebuild it. (So, as for any
+    # other listener, changes made to a subcontext's underlying dictionary
+    # directly aren't seen until something rebuilds it.)
+    _index = Any(transient=True)
+    _unindexed = Any(transient=True)
+
+    # Whether we listen for the changes that the index follows
+    _listening = Bool(False, transient=True)
+
     def __init__(self, *subcontexts, **traits):
         subcontexts = list(subcontexts)
         super(MultiContext, self).__init__(subcontexts=subcontexts, **traits)
@@ -44,10 +64,15 @@ class MultiContext(ListenableMixin, PersistableMixin, DictMixin):
     #### IContext interface ####################################################
 
     def __contains__(self, key):
-        for c in self.subcontexts:
+        # (The usual case, when every subcontext is indexed)
+        if self._index is not None and not self._unindexed:
+            return key in self._index
+
+        searched, owner = self._lookup(key)
+        for c in searched:
             if key in c:
                 return True
-        return False
+        return owner is not None
 
     def __delitem__(self, key):
         """ Remove the given key with [] access.
@@ -62,21 +87,35 @@ class MultiContext(ListenableMixin, PersistableMixin, DictMixin):
         ------
         KeyError if the kew is not available in the context.
         """
-        for c in self.subcontexts:
+        searched, owner = self._lookup(key)
+        for c in searched:
             try:
                 del c[key]
                 return
             except KeyError:
                 continue
-        raise KeyError(key)
+        if owner is None:
+            raise KeyError(key)
+        del owner[key]
+        self._reindex([key])
 
     def __getitem__(self, key):
-        for c in self.subcontexts:
+        # (The usual case, when every subcontext is indexed)
+        if self._index is not None and not self._unindexed:
+            entry = self._index.get(key)
+            if entry is None:
+                raise KeyError(key)
+            return entry[1][key]
+
+        searched, owner = self._lookup(key)
+        for c in searched:
             try:
                 return c[key]
             except KeyError:
                 continue
-        raise KeyError(key)
+        if owner is None:
+            raise KeyError(key)
+        return owner[key]
 
     def __setitem__(self, key, value):
         """ Set item with [] access.
@@ -109,12 +148,7 @@ class MultiContext(ListenableMixin, PersistableMixin, DictMixin):
                 if c.allows(value, key):
                     if key in c:
                         added = []
-                        current_value = c[key]
-                        try:
-                            is_modified = bool(current_value != value)
-                        except Exception:
-                            is_modified = current_value is not value
-                        if is_modified:
+                        if self.is_modified(c[key], value):
                             modified = [key]
                             c[key] = value
                         else:
@@ -134,12 +168,16 @@ class MultiContext(ListenableMixin, PersistableMixin, DictMixin):
         # Remove all blocking instances.
         for c in blocking_contexts:
             del c[key]
+        self._reindex([key])
 
         if not set:
             raise ValueError('Disallowed mapping: %s = %s' % (key, safe_repr(value)))
 
     def keys(self):
-        return list(set(chain(*[c.keys() for c in self.subcontexts])))
+        index, unindexed = self._get_index()
+        if not unindexed:
+            return index.keys()
+        return list(set(chain(index, *[c.keys() for i, c in unindexed])))
 
 
     # Expose DictMixin's get method over HasTraits'.
@@ -180,9 +218,14 @@ class MultiContext(ListenableMixin, PersistableMixin, DictMixin):
         self._fire_event(added=event.added, removed=event.removed,
             modified=event.modified, context=event.context)
 
+    def _subcontexts_changed(self):
+        self._index = None
+
     def _subcontexts_items_changed(self, event):
         """ Trait listener for items of subcontexts list.
         """
+        self._index = None
+
         added = []
         removed = []
 
@@ -198,6 +241,70 @@ class MultiContext(ListenableMixin, PersistableMixin, DictMixin):
 
         self._fire_event(added=added, removed=removed)
 
+    def _subcontexts_names_changed(self, event):
+        if event is not Undefined:
+            self._reindex(event.added + event.removed)
+
+    def _invalidate_index(self):
+        # (When a subcontext starts deferring its events, it has to be
+        # searched until it fires them, and when it gets a new underlying
+        # dictionary, it doesn't report the names that change)
+        self._index = None
+
+    #### Private interface ####################################################
+
+    def _get_index(self):
+        "Return '_index' and '_unindexed', rebuilding them if necessary"
+        if self._index is None:
+            if not self._listening:
+                self._listen()
+            index, unindexed = {}, []
+            for i, c in reversed(list(enumerate(self.subcontexts))):
+                if _is_indexable(c):
+                    index.update(dict.fromkeys(c.keys(), (i, c)))
+                else:
+                    unindexed.append((i, c))
+            unindexed.reverse()
+            self._index, self._unindexed = index, unindexed
+        return self._index, self._unindexed
+
+    def _listen(self):
+        """ Listen for the changes that the index follows.
+
+        (Not in '__init__', since copies made by pickling or 'clone_traits'
+        aren't initialized, but before the index is first built, which they
+        have to do too.)
+        """
+        # (Before any listener vetoes the events, as ours do)
+        self.on_trait_change(self._subcontexts_names_changed,
+                             'subcontexts:items_modified', priority=True)
+        self.on_trait_change(self._invalidate_index,
+                             'subcontexts:defer_events, subcontexts:subcontext')
+        self._listening = True
+
+    def _lookup(self, key):
+        """ Return the subcontexts that aren't indexed and that we have to
+        search for 'key', in order, and then the first indexed subcontext that
+        has 'key' (or None).
+        """
+        index, unindexed = self._get_index()
+        entry = index.get(key)
+        if entry is None:
+            return [c for i, c in unindexed], None
+        return [c for i, c in unindexed if i < entry[0]], entry[1]
+
+    def _reindex(self, keys):
+        "Update the index for the names 'keys'"
+        if self._index is None:
+            return
+        for key in keys:
+            for i, c in enumerate(self.subcontexts):
+                if _is_indexable(c) and key in c:
+                    self._index[key] = (i, c)
+                    break
+            else:
+                self._index.pop(key, None)
+
     #### ICheckpointable interface ############################################
 
     def checkpoint(self):
@@ -226,3 +333,22 @@ class MultiContext(ListenableMixin, PersistableMixin, DictMixin):
         copy.subcontexts = new_subcontexts
         return copy
 
+
+
+def _is_indexable(context):
+    """ Whether the names in 'context' are the names in its keys, and it fires
+    'items_modified' events for their changes now.
+    """
+    if not isinstance(context, HasTraits) or \
+           context.trait('items_modified') is None or \
+           getattr(context, 'defer_events', False):
+        return False
+    elif isinstance(context, AdapterManagerMixin):
+        # (Its adapters can map other names onto its keys)
+        return False
+    elif isinstance(context, MultiContext):
+        # (It fires no event when one of its own subcontexts gets a new
+        # underlying dictionary or starts deferring its events, or when its
+        # subcontexts are replaced, so we'd miss those changes)
+        return False
+    return True
@@ -0,0 +1,56 @@
+""" Test cases for the change detection strategies.
+"""
+
+import unittest
+
+import numpy
+from traits.testing.api import doctest_for_module
+
+import codetools.contexts.change_detection as change_detection
+from codetools.contexts.change_detection import (is_modified, items_differ,
+    sampled_items_differ)
+
+
+class ChangeDetectionDocTestCase(doctest_for_module(change_detection)):
+    pass
+
+
+class ChangeDetectionTestCase(unittest.TestCase):
+
+    def test_views(self):
+        a = numpy.arange(12.0).reshape(3, 4)
+        self.assertFalse(is_modified(a, a.view()))
+        self.assertTrue(is_modified(a, a[1:]))
+        self.assertTrue(is_modified(a, a.T))
+        self.assertTrue(is_modified(a, a.view('int64')))
+
+    def test_mixed_values(self):
+        a = numpy.arange(3)
+        self.assertTrue(is_modified(a, [0, 1, 2]))
+        self.assertTrue(is_modified(None, a))
+        self.assertFalse(is_modified([1, 2], [1, 2]))
+        self.assertTrue(is_modified('a', 'b'))
+
+    def test_items_differ_across_chunks(self):
+        a = numpy.zeros(3 * change_detection.CHUNK_SIZE)
+        b = a.copy()
+        self.assertFalse(items_differ(a, b))
+        b[-1] = 1
+        self.assertTrue(items_differ(a, b))
+        self.assertTrue(items_differ(a, a[:-1].copy()))
+
+    def test_items_differ_non_contiguous(self):
+        a = numpy.arange(12.0).reshape(3, 4)
+        self.assertFalse(items_differ(a.T, a.T.copy()))
+        self.assertTrue(items_differ(a.T, a.T + 1))
+
+    def test_sampled(self):
+        strategy = sampled_items_differ(10)
+        a = numpy.arange(100)
+        self.assertFalse(strategy(a, a.copy()))
+        self.assertTrue(strategy(a, a[::-1].copy()))
+        self.assertTrue(strategy(1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
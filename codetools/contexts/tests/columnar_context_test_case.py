@@ -0,0 +1,180 @@
+# Standard Library Imports
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from traits.testing.api import doctest_for_module
+
+# Local library imports
+import codetools.contexts.columnar_context as columnar_context
+from codetools.contexts.columnar_context import ColumnarContext, MANIFEST
+from codetools.contexts.multi_context import MultiContext
+from codetools.contexts.tests.abstract_context_test_case import AbstractContextTestCase
+
+
+class ColumnarContextDocTestCase(doctest_for_module(columnar_context)):
+    pass
+
+
+class ColumnarContextMappingTestCase(AbstractContextTestCase):
+
+    #### AbstactContextTestCase interface ######################################
+
+    def context_factory(self, *args, **kw):
+        """ Return the type of context we are testing.
+        """
+        return ColumnarContext(*args, **kw)
+
+    def matched_input_output_pair(self):
+        """ Return values for testing dictionary get/set, etc.
+        """
+        return 1.2, 1.2
+
+
+class ColumnarContextTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.big = numpy.arange(columnar_context.MIN_MAPPED_BYTES, dtype=float)
+        context = ColumnarContext(name='test_context')
+        context.update_many({'big': self.big, 'small': numpy.arange(3),
+                             'text': 'a', 'other': self.big * 2})
+        context.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip(self):
+        context = ColumnarContext.load(self.path)
+        self.assertEqual(context.name, 'test_context')
+        self.assertEqual(sorted(context.keys()),
+                         ['big', 'other', 'small', 'text'])
+        self.assertTrue(isinstance(context['big'], numpy.memmap))
+        self.assertTrue(numpy.array_equal(context['big'], self.big))
+        self.assertEqual(type(context['small']), numpy.ndarray)
+        self.assertEqual(context['text'], 'a')
+
+    def test_reads_lazily(self):
+        context = ColumnarContext.load(self.path)
+        values = context.subcontext
+        self.assertEqual(values.values, {})
+        self.assertTrue('big' in context)
+        context['big']
+        self.assertEqual(values.values.keys(), ['big'])
+        self.assertEqual(values.object_names, set(['small', 'text']))
+
+    def test_incremental_save(self):
+        context = ColumnarContext.load(self.path)
+        files = set(os.listdir(self.path))
+        # Nothing changed, so nothing is written but the manifest
+        context.save()
+        self.assertEqual(set(os.listdir(self.path)), files)
+
+        context['big'] = self.big + 1
+        context.save()
+        new_files = set(os.listdir(self.path))
+        self.assertEqual(len(new_files - files), 1)
+        self.assertEqual(len(files - new_files), 1)
+        # (The other values weren't read to save it)
+        self.assertEqual(context.subcontext.values.keys(), ['big'])
+
+        context = ColumnarContext.load(self.path)
+        self.assertTrue(numpy.array_equal(context['big'], self.big + 1))
+        self.assertTrue(numpy.array_equal(context['other'], self.big * 2))
+
+    def test_save_deletions(self):
+        context = ColumnarContext.load(self.path)
+        context.delete_many(['big', 'text'])
+        context.save()
+        self.assertEqual(len(os.listdir(self.path)), 3)
+
+        context = ColumnarContext.load(self.path)
+        self.assertEqual(sorted(context.keys()), ['other', 'small'])
+        self.assertEqual(list(context['small']), [0, 1, 2])
+
+    def test_events_vetoed_above(self):
+        context = ColumnarContext.load(self.path)
+        # A MultiContext vetoes the events of its subcontexts
+        multi_context = MultiContext(context)
+        multi_context['text'] = 'b'
+        context.save()
+        self.assertEqual(ColumnarContext.load(self.path)['text'], 'b')
+
+    def test_checkpoint(self):
+        context = ColumnarContext.load(self.path)
+        copy = context.checkpoint()
+        context['big'] = self.big + 1
+        context['text'] = 'b'
+        context.save()
+        self.assertTrue(numpy.array_equal(copy['big'], self.big))
+        self.assertEqual(copy['text'], 'a')
+
+    def test_save_after_checkpoint_save(self):
+        context = ColumnarContext.load(self.path)
+        copy = context.checkpoint()
+        self.assertEqual(copy.path, '')
+        copy['small'] = 9
+        copy.save(self.path)
+        # (The save of the copy replaced the files of the context's)
+        context['text'] = 'b'
+        context.save()
+        context = ColumnarContext.load(self.path)
+        self.assertTrue(numpy.array_equal(context['big'], self.big))
+        self.assertEqual(type(context['small']), numpy.ndarray)
+        self.assertEqual(context['text'], 'b')
+
+    def test_save_elsewhere(self):
+        context = ColumnarContext.load(self.path)
+        path = tempfile.mkdtemp()
+        try:
+            context.save(path)
+            self.assertEqual(context.path, path)
+            context['text'] = 'b'
+            context.save()
+            context = ColumnarContext.load(path)
+            self.assertEqual(context['text'], 'b')
+            self.assertTrue(numpy.array_equal(context['big'], self.big))
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(ColumnarContext.load(self.path)['text'], 'a')
+
+    def test_save_over_other_save(self):
+        context = ColumnarContext.load(self.path)
+        big = context['big']
+        other = ColumnarContext()
+        other['big'] = self.big + 1
+        other.save(self.path)
+        # (Without touching the file that's mapped)
+        self.assertTrue(numpy.array_equal(big, self.big))
+        self.assertEqual(len(os.listdir(self.path)), 2)
+        context = ColumnarContext.load(self.path)
+        self.assertEqual(context.keys(), ['big'])
+        self.assertTrue(numpy.array_equal(context['big'], self.big + 1))
+
+    def test_save_with_deferred_events(self):
+        context = ColumnarContext.load(self.path)
+        context.defer_events = True
+        context['text'] = 'b'
+        context.save()
+        context.defer_events = False
+        self.assertEqual(ColumnarContext.load(self.path)['text'], 'b')
+
+    def test_skips_unpicklable_values(self):
+        context = ColumnarContext.load(self.path)
+        context['function'] = lambda x: x
+        context.save()
+        self.assertTrue('function' in context)
+        self.assertTrue('function' not in ColumnarContext.load(self.path))
+
+    def test_save_without_path(self):
+        self.assertRaises(ValueError, ColumnarContext().save)
+
+    def test_load_without_save(self):
+        os.remove(os.path.join(self.path, MANIFEST))
+        self.assertRaises(IOError, ColumnarContext.load, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,8 @@ import nose
 
 # Local library imports
 from codetools.contexts.data_context import DataContext
+from codetools.contexts.i_context import defer_events
+from codetools.contexts.multi_context import MultiContext
 from codetools.contexts.tests.abstract_context_test_case import AbstractContextTestCase
 
 
@@ -85,6 +87,60 @@ def test_allows_keys():
         assert False, "should have raised ValueError"
 
 
+def _record_events(context):
+    events = []
+    def record(event):
+        events.append((sorted(event.added), sorted(event.removed),
+                       sorted(event.modified)))
+    context.on_trait_change(record, 'items_modified')
+    return events
+
+def test_update_many():
+    """ Does update_many() fire a single event for all the items?
+    """
+    d = DataContext(subcontext={'a': 1})
+    events = _record_events(d)
+    d.update_many({'a': 2, 'b': 3, 'c': 4})
+    assert events == [(['b', 'c'], [], ['a'])]
+    assert d.subcontext == {'a': 2, 'b': 3, 'c': 4}
+
+    d.delete_many(['a', 'c'])
+    assert events[1:] == [([], ['a', 'c'], [])]
+    assert d.keys() == ['b']
+
+def test_update_many_keeps_deferral():
+    """ Do update_many() and delete_many() add to the deferred event when
+    events are deferred?
+    """
+    d = DataContext(subcontext={'a': 1})
+    events = _record_events(d)
+    with defer_events(d):
+        d.update_many({'b': 2})
+        d.delete_many(['a', 'b'])
+        assert events == []
+    assert events == [([], ['a'], [])]
+
+def test_delete_many_missing_key():
+    d = DataContext(subcontext={'a': 1, 'b': 2})
+    events = _record_events(d)
+    try:
+        d.delete_many(['a', 'z', 'b'])
+    except KeyError:
+        pass
+    else:
+        assert False, "should have raised KeyError"
+    assert d.keys() == ['b']
+    assert events == [([], ['a'], [])]
+
+def test_update_many_multi_context():
+    """ Does update_many() on a MultiContext fire a single event?
+    """
+    m = MultiContext(DataContext(subcontext={'a': 1}), DataContext())
+    events = _record_events(m)
+    m.update_many({'a': 2, 'b': 3})
+    assert events == [(['b'], [], ['a'])]
+    assert (m['a'], m['b']) == (2, 3)
+
 def test_checkpoint():
     d = DataContext()
     d['a'] = object()
@@ -0,0 +1,105 @@
+# Standard Library Imports
+from cStringIO import StringIO
+
+# Enthought library imports
+from traits.testing.api import doctest_for_module
+
+# Local library imports
+import codetools.contexts.fast_data_context as fast_data_context
+from codetools.contexts.fast_data_context import FastDataContext
+from codetools.contexts.i_context import defer_events
+from codetools.contexts.multi_context import MultiContext
+from codetools.contexts.tests.abstract_context_test_case import AbstractContextTestCase
+
+
+class FastDataContextDocTestCase(doctest_for_module(fast_data_context)):
+    pass
+
+
+class FastDataContextTestCase(AbstractContextTestCase):
+
+    #### AbstactContextTestCase interface ######################################
+
+    def context_factory(self, *args, **kw):
+        """ Return the type of context we are testing.
+        """
+        return FastDataContext(*args, **kw)
+
+    def matched_input_output_pair(self):
+        """ Return values for testing dictionary get/set, etc.
+        """
+        return 1.2, 1.2
+
+
+def _record_events(context):
+    events = []
+    def record(event):
+        events.append((sorted(event.added), sorted(event.removed),
+                       sorted(event.modified)))
+    context.on_trait_change(record, 'items_modified')
+    return events
+
+def test_events():
+    """ Does a FastDataContext fire the same events as a DataContext?
+    """
+    d = FastDataContext(subcontext={'a': 1})
+    events = _record_events(d)
+    d['a'] = 2
+    d['b'] = 3
+    del d['a']
+    assert events == [([], [], ['a']), (['b'], [], []), ([], ['a'], [])]
+
+def test_update_fires_one_event():
+    """ Does update() fire a single event for all the items?
+    """
+    d = FastDataContext(subcontext={'a': 1})
+    events = _record_events(d)
+    d.update({'a': 2, 'b': 3}, c=4)
+    assert events == [(['b', 'c'], [], ['a'])]
+    assert d.subcontext == {'a': 2, 'b': 3, 'c': 4}
+
+def test_unobserved_changes():
+    """ Are changes made while nothing listens kept, and deferred events
+    still fired?
+    """
+    d = FastDataContext()
+    d['a'] = 1
+    d.update(b=2)
+    assert d.subcontext == {'a': 1, 'b': 2}
+
+    with defer_events(d):
+        d['c'] = 3
+        d.update(a=4)
+        events = _record_events(d)
+    assert events == [(['c'], [], ['a'])]
+
+def test_in_multi_context():
+    """ Do MultiContexts see the changes in FastDataContexts?
+    """
+    d = FastDataContext()
+    m = MultiContext(d)
+    events = _record_events(m)
+    d.update(a=1, b=2)
+    assert (m['a'], m['b']) == (1, 2)
+    assert events == [(['a', 'b'], [], [])]
+
+def test_persistence():
+    """ Can FastDataContexts round-trip through the persistence mechanism?
+    """
+    d = FastDataContext(name='test_context')
+    d.update(a=1, b=2)
+
+    f = StringIO()
+    d.save(f)
+    f.seek(0, 0)
+    d2 = FastDataContext.load(f)
+
+    assert d.name == d2.name
+    assert d2.subcontext == {'a': 1, 'b': 2}
+
+def test_checkpoint():
+    d = FastDataContext(subcontext={'a': [1]})
+    copy = d.checkpoint()
+    assert type(copy.subcontext) is dict
+    assert copy.subcontext is not d.subcontext
+    assert copy['a'] is d['a']
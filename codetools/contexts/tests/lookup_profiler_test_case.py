@@ -0,0 +1,70 @@
+import unittest
+
+from codetools.contexts.api import (AdaptedDataContext, DataContext,
+    LookupProfiler, MultiContext, NameAdapter)
+from traits.testing.api import doctest_for_module
+import codetools.contexts.lookup_profiler
+
+
+class LookupProfilerDocTestCase(doctest_for_module(
+    codetools.contexts.lookup_profiler)):
+    pass
+
+
+class LookupProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = LookupProfiler()
+
+    def names(self):
+        return dict((n.name, n) for n in self.profiler.report().names)
+
+    def test_counts(self):
+        context = DataContext(subcontext={'a': 1})
+        with self.profiler.profiling(context) as namespace:
+            namespace['b'] = namespace['a'] + 1
+            self.assertTrue('a' in namespace)
+            self.assertRaises(KeyError, namespace.__getitem__, 'c')
+            del namespace['b']
+        names = self.names()
+        self.assertEqual(names['a'][1:5], (1, 0, 1, 0))
+        self.assertEqual(names['b'][1:5], (0, 2, 0, 0))
+        self.assertEqual(names['c'][1:5], (1, 0, 0, 1))
+        self.assertEqual(self.profiler.report().events, 2)
+        self.assertTrue(self.profiler.report().total_time >= 0.0)
+
+    def test_adapter_calls(self):
+        adapted = AdaptedDataContext(subcontext=DataContext(
+            subcontext={'a': 1}))
+        adapted.push_adapter(NameAdapter(map={'x': 'a'}))
+        context = MultiContext(adapted, DataContext())
+        with self.profiler.profiling(context) as namespace:
+            self.assertEqual(namespace['x'], 1)
+        # (NameAdapter only adapts names)
+        self.assertEqual(self.profiler.report().adapter_calls,
+                         {'NameAdapter.adapt_name': 1})
+
+    def test_stops_listening(self):
+        adapted = AdaptedDataContext()
+        adapted.push_adapter(NameAdapter(map={'x': 'a'}))
+        with self.profiler.profiling(adapted) as namespace:
+            namespace['x'] = 1
+        events = self.profiler.report().events
+        adapted['x'] = 2
+        adapted['x']
+        report = self.profiler.report()
+        self.assertEqual(report.events, events)
+        self.assertEqual(report.adapter_calls, {'NameAdapter.adapt_name': 1})
+        self.assertTrue(adapted._lookup_profiler is None)
+
+    def test_clear(self):
+        with self.profiler.profiling(DataContext()) as namespace:
+            namespace['a'] = 1
+        self.profiler.clear()
+        report = self.profiler.report()
+        self.assertEqual((report.names, report.adapter_calls, report.events),
+                         ([], {}, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@ from traits.api import Any
 # Geo library imports
 from codetools.contexts.tests.abstract_context_test_case import AbstractContextTestCase
 from codetools.contexts.data_context import DataContext
+from codetools.contexts.i_context import defer_events
 from codetools.contexts.multi_context import MultiContext
 
 
@@ -187,3 +188,114 @@ def test_checkpoint_nested():
 
 
 
+
+def test_index_follows_subcontexts():
+    """ Do lookups see changes made directly in the subcontexts?
+    """
+    d1 = DataContext(subcontext={'a': 1})
+    d2 = DataContext(subcontext={'a': 2, 'b': 3})
+    m = MultiContext(d1, d2)
+    # A second MultiContext over the same subcontexts vetoes their events too
+    other = MultiContext(d2, d1)
+    assert (m['a'], m['b'], other['a']) == (1, 3, 2)
+
+    d2['c'] = 4
+    del d1['a']
+    assert (m['a'], m['c'], other['c']) == (2, 4, 4)
+    assert sorted(m.keys()) == ['a', 'b', 'c']
+
+    d1.subcontext = {'b': 5}
+    assert (m['b'], 'a' in m) == (5, True)
+
+    with defer_events(d1):
+        d1['d'] = 6
+        assert m['d'] == 6
+    assert m['d'] == 6
+
+    m.subcontexts.pop(0)
+    assert (m['b'], 'd' in m) == (3, False)
+
+def test_unindexed_subcontexts():
+    """ Are subcontexts that can't be indexed searched in order?
+    """
+    from codetools.contexts.api import AdaptedDataContext, NameAdapter
+
+    adapted = AdaptedDataContext(subcontext={'a': 1})
+    adapted.push_adapter(NameAdapter(map={'x': 'a'}))
+    d = DataContext(subcontext={'x': 2, 'a': 3, 'b': 4})
+    m = MultiContext(d, adapted)
+    assert (m['x'], m['a'], m['b']) == (2, 3, 4)
+    m = MultiContext(adapted, d)
+    assert (m['x'], m['a'], m['b']) == (1, 1, 4)
+    del m['a']
+    assert m['a'] == 3
+    try:
+        m['z']
+    except KeyError:
+        pass
+    else:
+        assert False, 'KeyError not raised'
+
+def test_nested_multi_contexts():
+    """ Do lookups see changes made inside a nested MultiContext?
+    """
+    d = DataContext(subcontext={'a': 1})
+    inner = MultiContext(d)
+    outer = MultiContext(inner, DataContext(subcontext={'a': 2}))
+    assert outer['a'] == 1
+
+    d.subcontext = {'a': 7}
+    assert outer['a'] == 7
+
+    with defer_events(d):
+        d['b'] = 5
+        assert ('b' in outer, outer['b']) == (True, 5)
+    assert outer['b'] == 5
+
+    inner.subcontexts = [DataContext(subcontext={'c': 3})]
+    assert (outer['a'], outer['c'], 'b' in outer) == (2, 3, False)
+
+def test_index_of_copies():
+    """ Do pickled and checkpointed copies keep their index up to date?
+    """
+    import cPickle
+
+    m = MultiContext(DataContext(), DataContext(subcontext={'x': 1}))
+    m['x']
+    copies = [cPickle.loads(cPickle.dumps(m, 2)), m.checkpoint()]
+    for copy in copies:
+        assert copy['x'] == 1
+        copy.subcontexts[0]['x'] = 7
+        copy.subcontexts[1]['y'] = 2
+        assert (copy['x'], 'y' in copy) == (7, True)
+        copy.subcontexts[0].subcontext = {'x': 5}
+        assert copy['x'] == 5
+    assert m['x'] == 1
+
+def test_set_change_detection():
+    """ Does assignment fire events only for the values that change?
+    """
+    import numpy
+    from codetools.contexts.change_detection import items_differ
+
+    a = numpy.zeros(10)
+    m = MultiContext({'a': a, 'b': 1})
+    events = []
+    def record(event):
+        events.append(event)
+    m.on_trait_change(record, 'items_modified')
+
+    m['a'] = a.view()
+    m['b'] = 1.0
+    assert events == []
+
+    # Arrays in other memory are modifications, whatever they hold...
+    m['a'] = a.copy()
+    assert [e.modified for e in events] == [['a']]
+
+    # ... unless a strategy compares their items.
+    m.is_modified = items_differ
+    m['a'] = a.copy()
+    assert len(events) == 1
+    m['a'] = a + 1
+    assert [e.modified for e in events] == [['a'], ['a']]
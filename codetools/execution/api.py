@@ -10,4 +10,5 @@ from __future__ import absolute_import
 from .interfaces import IExecutable, IExecutingContext
 from .executing_context import ExecutingContext, CodeExecutable
 from .expression_context import ExpressionContext
+from .lazy_executing_context import LazyExecutingContext
 
@@ -10,11 +10,14 @@ namespace.
 """
 from __future__ import absolute_import
 
-from traits.api import (Bool, HasTraits, List, Str, Supports,
+from traits.api import (Any, Bool, HasTraits, List, Str, Supports,
     Undefined, adapt, provides, on_trait_change)
 
+from codetools.blocks.block import ShadowOverlay
 from codetools.contexts.data_context import DataContext
-from codetools.contexts.i_context import IContext, IListenableContext
+from codetools.contexts.i_context import (IContext, IListenableContext,
+    defer_events)
+from codetools.contexts.lookup_profiler import LookupProfiler
 from .interfaces import IExecutable, IExecutingContext
 
 
@@ -55,6 +58,21 @@ class ExecutingContext(DataContext):
 
     defer_execution = Bool(False)
 
+    # Whether to execute in a plain dict instead of in the subcontext. The
+    # names that the executable reads are copied into the dict first (all
+    # of them when it has a 'get_names' method, like
+    # RestrictingCodeExecutable, or else on their first read; the whole
+    # subcontext when 'get_names' returns None), and the names it binds or
+    # deletes are written back into the subcontext afterwards, in one batch
+    # that fires a single 'items_modified' event.
+    execute_in_dict = Bool(False)
+
+    # Whether to record the lookups that each execution makes in the
+    # subcontext. When this is set, 'lookup_report' is the LookupReport of the
+    # last execution (see 'codetools.contexts.lookup_profiler').
+    profile_lookups = Bool(False)
+    lookup_report = Any(transient=True)
+
     # When execution is deferred, we need to keep a list of these events.
     _deferred_execution_names = List(Str, transient=True)
 
@@ -77,8 +95,42 @@ class ExecutingContext(DataContext):
             affected_names = None
         else:
             affected_names = list(set(names))
-        with self.subcontext.deferred_events():
-            self.executable.execute(self.subcontext, inputs=affected_names)
+        if self.profile_lookups:
+            profiler = LookupProfiler()
+            with profiler.profiling(self.subcontext) as namespace:
+                self._execute(namespace, affected_names)
+            self.lookup_report = profiler.report()
+        else:
+            self._execute(self.subcontext, affected_names)
+
+    def _execute(self, context, affected_names):
+        """ Execute for 'affected_names' in 'context', which is the subcontext
+        or a namespace over it.
+        """
+        if not self.execute_in_dict:
+            with self.subcontext.deferred_events():
+                self.executable.execute(context, inputs=affected_names)
+            return
+
+        get_names = getattr(self.executable, 'get_names', None)
+        if get_names is not None:
+            names = get_names(inputs=affected_names)
+        else:
+            names = ()
+        if names is None:
+            # The executable needs all of the context
+            names = context.keys()
+        namespace = ShadowOverlay(context, preload=names)
+        try:
+            self.executable.execute(namespace, inputs=affected_names)
+        finally:
+            # (Keeping what was done before any exception, as executing in
+            # the subcontext would)
+            with defer_events(self.subcontext):
+                for name in namespace.deleted.difference(namespace.shadow):
+                    if name in context:
+                        del context[name]
+                context.update(namespace.shadow)
 
     #### IContext interface ####################################################
 
@@ -90,6 +142,28 @@ class ExecutingContext(DataContext):
         del self.subcontext[key]
         self.execute_for_names([key])
 
+    #### ListenableMixin interface ############################################
+
+    def update_many(self, mapping):
+        """ Set all the items in a mapping, and then execute once for them
+        all, firing a single 'items_modified' event.
+        """
+        names = list(mapping)
+        with self._coalesced_events():
+            for name in names:
+                self.subcontext[name] = mapping[name]
+            self.execute_for_names(names)
+
+    def delete_many(self, keys):
+        """ Delete the items with the given names, and then execute once for
+        them all, firing a single 'items_modified' event.
+        """
+        names = list(keys)
+        with self._coalesced_events():
+            for name in names:
+                del self.subcontext[name]
+            self.execute_for_names(names)
+
     #### Trait Event Handlers ##################################################
 
     @on_trait_change('defer_execution')
@@ -11,7 +11,8 @@ from __future__ import absolute_import
 from UserDict import DictMixin
 
 # Enthought library imports
-from traits.api import Str, Dict, Any, List, AdaptsTo, on_trait_change, provides
+from traits.api import Str, Dict, Any, List, AdaptsTo, on_trait_change, provides, \
+    Type
 
 # Block Canvas imports
 from codetools.blocks.api import Block
@@ -39,8 +40,13 @@ class ExpressionContext(ListenableMixin, PersistableMixin, DictMixin):
     # A list of variable dependencies for each expression
     _dependencies = Dict(Str, List(Str))
 
+    # The class of the blocks that find the dependencies of expressions (see
+    # RestrictingCodeExecutable)
+    block_class = Type(Block)
+
     def __init__(self, underlying_context, **traits):
-        super(ExpressionContext, self).__init__(underlying_context=underlying_context)
+        super(ExpressionContext, self).__init__(underlying_context=underlying_context,
+                                                **traits)
 
     def __delitem__(self, key):
         """Delete an item from the ExpressionContext -- either in the underlying context,
@@ -49,7 +55,7 @@ class ExpressionContext(ListenableMixin, PersistableMixin, DictMixin):
         # to underlying
         if key in self._expressions:
             self._expressions.remove(key)
-            for dep in list(Block(key).inputs):
+            for dep in list(self.block_class(key).inputs):
                 self._dependencies[dep].remove(key)
         else:
             del self.underlying_context[key]
@@ -79,7 +85,7 @@ class ExpressionContext(ListenableMixin, PersistableMixin, DictMixin):
 
                 result = eval(key, eval_globals, self.underlying_context)
                 self._expressions[key] = result
-                for dep in Block(key).inputs:
+                for dep in self.block_class(key).inputs:
                     self._dependencies.setdefault(dep, list())
                     self._dependencies[dep].append(key)
                 return result
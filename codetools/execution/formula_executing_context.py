@@ -11,7 +11,8 @@ from __future__ import absolute_import
 from copy import copy
 
 # Enthought library imports
-from traits.api import Str, Instance, Dict, on_trait_change, Bool, Supports
+from traits.api import Str, Instance, Dict, on_trait_change, Bool, Supports, \
+    Type
 from codetools.blocks.api import Block
 from codetools.contexts.data_context import DataContext
 from codetools.contexts.items_modified_event import ItemsModified
@@ -31,6 +32,9 @@ class FormulaExecutingContext(DataContext):
     # The user-supplied block that is merged with the expressions
     external_block = Instance(Block)
 
+    # The class of the blocks we make (see RestrictingCodeExecutable)
+    block_class = Type(Block)
+
     # Whether data has changed so as to need execution -- we may want
     # to store up a list of variables that have changed to aid this.
     execution_needed = Bool(False)
@@ -84,6 +88,8 @@ class FormulaExecutingContext(DataContext):
     # Public interface
 
     def __init__(self, **kwtraits):
+        if 'block_class' in kwtraits:
+            self.block_class = kwtraits.pop('block_class')
         if 'external_block' in kwtraits:
             self.external_block = kwtraits.pop('external_block')
 
@@ -93,7 +99,8 @@ class FormulaExecutingContext(DataContext):
         if self.external_block is None:
             self._external_code_changed(self.external_code)
         else:
-            self.external_block = Block([self.external_block, Block(self.external_code)])
+            self.external_block = self.block_class([self.external_block,
+                                                    self.block_class(self.external_code)])
 
         self._regenerate_composite_block()
 
@@ -155,6 +162,7 @@ class FormulaExecutingContext(DataContext):
 
         new = FormulaExecutingContext(data_context=new_datacontext,
                                       external_block=self.external_block,
+                                      block_class=self.block_class,
                                       execution_needed=self.execution_needed,
                                       auto_execute=False,
                                       _expressions=self._expressions)
@@ -174,7 +182,7 @@ class FormulaExecutingContext(DataContext):
         self.execution_needed=True
 
     def _external_code_changed(self, new):
-        self.external_block = Block(new)
+        self.external_block = self.block_class(new)
         return
 
 
@@ -187,13 +195,14 @@ class FormulaExecutingContext(DataContext):
         self.execute_block_if_auto()
 
     def _regenerate_composite_block(self):
-        self._composite_block = Block((self.external_block, self._expression_block))
+        self._composite_block = self.block_class((self.external_block,
+                                                  self._expression_block))
         return
 
     def _regenerate_expression_block(self):
         exprs = ['%s = %s' % (var, expr) for var, expr in self._expressions.items()]
         expression_code = '\n'.join(exprs) + '\n'
-        self._expression_block = Block(expression_code)
+        self._expression_block = self.block_class(expression_code)
 
     @on_trait_change('data_context:items_modified')
     def _data_context_items_modified(self, event):
@@ -205,10 +214,10 @@ class FormulaExecutingContext(DataContext):
         return
 
     def __composite_block_default(self):
-        return Block('')
+        return self.block_class('')
 
     def __expression_block_default(self):
-        return Block('')
+        return self.block_class('')
 
 
 
@@ -0,0 +1,243 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+""" Define an IContext which executes code only to compute the values that
+are read from it.
+"""
+from __future__ import absolute_import
+
+from traits.api import (Any, Bool, Instance, Property, Str, Supports, Type,
+    Undefined, on_trait_change)
+
+from codetools.blocks.block import Block
+from codetools.contexts.data_context import DataContext
+from codetools.contexts.i_context import IListenableContext
+
+
+class LazyExecutingContext(DataContext):
+    """ A context which executes code on demand.
+
+    Setting a name doesn't execute anything: the names that the code
+    computes from it are only marked as dirty (and reported as modified in
+    an 'items_modified' event). Reading a dirty name executes the dirty
+    sub-blocks that it depends on, and nothing else, so the cost of
+    recomputation follows what is read instead of what is set.
+
+    The context holds a single value per name, so when the code binds a
+    name more than once, executing a sub-block that reads it also executes
+    the sub-block that writes the value it reads, and the last sub-block
+    that writes it gets dirty until it executes again.
+
+    >>> context = LazyExecutingContext(code='b = a * 2\\nc = b + 1\\nd = -a')
+    >>> context['a'] = 1
+    >>> sorted(context.dirty_names)
+    ['b', 'c', 'd']
+    >>> context['c']
+    3
+    >>> sorted(context.dirty_names)
+    ['d']
+    >>> context['d']
+    -1
+    """
+
+    # Override to provide a more specific requirement.
+    subcontext = Supports(IListenableContext, factory=DataContext,
+        rich_compare=False)
+
+    # The code to execute.
+    code = Str('pass')
+
+    # The class of the block that parses the code (see
+    # RestrictingCodeExecutable)
+    block_class = Type(Block)
+
+    # The names that the code computes and that are out of date
+    dirty_names = Property
+
+    # The block for 'code'
+    _block = Instance(Block)
+
+    # The sub-blocks (or the block itself if it doesn't decompose) that are
+    # out of date, their positions in the block, and the ones that import
+    # names (which aren't in the dep graph)
+    _dirty = Any(transient=True)
+    _positions = Any(transient=True)
+    _imports = Any(transient=True)
+
+    # The reverse of the block's '_dep_graph'
+    _dependents = Any(transient=True)
+
+    # The sub-blocks that write each name, in order
+    _writers = Any(transient=True)
+
+    # Whether we are executing sub-blocks for a read
+    _pulling = Bool(False, transient=True)
+
+    def __init__(self, **traits):
+        super(LazyExecutingContext, self).__init__(**traits)
+        if self._block is None:
+            self._code_changed(self.code)
+
+    #### IContext interface ####################################################
+
+    def __getitem__(self, key):
+        if self._is_dirty(key):
+            self._pull(key)
+        return self.subcontext[key]
+
+    def __setitem__(self, key, value):
+        self.subcontext[key] = value
+        self._mark_dirty(key)
+
+    def __delitem__(self, key):
+        del self.subcontext[key]
+        self._mark_dirty(key)
+
+    def __contains__(self, key):
+        return key in self.subcontext or self._is_dirty(key)
+
+    def keys(self):
+        keys = self.subcontext.keys()
+        keys.extend(self.dirty_names.difference(keys))
+        return keys
+
+    #### Trait Event Handlers ##################################################
+
+    def _code_changed(self, new):
+        block = self.block_class(new)
+        units = block.sub_blocks or [block]
+        self._block = block
+        self._positions = dict((unit, i) for i, unit in enumerate(units))
+        self._dirty = set(units)
+        self._imports = [unit for unit in units if unit.fromimports]
+        self._writers = {}
+        for unit in units:
+            for name in _root_names(unit.all_outputs):
+                self._writers.setdefault(name, []).append(unit)
+
+        self._dependents = {}
+        for node, deps in (block._dep_graph or {}).items():
+            for dep in deps:
+                self._dependents.setdefault(dep, set()).add(node)
+
+        self._fire_dirty(self.dirty_names)
+
+    def _block_class_changed(self):
+        self._code_changed(self.code)
+
+    @on_trait_change('subcontext.items_modified')
+    def subcontext_items_modified(self, event):
+        if event is Undefined:
+            # Nothing to do.
+            return
+
+        event.veto = True
+
+        # (The names computed for a read were reported when they got dirty)
+        if not self._pulling:
+            self._fire_event(added=event.added, removed=event.removed,
+                modified=event.modified, context=event.context)
+
+    #### Private interface #####################################################
+
+    def _get_dirty_names(self):
+        names = set()
+        for unit in self._dirty:
+            names.update(unit.all_outputs)
+            names.update(unit.fromimports)
+        return names
+
+    def _is_dirty(self, name):
+        "Whether the value of 'name' is out of date"
+        graph = self._block._dep_graph
+        if graph is not None and name in graph:
+            return any(dep in self._dirty for dep in graph[name])
+        elif graph is None and name in self._block.all_outputs:
+            return self._block in self._dirty
+        return any(name in unit.fromimports and unit in self._dirty
+                   for unit in self._imports)
+
+    def _mark_dirty(self, name):
+        """ Mark what the code computes from 'name' as dirty, and report the
+        names that got dirty.
+        """
+        graph = self._block._dep_graph
+        if graph is None:
+            if name in self._block.inputs | self._block.all_outputs:
+                dirty = set([self._block]) - self._dirty
+            else:
+                dirty = set()
+        else:
+            # The sub-blocks that read 'name' as an input of the block, or
+            # that depend on the sub-blocks that write it
+            starts = list(self._dependents.get(name, ()))
+            for producer in graph.get(name, ()):
+                starts.extend(self._dependents.get(producer, ()))
+            dirty = set()
+            while starts:
+                node = starts.pop()
+                if isinstance(node, Block) and node not in self._dirty and \
+                       node not in dirty:
+                    dirty.add(node)
+                    starts.extend(self._dependents.get(node, ()))
+
+        self._dirty.update(dirty)
+        names = set()
+        for unit in dirty:
+            names.update(unit.all_outputs)
+        names.discard(name)
+        self._fire_dirty(names)
+
+    def _fire_dirty(self, names):
+        added = [name for name in names if name not in self.subcontext]
+        modified = [name for name in names if name in self.subcontext]
+        self._fire_event(added=added, modified=modified)
+
+    def _pull(self, name):
+        "Execute the dirty sub-blocks that 'name' depends on"
+        graph = self._block._dep_graph
+        if graph is None:
+            needed = set(self._dirty)
+        else:
+            # (The imports aren't in the dep graph, so they all run first)
+            needed = set(self._dirty.intersection(self._imports))
+            todo = [node for node in graph.get(name, ())
+                    if node in self._dirty]
+            while todo:
+                unit = todo.pop()
+                if unit in needed:
+                    continue
+                needed.add(unit)
+                # (A dependency that writes a name that something else
+                # rebinds has to run again for its value to be the one read)
+                inputs = _root_names(unit.inputs)
+                for node in graph.get(unit, ()):
+                    if node in self._dirty or (
+                            isinstance(node, Block) and
+                            any(len(self._writers[n]) > 1 for n in
+                                inputs.intersection(
+                                    _root_names(node.all_outputs)))):
+                        todo.append(node)
+
+        self._pulling = True
+        try:
+            for unit in sorted(needed, key=self._positions.__getitem__):
+                unit.execute(self.subcontext, {})
+                self._dirty.discard(unit)
+                # (Until the last writer of a name runs, its value isn't the
+                # final one)
+                for output in _root_names(unit.all_outputs):
+                    last = self._writers[output][-1]
+                    if last is not unit:
+                        self._dirty.add(last)
+        finally:
+            self._pulling = False
+
+
+def _root_names(names):
+    "The names, without any dotted suffixes"
+    return set(name.split('.', 1)[0] for name in names)
@@ -0,0 +1,333 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All right reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+from __future__ import absolute_import
+
+from cPickle import HIGHEST_PROTOCOL, dumps, loads
+from importlib import import_module
+from compiler.ast import Class, From, Function, GenExpr, Import, Lambda, Yield
+import os
+from shutil import rmtree
+from tempfile import mkdtemp, mkstemp
+import types
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from numpy import load, memmap, ndarray, save
+
+from traits.api import (Bool, Dict, HasStrictTraits, Instance, Int, Str,
+        adapt, on_trait_change, provides)
+from codetools.blocks.block import Block, _mutated_names
+from codetools.contexts.i_context import IContext
+from codetools.execution.interfaces import IExecutable
+from codetools.util.cache import LRUCache
+
+
+@provides(IExecutable)
+class ProcessPoolCodeExecutable(HasStrictTraits):
+    """ IExecutable that executes a piece of code on a process pool,
+    optionally restricting beforehand
+
+    The (restricted) block runs wave by wave, as in 'Block.execute' with an
+    executor: the sub-blocks in a wave are independent, and each one is
+    pickled and sent to a worker process along with the values of its
+    inputs. Large arrays don't go through the pickle: they are saved to
+    files in a memory-backed temporary directory and memory-mapped on the
+    other side.
+
+    Sub-blocks that define or import things (functions, classes, lambdas,
+    generators, modules), sub-blocks that change objects from the context in
+    place (by setting their items or attributes, or by calling their
+    methods), and sub-blocks whose inputs can't be pickled run in this
+    process instead. Changes made by the workers to 'globals', or to inputs
+    passed to functions that change them, are not sent back.
+
+    """
+
+    # The code to execute.
+    code = Str('pass')
+
+    # The process pool to run sub-blocks on. By default we create one (and
+    # shut it down in 'shutdown').
+    executor = Instance(Executor)
+
+    # Arrays of at least this many bytes go through memory-mapped files.
+    shared_memory_threshold = Int(2**16)
+
+    # The block that handles code restriction
+    _block = Instance(Block)
+
+    # The pickled sub-blocks, by uuid
+    _pickled_blocks = Dict
+
+    # Whether we created 'executor'
+    _owns_executor = Bool(False)
+
+    # The directory holding the memory-mapped files, created on demand
+    _shared_directory = Str
+
+    def execute(self, context, globals=None, inputs=None, outputs=None):
+        """ Execute code in context, optionally restricting on inputs or
+        outputs if supplied
+
+        Parameters
+        ----------
+        context : Dict-like
+        globals : Dict-like, optional
+        inputs : List of strings, options
+        outputs : List of strings, optional
+
+        Returns
+        -------
+        inputs : set
+            the inputs to the restricted block
+        outpus : set
+            the outputs of the restricted block
+
+        """
+        icontext = adapt(context, IContext)
+
+        if globals is None:
+            globals = {}
+        if inputs is None:
+            inputs = []
+        if outputs is None:
+            outputs = []
+
+        #If called with no inputs or outputs the full block executes
+        if inputs or outputs:
+            block = self._block.restrict(inputs=inputs, outputs=outputs)
+        else:
+            block = self._block
+
+        if len(block.sub_blocks) == 0:
+            block.execute(icontext, global_context=globals)
+        else:
+            for wave in block._get_execution_waves():
+                self._execute_wave(wave, icontext, globals)
+        return block.inputs, block.outputs
+
+    def shutdown(self):
+        """ Shut down the process pool if we created it, and remove our
+        temporary files.
+
+        """
+        if self._owns_executor:
+            self.executor.shutdown()
+            # (A later 'execute' creates a new pool)
+            self._owns_executor = False
+            self.reset_traits(['executor'])
+        if self._shared_directory:
+            rmtree(self._shared_directory, ignore_errors=True)
+            self._shared_directory = ''
+
+    ###########################################################################
+    # Protected interface
+    ###########################################################################
+
+    def _execute_wave(self, wave, context, globals):
+        """ Execute independent sub-blocks, writing their outputs back in the
+        order of 'wave'.
+
+        If some sub-blocks fail, the rest of the wave still runs and we raise
+        the first exception afterwards.
+
+        """
+        files = []
+        try:
+            # Send everything we can to the workers first
+            globals = dict((name, value) for name, value in globals.iteritems()
+                           if name != '__builtins__')
+            futures = []
+            for block in wave:
+                future = None
+                if not _runs_locally(block):
+                    names = set(name.split('.', 1)[0] for name in block.inputs)
+                    values = dict((name, context[name]) for name in names
+                                  if name in context)
+                    try:
+                        args = (block.uuid, self._pickle_block(block),
+                                self._dumps(values, files),
+                                self._dumps(globals, files),
+                                _output_names(block),
+                                self._get_shared_directory(),
+                                self.shared_memory_threshold)
+                    except Exception:
+                        pass
+                    else:
+                        future = self.executor.submit(_execute_in_worker,
+                                                      *args)
+                futures.append(future)
+
+            exception = None
+            for block, future in zip(wave, futures):
+                try:
+                    if future is None:
+                        block.execute(context, globals)
+                        continue
+                    result = future.result()
+                    if result is None:
+                        # Some output couldn't be pickled
+                        block.execute(context, globals)
+                        continue
+                    for name, value in _loads(result, remove=True).iteritems():
+                        context[name] = value
+                except Exception, e:
+                    if exception is None:
+                        exception = e
+            if exception is not None:
+                raise exception
+        finally:
+            for filename in files:
+                _remove(filename)
+
+    def _pickle_block(self, block):
+        if block.uuid not in self._pickled_blocks:
+            self._pickled_blocks[block.uuid] = dumps(block, HIGHEST_PROTOCOL)
+        return self._pickled_blocks[block.uuid]
+
+    def _dumps(self, values, files):
+        return _dumps(values, self._get_shared_directory(),
+                      self.shared_memory_threshold, files)
+
+    def _get_shared_directory(self):
+        if not self._shared_directory:
+            shm = '/dev/shm'
+            self._shared_directory = mkdtemp(
+                prefix='codetools-', dir=shm if os.path.isdir(shm) else None)
+        return self._shared_directory
+
+    def _executor_default(self):
+        self._owns_executor = True
+        return ProcessPoolExecutor()
+
+    @on_trait_change('code')
+    def _code_changed(self, new):
+        self._block = Block(new)
+        self._pickled_blocks = {}
+
+###############################################################################
+# Transfer
+###############################################################################
+
+# The sub-blocks each worker process has already unpickled, by uuid
+_worker_blocks = LRUCache(max_entries=256)
+
+def _execute_in_worker(uuid, pickled_block, values, globals, output_names,
+                       directory, threshold):
+    """ Execute a pickled sub-block in a worker process.
+
+    Returns the pickled outputs, or None if they can't be pickled.
+
+    """
+    block = _worker_blocks.get(uuid)
+    if block is None:
+        block = _worker_blocks[uuid] = loads(pickled_block)
+    context = _loads(values)
+    block.execute(context, _loads(globals))
+    outputs = dict((name, context[name]) for name in output_names
+                   if name in context)
+    files = []
+    try:
+        return _dumps(outputs, directory, threshold, files)
+    except Exception:
+        for filename in files:
+            _remove(filename)
+        return None
+
+class _SharedArray(object):
+    'A reference to an array saved in a file that we can memory-map'
+
+    def __init__(self, filename):
+        self.filename = filename
+
+class _SharedModule(object):
+    'A reference to a module, by name'
+
+    def __init__(self, name):
+        self.name = name
+
+def _dumps(values, directory, threshold, files):
+    """ Pickle a dict, saving large arrays to files in 'directory' (which are
+    appended to 'files') instead.
+
+    """
+    shared = {}
+    encoded = {}
+    for name, value in values.iteritems():
+        if id(value) in shared:
+            value = shared[id(value)]
+        elif type(value) in (ndarray, memmap) and not value.dtype.hasobject \
+                 and value.nbytes >= threshold:
+            fd, filename = mkstemp(suffix='.npy', dir=directory)
+            files.append(filename)
+            with os.fdopen(fd, 'wb') as f:
+                save(f, value)
+            value = shared[id(value)] = _SharedArray(filename)
+        elif isinstance(value, types.ModuleType):
+            value = _SharedModule(value.__name__)
+        encoded[name] = value
+    return dumps(encoded, HIGHEST_PROTOCOL)
+
+def _loads(s, remove=False):
+    """ Unpickle a dict pickled by '_dumps', removing the array files once
+    they're mapped if 'remove'.
+
+    Arrays are mapped copy-on-write, so changing them doesn't change the
+    files.
+
+    """
+    values = loads(s)
+    arrays = {}
+    for name, value in values.iteritems():
+        if isinstance(value, _SharedArray):
+            if value.filename not in arrays:
+                arrays[value.filename] = load(value.filename, mmap_mode='c')
+                if remove:
+                    _remove(value.filename)
+            values[name] = arrays[value.filename].view(ndarray)
+        elif isinstance(value, _SharedModule):
+            values[name] = import_module(value.name)
+    return values
+
+def _remove(filename):
+    # (An open memory map keeps the data alive on POSIX; elsewhere the file
+    # stays until 'shutdown')
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+###############################################################################
+# Sub-block classification
+###############################################################################
+
+# Nodes whose values either can't be pickled or only make sense in the
+# process that executes them
+_LOCAL_NODES = (Class, From, Function, GenExpr, Import, Lambda, Yield)
+
+def _runs_locally(block):
+    'Whether a sub-block has to run in this process'
+    # (Changes to objects in place would be made to copies in the worker)
+    if _mutated_names(block.ast):
+        return True
+    names = set(name for name in block.all_outputs if '.' not in name)
+    for name in block.all_outputs:
+        if '.' in name and name.split('.', 1)[0] not in names:
+            return True
+    todo = [block.ast]
+    while todo:
+        node = todo.pop()
+        if isinstance(node, _LOCAL_NODES):
+            return True
+        todo.extend(node.getChildNodes())
+    return False
+
+def _output_names(block):
+    'The names a sub-block can write, without dotted suffixes'
+    # (Dotted names of objects from the context run locally, so the others
+    # belong to objects the sub-block binds itself)
+    return sorted(set(name.split('.', 1)[0] for name in block.all_outputs))
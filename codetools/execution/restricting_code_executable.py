@@ -7,9 +7,12 @@
 #
 from __future__ import absolute_import
 
-from traits.api import (HasStrictTraits, Str, provides, Instance,
-        adapt, on_trait_change)
-from codetools.blocks.block import Block
+import threading
+
+from traits.api import (Any, Bool, HasStrictTraits, Str, provides, Instance,
+        Type, adapt, on_trait_change)
+from codetools.blocks.block import Block, _reads_namespace
+from codetools.blocks.memo import SubBlockMemo
 from codetools.execution.interfaces import IExecutable
 from codetools.contexts.i_context import IContext
 
@@ -23,9 +26,30 @@ class RestrictingCodeExecutable(HasStrictTraits):
     # The code to execute.
     code = Str('pass')
 
+    # If given, remembers the outputs of sub-blocks so that re-executing
+    # them with the same inputs is skipped. (Only for pure code; see
+    # SubBlockMemo.)
+    memo = Instance(SubBlockMemo)
+
+    # Whether to run the block as a generated function, whose variables are
+    # fast locals, writing its outputs back into the context at the end (see
+    # 'Block.execute_fast'). This is faster for code with loops, but names
+    # that the code binds are only bound in the context once it stops.
+    fast_locals = Bool(False)
+
+    # The class of the block that parses and restricts the code. (Use
+    # 'codetools.blocks2.api.Block' for blocks on the standard 'ast' module,
+    # which parse and compile faster.)
+    block_class = Type(Block)
+
     # The block that handles code restriction
     _block = Instance(Block)
 
+    # Held while the block executes or changes, since changing the code
+    # edits the block in place (and AsyncExecutingContext changes it while
+    # another thread executes it)
+    _lock = Any(transient=True)
+
     def execute(self, context, globals=None, inputs=None, outputs=None):
         """ Execute code in context, optionally restricting on inputs or
         outputs if supplied
@@ -54,14 +78,58 @@ class RestrictingCodeExecutable(HasStrictTraits):
         if outputs is None:
             outputs = []
 
+        with self._lock:
+            block = self._restricted_block(inputs, outputs)
+            if self.memo is not None:
+                block.execute(icontext, global_context=globals,
+                              memo=self.memo)
+            elif self.fast_locals:
+                block.execute_fast(icontext, global_context=globals)
+            else:
+                block.execute(icontext, global_context=globals)
+            return block.inputs, block.outputs
+
+    def get_names(self, inputs=None, outputs=None):
+        """ Return the names that 'execute' with the same inputs and outputs
+        might read from or bind in the context, or None if it might look at
+        the context as a whole (with 'exec', 'eval', 'locals' and the like).
+
+        (ExecutingContext uses this to copy just these names out of its
+        subcontext when 'execute_in_dict' is set.)
+
+        """
+        with self._lock:
+            block = self._restricted_block(inputs or [], outputs or [])
+            if any(_reads_namespace(sub_block._code)
+                   for sub_block in block.sub_blocks or [block]):
+                return None
+            return set(name.split('.', 1)[0] for name in
+                       block.inputs | block.all_outputs | block.fromimports)
+
+    def _restricted_block(self, inputs, outputs):
         #If called with no inputs or outputs the full block executes
         if inputs or outputs:
-            block = self._block.restrict(inputs=inputs, outputs=outputs)
+            return self._block.restrict(inputs=inputs, outputs=outputs)
         else:
-            block = self._block
-        block.execute(icontext, global_context=globals)
-        return block.inputs, block.outputs
+            return self._block
 
     @on_trait_change('code')
     def _code_changed(self, new):
-        self._block = Block(new)
+        # Keep the sub-blocks (and the caches that go with them) of the
+        # statements that didn't change. (The memo remembers sub-blocks by
+        # uuid, so its entries for those sub-blocks stay valid too.)
+        if self._block is None:
+            self._block = self.block_class(new)
+        else:
+            with self._lock:
+                self._block.reparse(new)
+            self.trait_property_changed('_block', self._block, self._block)
+
+    def _block_class_changed(self, new):
+        if self._block is not None:
+            self._block = new(self.code)
+
+    def __lock_default(self):
+        # (Reentrant, so that listeners called during an execution can still
+        # change the code)
+        return threading.RLock()
@@ -1,4 +1,6 @@
 
+from nose.tools import assert_raises
+
 from codetools.contexts.api import DataContext
 
 from codetools.execution.executing_context import (CodeExecutable,
@@ -50,3 +52,80 @@ def test_code_executable():
     ce.execute(d)
     assert 'c' in d
     assert d['c'] == 3
+
+def test_profile_lookups():
+    """ Does an ExecutingContext report the lookups of its executions?
+    """
+    d = DataContext()
+    d['a'] = 1
+    ec = ExecutingContext(subcontext=d, executable=ce)
+    ec['b'] = 2
+    assert ec.lookup_report is None
+
+    ec.profile_lookups = True
+    ec['b'] = 3
+    assert ec['c'] == 4
+    names = dict((n.name, n) for n in ec.lookup_report.names)
+    assert (names['a'].reads, names['b'].reads, names['c'].writes) == (1, 1, 1)
+    assert ec.lookup_report.events == 1
+
+def test_execute_in_dict():
+    """ Does executing in a dict give the same results, with one event?
+    """
+    d = DataContext()
+    d['a'] = 1
+    d['b'] = 2
+    d['t'] = 0
+    executable = CodeExecutable(code="c = a + b\nd = c * 2\ndel t")
+    ec = ExecutingContext(subcontext=d, executable=executable,
+                          execute_in_dict=True)
+    events = []
+    ec.on_trait_change(lambda event: events.append(event), 'items_modified')
+    ec.execute_for_names(None)
+    assert (ec['c'], ec['d']) == (3, 6)
+    assert 't' not in ec
+    assert len(events) == 1
+    assert sorted(events[0].added) == ['c', 'd']
+    assert events[0].removed == ['t']
+
+    ec.executable = ce
+    ec.profile_lookups = True
+    ec['a'] = 2
+    assert ec['c'] == 4
+    names = dict((n.name, n) for n in ec.lookup_report.names)
+    assert (names['a'].reads, names['c'].writes) == (1, 1)
+
+def test_execute_in_dict_errors():
+    """ Are the changes made before an exception kept when executing in a
+    dict?
+    """
+    d = DataContext()
+    d['a'] = 1
+    d['t'] = 0
+    executable = CodeExecutable(code="x = a + 1\ndel t\ny = 1 / 0")
+    ec = ExecutingContext(subcontext=d, executable=executable,
+                          execute_in_dict=True)
+    assert_raises(ZeroDivisionError, ec.execute_for_names, None)
+    assert ec['x'] == 2
+    assert 't' not in ec
+
+def test_update_many():
+    """ Does update_many() execute once, with one event?
+    """
+    executions = []
+    executable = CodeExecutable(code="executions.append(a)\nc = a + 1")
+    ec = ExecutingContext(subcontext=DataContext(subcontext={
+        'executions': executions}), executable=executable)
+    events = []
+    ec.on_trait_change(lambda event: events.append(event), 'items_modified')
+    ec.update_many({'a': 1, 'b': 2})
+    assert ec['c'] == 2
+    assert executions == [1]
+    assert len(events) == 1
+    assert sorted(events[0].added) == ['a', 'b', 'c']
+
+    ec.delete_many(['b', 'c'])
+    assert sorted(ec.keys()) == ['a', 'c', 'executions']
+    assert executions == [1, 1]
+    assert len(events) == 2
+    assert 'b' in events[1].removed
@@ -1,3 +1,4 @@
+from codetools.blocks2.api import Block as AstBlock
 from codetools.contexts.api import DataContext
 from codetools.execution.api import ExpressionContext
 
@@ -11,6 +12,14 @@ class ExpressionContextTest(unittest.TestCase):
         ec = ExpressionContext(d)
         self.assertEqual(200, ec['a*b'])
 
+    def test_block_class(self):
+        d = DataContext()
+        d['a'] = 10
+        d['b'] = 20
+        ec = ExpressionContext(d, block_class=AstBlock)
+        self.assertEqual(200, ec['a*b'])
+        self.assertEqual(['a*b'], ec._dependencies['a'])
+
     def test_events(self):
         self.last_event = None
         self.event_count = 0
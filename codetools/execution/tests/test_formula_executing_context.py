@@ -1,5 +1,6 @@
 from unittest import TestCase
 
+from codetools.blocks2.api import Block as AstBlock
 from codetools.execution.formula_executing_context import \
     FormulaExecutingContext
 from codetools.contexts.data_context import DataContext
@@ -21,3 +22,13 @@ class FormulaExecutingContextTest(TestCase):
         e['f'] = '=a*100'
         assert(e.data_context['f'] == 500)
         assert(e['f'] == '500=a*100')
+
+    def test_block_class(self):
+        e = FormulaExecutingContext(block_class=AstBlock)
+        e.data_context = DataContext()
+        e.data_context['a'] = 5
+        e.external_code = "b=a*10\n"
+        assert(isinstance(e._composite_block, AstBlock))
+        assert(e.data_context['b'] == 50)
+        e['f'] = '=b+a'
+        assert(e.data_context['f'] == 55)
@@ -0,0 +1,125 @@
+import sys
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from traits.testing.api import doctest_for_module
+
+from codetools.blocks.api import Block
+from codetools.blocks2.api import Block as AstBlock
+from codetools.contexts.api import DataContext
+import codetools.execution.lazy_executing_context as lazy_executing_context
+from codetools.execution.lazy_executing_context import LazyExecutingContext
+
+CODE = """import math
+aa = 2 * a
+bb = 2 * b
+c = aa + bb
+d = math.sqrt(a)
+"""
+
+
+class LazyExecutingContextDocTestCase(doctest_for_module(
+    lazy_executing_context)):
+    pass
+
+
+class TestLazyExecutingContext(unittest.TestCase):
+
+    block_class = Block
+
+    def setUp(self):
+        self.context = LazyExecutingContext(code=CODE,
+                                            block_class=self.block_class)
+        self.context['a'] = 4.0
+        self.context['b'] = 10.0
+        self.events = []
+
+    def test_read(self):
+        self.assertEqual(self.context['c'], 28.0)
+        self.assertEqual(self.context.dirty_names, set(['d']))
+        self.assertTrue('math' in self.context.subcontext)
+        self.assertEqual(self.context['d'], 2.0)
+        self.assertEqual(self.context.dirty_names, set())
+
+    def test_write_marks_downstream(self):
+        self.context['c']
+        self.context['d']
+        self.context['b'] = 1.0
+        self.assertEqual(self.context.dirty_names, set(['bb', 'c']))
+        self.assertEqual(self.context['c'], 10.0)
+        self.assertEqual(self.context.subcontext['d'], 2.0)
+
+    def test_executes_only_what_is_read(self):
+        self.context['c']
+        self.context['d']
+        self.context['a'] = 9.0
+        # (Count the sub-blocks run by the names they write)
+        self.context.subcontext.on_trait_change(self._record_event,
+                                                'items_modified',
+                                                priority=True)
+        self.assertEqual(self.context['d'], 3.0)
+        self.assertEqual([e.modified for e in self.events], [['d']])
+        self.assertEqual(self.context.dirty_names, set(['aa', 'c']))
+        self.assertEqual(self.context['c'], 38.0)
+
+    def test_keys_and_contains(self):
+        self.assertTrue('c' in self.context)
+        self.assertTrue('z' not in self.context)
+        self.assertEqual(set(self.context.keys()),
+                         set(['a', 'b', 'aa', 'bb', 'c', 'd', 'math']))
+        self.assertTrue('c' not in self.context.subcontext)
+
+    def test_events(self):
+        self.context['c']
+        self.context.on_trait_change(self._record_event, 'items_modified')
+        self.context['b'] = 1.0
+        self.assertEqual([(sorted(e.added), sorted(e.modified))
+                          for e in self.events],
+                         [([], ['b']), ([], ['bb', 'c'])])
+        # Reading doesn't report the names again
+        self.context['c']
+        self.assertEqual(len(self.events), 2)
+
+    def test_code_changing(self):
+        self.context['c']
+        self.context.on_trait_change(self._record_event, 'items_modified')
+        self.context.code = 'e = a + b'
+        self.assertEqual([sorted(e.added) for e in self.events], [['e']])
+        self.assertEqual(self.context['e'], 14.0)
+
+    def test_rebinding(self):
+        context = LazyExecutingContext(code='x0 = a\nx0 = b + x0\n',
+                                       block_class=self.block_class)
+        context['a'] = 6
+        context['b'] = 6
+        self.assertEqual(context['x0'], 12)
+        context['b'] = 6
+        self.assertEqual(context['x0'], 12)
+
+        context.code = 'x0 = a\ny = x0\nx0 = b\n'
+        self.assertEqual(context['x0'], 6)
+        context['a'] = 1
+        self.assertEqual(context['y'], 1)
+        self.assertEqual(context.dirty_names, set(['x0']))
+        self.assertEqual(context['x0'], 6)
+
+    def test_subcontext(self):
+        subcontext = DataContext(subcontext={'a': 1.0, 'b': 2.0})
+        context = LazyExecutingContext(subcontext=subcontext, code=CODE,
+                                       block_class=self.block_class)
+        self.assertEqual(context['c'], 6.0)
+        self.assertEqual(subcontext['c'], 6.0)
+
+    def _record_event(self, event):
+        self.events.append(event)
+
+
+class TestLazyExecutingContextAst(TestLazyExecutingContext):
+
+    block_class = AstBlock
+
+
+if __name__ == '__main__':
+    unittest.main()
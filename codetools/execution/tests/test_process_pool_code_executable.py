@@ -0,0 +1,124 @@
+import os
+import sys
+if sys.version_info[:2] < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from concurrent.futures import ProcessPoolExecutor
+from numpy import arange, ndarray
+from numpy.testing import assert_array_equal
+
+from codetools.execution.process_pool_code_executable import (
+        ProcessPoolCodeExecutable)
+
+CODE = """aa = 2 * a
+bb = 2 * b
+c = a + b + aa + bb
+"""
+
+
+class TestProcessPoolCodeExecutable(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.executor = ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def setUp(self):
+        self.pool_exec = ProcessPoolCodeExecutable(code=CODE,
+                executor=self.executor)
+        self.context = {'a': 1, 'b': 10}
+
+    def tearDown(self):
+        self.pool_exec.shutdown()
+
+    def test_execute(self):
+        self.pool_exec.execute(self.context)
+        expected_context = {'a': 1, 'b': 10, 'aa': 2, 'bb': 20, 'c': 33}
+        self.assertEqual(self.context, expected_context)
+
+    def test_restrict_on_inputs(self):
+        context = {'a': 1, 'b': 10, 'bb': 100}
+        inputs, outputs = self.pool_exec.execute(context, inputs=['a'])
+        self.assertEqual(context['bb'], 100)
+        self.assertEqual(context['c'], 113)
+        self.assertEqual(outputs, set(['aa', 'c']))
+
+    def test_restrict_on_outputs(self):
+        context = {'b': 10, 'bb': 100}
+        self.pool_exec.execute(context, outputs=['bb'])
+        self.assertEqual(context, {'b': 10, 'bb': 20})
+
+    def test_shared_arrays(self):
+        self.pool_exec.shared_memory_threshold = 1000
+        self.pool_exec.code = "b = a * 2\nc = a + 1\nd = a[:10].sum()\n"
+        context = {'a': arange(10000.0)}
+        self.pool_exec.execute(context)
+        self.assertEqual(type(context['b']), ndarray)
+        assert_array_equal(context['b'], arange(10000.0) * 2)
+        assert_array_equal(context['c'], arange(10000.0) + 1)
+        self.assertEqual(context['d'], 45)
+        # The files are gone once the outputs are mapped
+        self.assertEqual(os.listdir(self.pool_exec._shared_directory), [])
+
+    def test_local_sub_blocks(self):
+        self.pool_exec.code = ("from math import sqrt\n"
+                               "f = lambda x: x + 1\n"
+                               "a = sqrt(b)\n"
+                               "c = f(a)\n")
+        context = {'b': 16}
+        self.pool_exec.execute(context)
+        self.assertEqual(context['a'], 4)
+        self.assertEqual(context['c'], 5)
+
+    def test_errors(self):
+        self.pool_exec.code = "a = b\nc = 1 / d\ne = 2\n"
+        context = {'d': 0}
+        self.assertRaises(NameError, self.pool_exec.execute, context)
+        self.assertEqual(context, {'d': 0, 'e': 2})
+
+    def test_changes_in_place(self):
+        self.pool_exec.code = ("lst.append(a)\n"
+                               "d['k'] = a\n"
+                               "arr[0] = a\n"
+                               "arr[1:2] += a\n"
+                               "b = a + 1\n")
+        lst, d, arr = [], {}, arange(3)
+        context = {'a': 5, 'lst': lst, 'd': d, 'arr': arr}
+        self.pool_exec.execute(context)
+        self.assertEqual(lst, [5])
+        self.assertEqual(d, {'k': 5})
+        assert_array_equal(arr, [5, 6, 2])
+        self.assertEqual(context['b'], 6)
+
+    def test_dotted_outputs(self):
+        self.pool_exec.code = "o.x = o.y + a\n"
+        o = _Object()
+        o.y = 1
+        context = {'a': 2, 'o': o}
+        self.pool_exec.execute(context)
+        self.assertIs(context['o'], o)
+        self.assertEqual(o.x, 3)
+
+    def test_execute_after_shutdown(self):
+        pool_exec = ProcessPoolCodeExecutable(code=CODE)
+        try:
+            pool_exec.execute(self.context)
+            pool_exec.shutdown()
+            context = {'a': 2, 'b': 20}
+            pool_exec.execute(context)
+            self.assertEqual(context['c'], 66)
+        finally:
+            pool_exec.shutdown()
+
+
+class _Object(object):
+    pass
+
+
+if __name__ == '__main__':
+    unittest.main()
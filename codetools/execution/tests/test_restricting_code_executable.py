@@ -1,9 +1,12 @@
 import sys
+import threading
 if sys.version_info[:2] < (2, 7):
     import unittest2 as unittest
 else:
     import unittest
 
+from codetools.blocks.api import Block, SubBlockMemo
+from codetools.blocks2.api import Block as AstBlock
 from codetools.execution.executing_context import ExecutingContext
 from codetools.execution.restricting_code_executable import (
         RestrictingCodeExecutable)
@@ -16,8 +19,11 @@ c = a + b + aa + bb
 
 class TestRestrictingCodeExecutable(unittest.TestCase):
 
+    block_class = Block
+
     def setUp(self):
-        self.restricting_exec = RestrictingCodeExecutable(code=CODE)
+        self.restricting_exec = RestrictingCodeExecutable(
+            code=CODE, block_class=self.block_class)
         self.context = {'a': 1, 'b': 10}
         self.events = []
 
@@ -57,9 +63,108 @@ class TestRestrictingCodeExecutable(unittest.TestCase):
         expected_context = {'a': 1, 'b': 10, 'aa': 2, 'bb': 5, 'c': 18}
         self.assertEqual(self.context, expected_context)
 
+    def test_execute_in_dict(self):
+        executing_context = ExecutingContext(executable=self.restricting_exec,
+                subcontext=self.context, execute_in_dict=True)
+        executing_context.execute_for_names(None)
+        executing_context.on_trait_change(self._change_detect, 'items_modified')
+        executing_context['a'] = 5
+        # One event for 'a', and one for all of the outputs
+        self.assertEqual(self.events, ['fired', 'fired'])
+        expected_context = {'a': 5, 'b': 10, 'aa': 10, 'bb': 20, 'c': 45}
+        self.assertEqual(self.context, expected_context)
+
+    def test_get_names(self):
+        self.assertEqual(self.restricting_exec.get_names(),
+                         set(['a', 'b', 'aa', 'bb', 'c']))
+        self.assertEqual(self.restricting_exec.get_names(inputs=['a']),
+                         set(['a', 'b', 'aa', 'bb', 'c']))
+        self.assertEqual(self.restricting_exec.get_names(outputs=['bb']),
+                         set(['b', 'bb']))
+        restricting_exec = RestrictingCodeExecutable(
+            code='b = eval("a")', block_class=self.block_class)
+        self.assertIs(restricting_exec.get_names(), None)
+
+    def test_memo(self):
+        memo = SubBlockMemo()
+        restricting_exec = RestrictingCodeExecutable(
+            code=CODE, memo=memo, block_class=self.block_class)
+        restricting_exec.execute(self.context)
+        self.context['a'] = 1
+        restricting_exec.execute(self.context, inputs=['a'])
+        self.assertEqual(memo.info().hits, 2)
+        self.assertEqual(self.context['c'], 33)
+
+    def test_code_editing(self):
+        old_block = self.restricting_exec._block
+        kept = old_block.sub_blocks[:2]
+        self.restricting_exec.code = CODE.replace('c = a + b', 'c = a - b')
+        block = self.restricting_exec._block
+        self.assertIs(block, old_block)
+        self.assertEqual(block.sub_blocks[:2], kept)
+        self.restricting_exec.execute(self.context)
+        self.assertEqual(self.context['c'], 13)
+
+    def test_code_editing_while_executing(self):
+        started, finish = threading.Event(), threading.Event()
+        def wait():
+            started.set()
+            finish.wait()
+        code = 'wait()\n' + CODE
+        self.restricting_exec.code = code
+        self.context['wait'] = wait
+        executing = threading.Thread(target=self.restricting_exec.execute,
+                                     args=(self.context,))
+        executing.start()
+        started.wait()
+
+        # The edit waits for the execution to finish
+        editing = threading.Thread(target=setattr,
+            args=(self.restricting_exec, 'code',
+                  code.replace('c = a + b', 'c = a - b')))
+        editing.start()
+        try:
+            editing.join(0.1)
+            self.assertTrue(editing.is_alive())
+        finally:
+            finish.set()
+            executing.join()
+            editing.join()
+        self.assertEqual(self.context['c'], 33)
+        self.restricting_exec.execute(self.context)
+        self.assertEqual(self.context['c'], 13)
+
+    def test_fast_locals(self):
+        for fast_locals in (False, True):
+            self.restricting_exec.fast_locals = fast_locals
+            self.restricting_exec.code = "if a:\n    y = 1\nz = y\n"
+            context = {'a': 0}
+            self.restricting_exec.execute(context, {'y': 5})
+            self.assertEqual(context, {'a': 0, 'z': 5})
+
+            self.restricting_exec.code = "x = 1\ny = 1 / 0\n"
+            context = {}
+            self.assertRaises(ZeroDivisionError,
+                              self.restricting_exec.execute, context)
+            self.assertEqual(context, {'x': 1})
+
+    def test_block_class(self):
+        self.assertIsInstance(self.restricting_exec._block, self.block_class)
+
     def _change_detect(self):
         self.events.append('fired')
 
 
+class TestRestrictingCodeExecutableAst(TestRestrictingCodeExecutable):
+
+    block_class = AstBlock
+
+    def test_block_class_changing(self):
+        self.restricting_exec.block_class = Block
+        self.assertIs(type(self.restricting_exec._block), Block)
+        self.restricting_exec.execute(self.context)
+        self.assertEqual(self.context['c'], 33)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,135 @@
+#
+# (C) Copyright 2013 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+# This file is open source software distributed according to the terms in
+# LICENSE.txt
+#
+'Bounded caches'
+
+from collections import namedtuple, OrderedDict
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions size max_entries')
+
+class LRUCache(object):
+    ''' A mapping that holds at most 'max_entries' entries, evicting the least
+        recently used ones first, and that counts its hits, misses and
+        evictions.
+
+        Only 'get' counts as a use of an entry; the dict-like methods don't
+        touch the counters or the order of use.
+
+        If 'max_size' is given, the cache also evicts entries until the sum
+        of 'sizeof(value)' over its values is at most 'max_size' (an entry
+        bigger than that isn't kept at all).
+
+        >>> c = LRUCache(max_entries=2)
+        >>> c['a'] = 1; c['b'] = 2
+        >>> c.get('a')
+        1
+        >>> c['c'] = 3
+        >>> sorted(c.keys())
+        ['a', 'c']
+        >>> c.get('b') is None
+        True
+        >>> c.info()
+        CacheInfo(hits=1, misses=1, evictions=1, size=2, max_entries=2)
+
+        >>> c = LRUCache(max_size=10, sizeof=len)
+        >>> c['a'] = 'x' * 6; c['b'] = 'x' * 3; c.total_size
+        9
+        >>> c['c'] = 'x' * 4; sorted(c.keys()), c.total_size
+        (['b', 'c'], 7)
+    '''
+
+    def __init__(self, max_entries=128, max_size=None, sizeof=None):
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self.total_size = 0
+        self.sizeof = sizeof
+        self._max_size = max_size
+        self.max_entries = max_entries
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        "Look up 'key', marking it as the most recently used entry"
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+    def info(self):
+        "Return the counters and the size of the cache"
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         len(self._entries), self.max_entries)
+
+    def _get_max_entries(self):
+        return self._max_entries
+
+    def _set_max_entries(self, max_entries):
+        if max_entries < 0:
+            raise ValueError('max_entries must be non-negative, got %r'
+                             % max_entries)
+        self._max_entries = max_entries
+        self._evict()
+
+    max_entries = property(_get_max_entries, _set_max_entries)
+
+    def _get_max_size(self):
+        return self._max_size
+
+    def _set_max_size(self, max_size):
+        self._max_size = max_size
+        self._evict()
+
+    max_size = property(_get_max_size, _set_max_size)
+
+    def _evict(self):
+        while len(self._entries) > self._max_entries or \
+                  (self._max_size is not None and
+                   self.total_size > self._max_size):
+            key, value = self._entries.popitem(last=False)
+            self.total_size -= self._sizes.pop(key, 0)
+            self.evictions += 1
+
+    ### dict-like interface ###################################################
+
+    def __setitem__(self, key, value):
+        if key in self._entries:
+            del self[key]
+        self._entries[key] = value
+        if self.sizeof is not None:
+            self._sizes[key] = self.sizeof(value)
+            self.total_size += self._sizes[key]
+        self._evict()
+
+    def __getitem__(self, key):
+        return self._entries[key]
+
+    def __delitem__(self, key):
+        del self._entries[key]
+        self.total_size -= self._sizes.pop(key, 0)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def keys(self):
+        return self._entries.keys()
+
+    def items(self):
+        return self._entries.items()
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self.total_size = 0
@@ -0,0 +1,50 @@
+import unittest
+
+from traits.testing.api import doctest_for_module
+
+import codetools.util.cache as cache
+from codetools.util.cache import LRUCache
+
+
+class CacheDocTestCase(doctest_for_module(cache)):
+    pass
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_eviction_order(self):
+        c = LRUCache(max_entries=3)
+        for key in 'abc':
+            c[key] = key.upper()
+        self.assertEqual(c.get('a'), 'A')
+        c['d'] = 'D'
+        self.assertEqual(sorted(c.keys()), ['a', 'c', 'd'])
+        self.assertEqual(c.info().evictions, 1)
+
+    def test_counters(self):
+        c = LRUCache()
+        c['a'] = 1
+        c.get('a'); c.get('a'); c.get('b')
+        # The dict-like interface doesn't count
+        c['a']; 'b' in c
+        self.assertEqual(c.info()[:3], (2, 1, 0))
+
+    def test_shrink(self):
+        c = LRUCache(max_entries=4)
+        for i in range(4):
+            c[i] = i
+        c.max_entries = 1
+        self.assertEqual(c.keys(), [3])
+        self.assertEqual(c.info().evictions, 3)
+        self.assertRaises(ValueError, setattr, c, 'max_entries', -1)
+
+    def test_zero_entries(self):
+        c = LRUCache(max_entries=0)
+        c['a'] = 1
+        self.assertEqual(len(c), 0)
+        self.assertEqual(c.get('a', 2), 2)
+
+
+if __name__ == '__main__':
+    import sys
+    unittest.main(argv=sys.argv)
@@ -1,7 +1,7 @@
 from compiler import parse
-import sys, unittest
+import sys, timeit, unittest
 
-from traits.testing.api import doctest_for_module
+from traits.testing.api import doctest_for_module, performance
 from codetools.util.functional import partial
 
 import codetools.blocks.analysis as analysis
@@ -459,6 +459,72 @@ class TransformTestCase(unittest.TestCase, AnalysisTestMixin):
         # Regression tests
         test('a,b = [0],0', 'a,b = __a,__b', { '__a':[0], '__b':0 })
 
+class StatementAnalysisTestCase(unittest.TestCase):
+
+    def test_fold_matches_walk(self):
+        'Folding statement analyses gives the same names as walking'
+
+        for code in [
+            'a = b\nc = a + d',
+            'import os.path\nx = os.path.join(a)\nos.sep = y',
+            'a.b = 1\nc = a.b + a.d\nd = e.f',
+            'if c: len = f\nx = len(y)',
+            'len = f\nx = len(y)',
+            'for i in l: s = i\nelse: s = 0\nt = s + i',
+            'while t: u = v\nw = u',
+            'try: a = f()\nexcept: a = None\nb = a',
+            'c = 1\nd = [c for c in range(3)]\ne = c',
+            'def f(x): return x + y\nz = f(1)',
+            'g = lambda q: q + r\nr = 2\nh = g(r)',
+            'a += 1\nb.c += a',
+        ]:
+            ast = parse(code)
+            walked = analysis.walk(ast, analysis.NameFinder())
+            summaries, folded = analysis.analyse_statements(ast.node.nodes)
+            self.assertEqual(len(summaries), len(ast.node.nodes))
+            for name in ('free', 'locals', 'conditional_locals',
+                         'fromimports'):
+                self.assertEqual(set(getattr(walked, name)),
+                                 set(getattr(folded, name)),
+                                 '%s: %r' % (name, code))
+            self.assertEqual(walked.constlist, folded.constlist)
+            self.assertEqual(walked.imports, folded.imports)
+
+    def test_blocks_fold(self):
+        'Blocks fold the analyses of their sub-blocks'
+        b = Block('if c: len = f\nx = len(y)\nz = x.real')
+        self.assertEqual(b.inputs, set(['c', 'f', 'len', 'y']))
+        self.assertEqual(b.outputs, set(['x', 'z']))
+        self.assertEqual(b.conditional_outputs, set(['len']))
+
+    @performance
+    def test_fold_is_not_slow(self):
+        ''' Analysing a block from its sub-blocks is faster than walking it
+            again. (speedup > 2)
+        '''
+        allowed_speedup = 2.0
+        N = 5
+
+        code = '\n'.join('x%d = f(x%d, y.z) + g(%d)\nif x%d: w = h(w)'
+                          % (i, i - 1, i, i) for i in range(1, 250))
+        ast = parse(code)
+
+        walk_time = timeit.Timer(
+            lambda: analysis.walk(ast, analysis.NameFinder())).timeit(N)
+        summaries, _ = analysis.analyse_statements(ast.node.nodes)
+        def fold():
+            v = analysis.NameFinder()
+            for summary in summaries:
+                v.extend(summary)
+        fold_time = timeit.Timer(fold).timeit(N)
+
+        speedup = walk_time / fold_time
+        print '[walk=%.1fms fold=%.1fms speedup=%3.2f]  ' \
+              % (walk_time / N * 1e3, fold_time / N * 1e3, speedup),
+        msg = 'actual speedup: %f\nallowed speedup: %f' % (speedup,
+                                                             allowed_speedup)
+        assert speedup > allowed_speedup, msg
+
 class AnalysisRegressionTestCase(unittest.TestCase, NameAnalysisTestMixin):
     pass
 
@@ -2,13 +2,14 @@ import re, sys, time, unittest
 from compiler.ast import Discard, Module, Name, Stmt
 from cPickle import dumps, loads
 from StringIO import StringIO
+from types import CodeType
 
 from traits.testing.api import doctest_for_module, skip
 from codetools.util.dict import map_values
 import codetools.util.graph as graph
 
 import codetools.blocks.block as block
-from codetools.blocks.api import Block, Expression
+from codetools.blocks.api import Block, Expression, parse_cache
 
 # Extend base class compiler.ast.Node with deep equality
 import codetools.blocks.compiler_.ast.deep_equality
@@ -411,6 +412,106 @@ class BlockTestCase(unittest.TestCase):
         b.ast = Block('z=0').ast
         self.assertSimilar(b.restrict(outputs='z'), Block('z=0'))
 
+    def test_incremental_dep_graph(self):
+        "Caching: '_dep_graph' is patched for single sub-block changes"
+
+        def check(b):
+            full = Block._compute_dependencies(b.sub_blocks)[3]
+            self.assertEqual(map_values(set, b._dep_graph), full)
+
+        b = Block('a=f(z); b=g(y); c=h(a,b); d=k(b); e=c.real')
+        dep_graph = b._dep_graph
+        b.sub_blocks.insert(2, Block('a=m(b)'))
+        check(b)
+        del b.sub_blocks[0]
+        check(b)
+        b.sub_blocks[1] = Block('if t: a=n(y)')
+        check(b)
+        b.sub_blocks.append(Block('c=0'))
+        check(b)
+        b.sub_blocks.pop()
+        check(b)
+        self.assertTrue(b._dep_graph is dep_graph)
+
+    def test_caching_restrict_selective_invalidation(self):
+        "Caching: 'restrict' only forgets restrictions touched by a change"
+
+        b = Block('a=f(z); b=g(y); c=h(a,b); d=k(b)')
+        by_z = b.restrict(inputs='z')
+        to_d = b.restrict(outputs='d')
+
+        # Unrelated statements leave the cache alone
+        b.sub_blocks.append(Block('w=u'))
+        self.assertTrue(b.restrict(inputs='z') is by_z)
+        self.assertTrue(b.restrict(outputs='d') is to_d)
+
+        # Related statements invalidate only the affected entries
+        b.sub_blocks.insert(1, Block('a=a0'))
+        self.assertTrue(b.restrict(outputs='d') is to_d)
+        self.assertSimilar(b.restrict(inputs='z'), Block('a=f(z)'))
+
+        # A new path from the inputs to the outputs is found
+        b = Block('a=f(z); b=g(y)')
+        self.assertSimilar(b.restrict(inputs='z', outputs='b'), Block(()))
+        b.sub_blocks.insert(1, Block('y=a'))
+        self.assertSimilar(b.restrict(inputs='z', outputs='b'),
+                           Block('a=f(z); y=a; b=g(y)'))
+
+    def test_caching_restrict_imports_and_invalid_edits(self):
+        "Caching: import and self-referencing edits invalidate 'restrict'"
+
+        # Every restriction keeps the imports
+        b = Block('import math\na = 1\nc = a + 1')
+        b.restrict(outputs=['c'])
+        del b.sub_blocks[0]
+        self.assertSimilar(b.restrict(outputs=['c']), Block('a = 1\nc = a + 1'))
+        b.restrict(outputs=['c'])
+        b.sub_blocks.insert(0, Block('from numpy import sin'))
+        self.assertSimilar(b.restrict(outputs=['c']),
+                           Block('from numpy import sin\na = 1\nc = a + 1'))
+
+        # An atomic sub-block that reads what it writes fails restriction
+        b = Block('a = 1\nb = 1')
+        self.assertSimilar(b.restrict(outputs=['b']), Block('b = 1'))
+        b.sub_blocks.insert(0, Block('c = c'))
+        self.assertRaises(RuntimeError, b.restrict, outputs=['b'])
+        b = Block('a = 1\nb = 1')
+        b.restrict(outputs=['b'])
+        b.reparse('c = c\na = 1\nb = 1')
+        self.assertRaises(RuntimeError, b.restrict, outputs=['b'])
+
+    def test_caching_restrict_bounded(self):
+        "Caching: 'restrict' keeps a bounded number of restrictions"
+
+        b = Block('a=f(z); b=g(y); c=h(a,b); d=k(b)', restriction_cache_size=2)
+        by_z = b.restrict(inputs='z')
+        b.restrict(inputs='y')
+        self.assertTrue(b.restrict(inputs='z') is by_z)
+        b.restrict(outputs='d')
+        self.assertTrue(b.restrict(inputs='z') is by_z)
+        info = b.restriction_cache_info()
+        self.assertEqual((info.hits, info.misses, info.evictions, info.size),
+                         (2, 3, 1, 2))
+
+        b.restriction_cache_size = 1
+        self.assertEqual(b.restriction_cache_info().size, 1)
+        self.assertTrue(b.restrict(inputs='z') is by_z)
+
+    def test_caching_restrict_superset_inputs(self):
+        "Caching: 'restrict' reuses restrictions on fewer inputs"
+
+        b = Block('a=f(z); b=g(y); c=h(a,b); d=k(b)')
+        by_y = b.restrict(inputs='y')
+        # 'a' is an intermediate, and 'z' reaches 'a=f(z)'
+        self.assertTrue(b.restrict(inputs='ya') is not by_y)
+        self.assertTrue(b.restrict(inputs='yz') is not by_y)
+
+        b = Block('a=f(z); b=g(y, z); c=h(a,b); d=k(b)')
+        by_z = b.restrict(inputs='z')
+        self.assertTrue(b.restrict(inputs='zy') is by_z)
+        self.assertTrue(b.restrict(inputs='zy') is by_z)
+        self.assertEqual(b.restriction_cache_info().size, 2)
+
     def test_caching_code(self):
         "Caching: '_code'"
 
@@ -439,6 +540,130 @@ class BlockTestCase(unittest.TestCase):
         b.execute(c)
         assert 'a' in c
 
+    def test_caching_code_shared(self):
+        "Caching: '_code' is shared by structurally identical blocks"
+
+        code = 'a = f(x)\ndef g(y):\n    return y + 1\n'
+        b1, b2 = Block(code), Block(code)
+        b1.sub_blocks[1].filename = 'g.py'
+        for s1, s2 in zip(b1.sub_blocks, b2.sub_blocks):
+            self.assertEqual(s1._code.co_code, s2._code.co_code)
+            self.assertEqual(s1._code.co_consts, s2._code.co_consts)
+        self.assertEqual(b1.sub_blocks[1]._code.co_filename, 'g.py')
+        [g_code] = [c for c in b1.sub_blocks[1]._code.co_consts
+                    if isinstance(c, CodeType)]
+        self.assertEqual(g_code.co_filename, 'g.py')
+        self.assertEqual(b2.sub_blocks[1]._code.co_filename,
+                         '<%r>' % b2.sub_blocks[1])
+
+        # Line numbers are part of the code
+        b3 = Block('\n' + code)
+        self.assertEqual(b3.sub_blocks[0]._code.co_firstlineno, 2)
+
+    def test_caching_parse(self):
+        "Caching: blocks from identical text share their parse and analysis"
+
+        code = 'from math import sin\nif c: a = sin(x)\nb = a + 1\n'
+        # Text we've only seen once isn't cached
+        parse_cache.clear()
+        b1 = Block(code)
+        self.assertEqual(parse_cache.get(code), None)
+        b1 = Block(code)
+        hits = parse_cache.info().hits
+        b2 = Block(code)
+        self.assertEqual(parse_cache.info().hits, hits + 1)
+
+        for x, y in [(b1, b2)] + zip(b1.sub_blocks, b2.sub_blocks):
+            self.assertEqual(x.ast, y.ast)
+            self.assertTrue(x.ast is not y.ast)
+            self.assertEqual(x.inputs, y.inputs)
+            self.assertEqual(x.outputs, y.outputs)
+            self.assertEqual(x.conditional_outputs, y.conditional_outputs)
+            self.assertEqual(x.fromimports, y.fromimports)
+            self.assertEqual(x.const_assign, y.const_assign)
+        self.assertEqual(b2.inputs, set(['a', 'c', 'x']))
+
+        # Blocks don't share their sets either
+        b2.sub_blocks[1].inputs.add('z')
+        self.assertEqual(b1.sub_blocks[1].inputs, set(['c', 'sin', 'x']))
+
+        context = dict(c=True, x=0.0)
+        b2.execute(context)
+        self.assertEqual(context['b'], 1.0)
+
+        # Code we can't analyse isn't cached, but still executes
+        code = 'from math import *\nx = sin(0)\n'
+        Block(code)
+        b = Block(code)
+        self.assertEqual(parse_cache.get(code), None)
+        context = {}
+        b.execute(context)
+        self.assertEqual(context['x'], 0.0)
+        self.assertRaises(NotImplementedError, getattr, b, 'inputs')
+
+    def test_reparse(self):
+        "Reparsing keeps the sub-blocks of unchanged statements"
+
+        code = ('import math\n'
+                'a = math.sqrt(x)\n'
+                'if a > 1:\n'
+                '    b = a + 1\n'
+                'c = 2; d = c * y\n'
+                'def f(z):\n'
+                '    return z * 2\n')
+        b = Block(code)
+        sub_blocks = b.sub_blocks[:]
+        codes = [s._code for s in sub_blocks]
+        b.restrict(outputs=('c',))
+        b.restrict(outputs=('b',))
+
+        # Edit the 'if' and insert a line before the definition of 'f'
+        new_code = code.replace('a + 1', 'a + 2') \
+                       .replace('def f', 'e = d\ndef f')
+        b.reparse(new_code)
+        fresh = Block(new_code)
+        self.assertEqual(b.ast, fresh.ast)
+        self.assertEqual(b.codestring, new_code)
+        self.assertEqual(len(b.sub_blocks), len(fresh.sub_blocks))
+        for s, t in zip(b.sub_blocks, fresh.sub_blocks):
+            self.assertEqual(s.inputs, t.inputs)
+            self.assertEqual(s.all_outputs, t.all_outputs)
+        same = dict(zip(fresh.sub_blocks, b.sub_blocks))
+        self.assertEqual(b._dep_graph, dict(
+            (same.get(k, k), set(same.get(v, v) for v in vs))
+            for k, vs in fresh._dep_graph.items()))
+
+        # The unchanged statements keep their sub-blocks, and those that
+        # didn't move keep their code
+        self.assertEqual(b.sub_blocks[:2], sub_blocks[:2])
+        self.assertTrue(b.sub_blocks[2] is not sub_blocks[2])
+        self.assertEqual(b.sub_blocks[3:5], sub_blocks[3:5])
+        self.assertEqual(b.sub_blocks[6], sub_blocks[5])
+        for s, c in zip(b.sub_blocks[:2], codes[:2]):
+            self.assertTrue(s._code is c)
+        self.assertEqual(b.sub_blocks[6].ast.lineno, 7)
+        [f_code] = [c for c in b.sub_blocks[6]._code.co_consts
+                    if isinstance(c, CodeType)]
+        self.assertEqual(f_code.co_firstlineno, 7)
+
+        # Only the restrictions involving the edited statement are gone
+        self.assertEqual([key for key in b._get_restrictions()],
+                         [(frozenset(), frozenset(['c']))])
+
+        context = dict(x=4.0, y=3)
+        b.execute(context)
+        self.assertEqual((context['b'], context['e'], context['f'](1)),
+                         (4.0, 6, 2))
+
+        # Syntax errors leave the block as it was
+        self.assertRaises(SyntaxError, b.reparse, new_code + 'g = (\n')
+        self.assertEqual(b.codestring, new_code)
+
+        # Blocks that weren't parsed from text are parsed from scratch
+        b = Block(Block('a = 1').ast)
+        b.reparse('a = 2\nb = a')
+        self.assertEqual(b.outputs, set(['a', 'b']))
+
     def test_optimization_no_filenames_in_tracebacks(self):
         'Optimization: No filenames in tracebacks'
         b = Block('import operator\n'
@@ -454,6 +679,207 @@ class BlockTestCase(unittest.TestCase):
         assert c['x'] == 2**11
         assert c['d'] == (9*10/2, '0123456789')
 
+    def test_execution_waves(self):
+        'Execution waves'
+        b = Block('a = f(x)\n'
+                  'b = g(x)\n'
+                  'c = a + b\n'
+                  'x = 2\n'       # After the reads of 'x'
+                  'd = h(x)\n'
+                  'a.y = 1\n')    # After any use of 'a'
+        s = b.sub_blocks
+        self.assertEqual(b._get_execution_waves(),
+                         [[s[0], s[1]], [s[2], s[3]], [s[4], s[5]]])
+
+    def test_execution_waves_in_place_changes(self):
+        'Execution waves: changes in place are writes of the changed name'
+        # (Each case: a change in place, a read of it, the initial 'd' and
+        # the value read)
+        cases = [('d["k"] = slow()', 'v = d["k"]', {}, 1),
+                 ('d[0:1] = [slow()]', 'v = d[0]', [0], 1),
+                 ('del d["k"]', 'v = len(d)', {'k': 1}, 0),
+                 ('d["k"] += slow()', 'v = d["k"]', {'k': 1}, 2),
+                 ('o.x += slow()', 'v = o.x', None, 2),
+                 ('lst.append(slow())', 'v = lst[-1]', None, 1)]
+        for change, read, d, expected in cases:
+            b = Block(change + '\n' + read)
+            s = b.sub_blocks
+            self.assertEqual(b._get_execution_waves(), [[s[0]], [s[1]]],
+                             change)
+
+        from concurrent.futures import ThreadPoolExecutor
+        import time
+
+        class Obj(object):
+            x = 1
+
+        def slow():
+            time.sleep(0.01)
+            return 1
+
+        executor = ThreadPoolExecutor(2)
+        try:
+            for change, read, d, expected in cases:
+                context = dict(slow=slow, d=d, o=Obj(), lst=[])
+                Block(change + '\n' + read).execute(context,
+                                                     executor=executor)
+                self.assertEqual(context['v'], expected, change)
+        finally:
+            executor.shutdown()
+
+    def test_execute_with_executor(self):
+        'Executing sub-blocks concurrently'
+        from concurrent.futures import ThreadPoolExecutor
+
+        class RecordingDict(dict):
+            def __setitem__(self, key, value):
+                self.setdefault('_order', []).append(key)
+                dict.__setitem__(self, key, value)
+
+        code = ('from math import sqrt\n'
+                'c = sqrt(a)\n'
+                'b = a * 2\n'
+                'd = b + c\n'
+                'for i in range(3):\n'
+                '    e = d + i\n')
+        executor = ThreadPoolExecutor(4)
+        try:
+            c1, c2 = {'a': 4}, RecordingDict(a=4)
+            Block(code).execute(c1)
+            Block(code).execute(c2, executor=executor)
+            # Writes happen wave by wave, in the order of the sub-blocks
+            self.assertEqual(c2.pop('_order'),
+                             ['sqrt', 'b', 'c', 'd', 'i', 'e'])
+            self.assertEqual(c1, c2)
+
+            # A failure leaves the context as executing in order would
+            b, c = Block('a = 1\nb = x\nc = 2\nd = c'), {}
+            self.assertRaises(NameError, b.execute, c, executor=executor)
+            self.assertEqual(c, {'a': 1})
+            self.assertRaises(NameError, b.execute, c, executor=executor,
+                              continue_on_errors=True)
+            self.assertEqual(c, {'a': 1, 'c': 2, 'd': 2})
+            b, c = Block('a = 1\nb = a\n1 / 0\nc = 3'), {}
+            self.assertRaises(ZeroDivisionError, b.execute, c,
+                              executor=executor)
+            self.assertEqual(c, {'a': 1, 'b': 1})
+
+            # Blocks we can't analyze run in order
+            c = {'a': 1, 't': 0}
+            Block('b = a\ndel t\nc = b').execute(c, executor=executor)
+            self.assertEqual(c, {'a': 1, 'b': 1, 'c': 1})
+
+            from codetools.blocks.memo import SubBlockMemo
+            self.assertRaises(ValueError, Block(code).execute, {'a': 4},
+                              executor=executor, memo=SubBlockMemo())
+        finally:
+            executor.shutdown()
+
+    def test_execute_with_executor_blocks2(self):
+        'Executing sub-blocks of a blocks2 Block concurrently'
+        from concurrent.futures import ThreadPoolExecutor
+        from codetools.blocks2.api import Block as Block2
+
+        executor = ThreadPoolExecutor(2)
+        try:
+            c = {'d': {}}
+            Block2('a = 1\nd[a] = 2\nb = d[1] + a').execute(
+                c, executor=executor)
+            self.assertEqual((c['b'], c['d']), (3, {1: 2}))
+        finally:
+            executor.shutdown()
+
+    def test_execute_fast(self):
+        'Executing as a function with fast locals'
+
+        class Recorder(dict):
+            def __setitem__(self, key, value):
+                self.setdefault('_order', []).append(key)
+                dict.__setitem__(self, key, value)
+
+        code = ('import math\n'
+                'c = math.sqrt(a) + len(s)\n'
+                'for i in range(3):\n'
+                '    d = i\n'
+                'if a > 100:\n'
+                '    g = 1\n'
+                'e = (lambda x: x * 2)(c)\n')
+        c1, c2 = {'a': 4.0, 's': 'ab', 'g': 5}, Recorder(a=4.0, s='ab', g=5)
+        Block(code).execute(c1)
+        Block(code).execute_fast(c2)
+        # Written once, in sorted order, without the untouched 'g'
+        self.assertEqual(c2.pop('_order'), ['c', 'd', 'e', 'i', 'math'])
+        self.assertEqual(c1, c2)
+
+        # What was bound before an error is written back, as with 'execute'
+        c = {'a': 1}
+        self.assertRaises(NameError, Block('b = a\nc = z').execute_fast, c)
+        self.assertEqual(c, {'a': 1, 'b': 1})
+
+        # Names bound conditionally still fall back to the globals and the
+        # builtins
+        c = {'a': 0, 's': 'ab'}
+        Block('if a:\n    y = len = 1\nz = y + len(s)').execute_fast(c,
+                                                                {'y': 5})
+        self.assertEqual(c, {'a': 0, 's': 'ab', 'z': 7})
+
+        # Blocks that can't be functions are executed normally
+        c = {}
+        Block('exec "x = 1"').execute_fast(c)
+        self.assertEqual(c['x'], 1)
+        c = {'x': 1}
+        Block('y = x\ndel x').execute_fast(c)
+        self.assertEqual(c, {'y': 1})
+
+    def test_caching_function_code(self):
+        "Caching: '_get_function_code'"
+
+        b = Block('b = a + 1\nc = b * 2')
+        code = b._get_function_code(('a',), ('c',))
+        self.assertTrue(b._get_function_code(('a',), ('c',)) is code)
+        self.assertEqual(b.get_function('a', 'c')(1), 4)
+
+        b.sub_blocks.append(Block('c = b * 3'))
+        self.assertTrue(b._get_function_code(('a',), ('c',)) is not code)
+        self.assertEqual(b.get_function('a', 'c')(1), 6)
+
+    def test_get_batch_function(self):
+        'Batch functions'
+        from numpy import array, linspace
+        from numpy.testing import assert_allclose, assert_array_equal
+
+        b = Block('from numpy import sin\n'
+                  'import math\n'
+                  'c = sin(a) * 2 + b\n'
+                  'd = c ** 2 - a\n'
+                  'e = math.floor(a)\n'
+                  'f = a\n')
+        f = b.get_function(inputs=['a', 'b'], outputs=['c', 'd'])
+        a, b_ = linspace(-1, 1, 50), linspace(0, 3, 50)
+        expected = [array(x) for x in zip(*map(f, a, b_))]
+
+        # Vectorised
+        g = b.get_batch_function(inputs=['a', 'b'], outputs=['c', 'd'])
+        for actual, e in zip(g(a, b_), expected):
+            assert_allclose(actual, e)
+        self.assertEqual(g.__doc__, 'c,d = <name>(a,b)')
+
+        # Looped: on Python ints, rows, and calls that aren't ufuncs
+        for actual, e in zip(g.from_rows(zip(a, b_)), expected):
+            assert_allclose(actual, e)
+        square = Block('y = x * x').get_batch_function(inputs='x', outputs='y')
+        self.assertEqual(list(square([2**62, 3])), [2**124, 9])
+        h = b.get_batch_function(inputs='a', outputs='e')
+        assert_array_equal(h(a), [-1.0] * 25 + [0.0] * 24 + [1.0])
+
+        # Outputs don't share memory with inputs
+        k = b.get_batch_function(inputs='a', outputs='f')
+        self.assertTrue(k(a) is not a)
+        assert_array_equal(k(a), a)
+
+        self.assertRaises(ValueError, g, a)
+        self.assertRaises(ValueError, g, a, b_[1:])
+
 class ExpressionTestCase(unittest.TestCase):
 
     ### Support ###############################################################
@@ -577,6 +1003,25 @@ class BlockRestrictionTestCase(unittest.TestCase):
         self._base(code, 'zy', 'd', gk)
         self._base(code, 'zy', 'cd', *fghk)
 
+    def test_restrict_order(self):
+        'Restricted blocks keep the order of execution'
+
+        code = 'b=g(y)', 'a=f(z)', 'd=k(b)', 'c=h(a,b)'
+        self.assertSimilar(Block(code).restrict(outputs='cd'), Block(code))
+        self.assertSimilar(Block(code).restrict(inputs='y'),
+                           Block(code[:1] + code[2:]))
+
+        code = 'import math', 'b=g(y)', 'from os import sep', 'c=b+sep'
+        self.assertSimilar(Block(code).restrict(outputs='c'),
+                           Block(code[::2] + code[1::2]))
+
+    def test_restrict_inputs_not_in_dep_graph(self):
+        'Restricting on inputs that no sub-block depends on directly'
+
+        b = Block('a = 1\na.x = 2\nc = a.x + d')
+        self.assertSimilar(b.restrict(inputs=['a.x']), Block(()))
+        self.assertSimilar(b.restrict(inputs=['d']), Block('c = a.x + d'))
+
     def test_restrict_conditional(self):
         'Restricted blocks with conditional outputs'
 
@@ -7,7 +7,7 @@ from traits.testing.api import doctest_for_module
 import codetools.blocks.compiler_.compiler_ \
     as compiler_
 from codetools.blocks.compiler_.api import \
-    compile_ast, parse
+    cached_compile_ast, compile_ast, parse
 
 class CompilerDocTestCase(doctest_for_module(compiler_)):
     pass
@@ -31,5 +31,15 @@ class CompilerTestCase(unittest.TestCase):
         self._base('a=f(z); a=a+1', { 'f':len, 'z':'asdf' })
         self._base('+-3j90', error=SyntaxError)
 
+    def test_cached_compile(self):
+        'cached compile'
+        code = cached_compile_ast(parse('a=f(z)\nb=a+1'))
+        self.assertTrue(code is cached_compile_ast(parse('a=f(z)\nb=a+1')))
+        self.assertTrue(code is not cached_compile_ast(parse('a=f(z); b=a+1')))
+        self.assertTrue(code is not cached_compile_ast(parse('a=f(z)\nb=a+2')))
+        env = {'f':len, 'z':'asdf'}
+        exec cached_compile_ast(parse('a=f(z)\nb=a+1'), 'x.py') in env
+        self.assertEqual(env['b'], 5)
+
 if __name__ == '__main__':
     unittest.main(argv=sys.argv)
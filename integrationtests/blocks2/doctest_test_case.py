@@ -0,0 +1,18 @@
+from traits.testing.api import doctest_for_module
+
+import codetools.blocks2.analysis as analysis
+import codetools.blocks2.block as block
+import codetools.blocks2.block_transformer as block_transformer
+import codetools.blocks2.unparse as unparse
+
+class AnalysisDocTestCase(doctest_for_module(analysis)):
+    pass
+
+class BlockDocTestCase(doctest_for_module(block)):
+    pass
+
+class BlockTransformerDocTestCase(doctest_for_module(block_transformer)):
+    pass
+
+class UnparseDocTestCase(doctest_for_module(unparse)):
+    pass
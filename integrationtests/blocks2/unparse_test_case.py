@@ -0,0 +1,98 @@
+# Standard library imports
+import ast
+import unittest
+
+# Local imports
+from codetools.blocks2.api import unparse
+
+class UnparseAstTestCase(unittest.TestCase):
+
+    ##########################################################################
+    # UnparseAstTestCase interface
+    ##########################################################################
+
+    ### Test methods  #######################################################
+    def test_import(self):
+        self._check_round_trip("from foo import bar, foo as baz\n"
+                               "import os.path as p, sys")
+        self._check_round_trip("from . import a\nfrom ..b import c")
+
+    def test_print(self):
+        self._check_round_trip("print x, y, z,\nprint >> error, x")
+
+    def test_numbers(self):
+        self._check_round_trip("a = -1\nb = 0.1\nc = 1e400\nd = -2j\ne = 10L")
+
+    def test_strings(self):
+        self._check_round_trip("a = 'x'\nb = u'\\u2603'\nc = '\\n'")
+
+    def test_assignments(self):
+        self._check_round_trip("a, b = 1, 2\na = ()\nfoo.bar = baz\n"
+                               "x = foo[1, ::2]\nx[...] = y[1:2]")
+
+    def test_aug_assign(self):
+        self._check_round_trip("c += 1\nc -= 1\nc *= 3\nc /= 2\nc &= 0\n"
+                               "c |= 1\nc **= 2\nc >>= 1")
+
+    def test_operator_precedence(self):
+        self._check_round_trip("x = x**(2+x)*3+2\nx = -x**2\nx = (-x)**2\n"
+                               "x = not a or b and c\nx = a < b < c\n"
+                               "x = a if b else (c if d else e)\n"
+                               "x = (lambda: y)()\nx = (yield)")
+
+    def test_calls(self):
+        self._check_round_trip("x = foo(a, b=3)\nx = foo(*a)\nx = foo(**a)\n"
+                               "x = foo(a, b=1, *c, **d)\n"
+                               "x = all(x for x in y)\nx = f(a)(b)")
+
+    def test_functions(self):
+        self._check_round_trip("@dec\n@dec2(a)\n"
+                               "def foo(a, (b, c), d=3, *e, **f):\n"
+                               "    '''doc'''\n"
+                               "    global g\n"
+                               "    return a\n"
+                               "class C(A, B):\n    pass")
+
+    def test_compound_statements(self):
+        self._check_round_trip("if a:\n    pass\nelif b:\n    pass\n"
+                               "else:\n    if c:\n        pass\n"
+                               "    d = 1\n"
+                               "for i in x:\n    continue\nelse:\n    break\n"
+                               "while x:\n    del x[0], y.z\n"
+                               "with a as b, c:\n    pass")
+
+    def test_try(self):
+        self._check_round_trip("try:\n    a\nexcept E as e:\n    raise\n"
+                               "except (F, G):\n    raise X, y, z\n"
+                               "else:\n    b\nfinally:\n    c\n"
+                               "try:\n    a\nfinally:\n    b")
+
+    def test_comprehensions(self):
+        self._check_round_trip("[(x, y) for x in [1, 2] if x != 2 if x > 0 "
+                               "for y in 'ab']\n"
+                               "{x: y for x, y in z}\n{x for x in y}\n"
+                               "{1, 2}\n{1: 2}")
+
+    def test_exec_and_assert(self):
+        self._check_round_trip("exec code in g, l\nassert x, 'message'\n"
+                               "x = `y`")
+
+    def test_unicode_literals(self):
+        self._check_round_trip("from __future__ import unicode_literals\n"
+                               "a = 'x'\nb = b'y'")
+
+    def test_output(self):
+        self.assertEqual(unparse(ast.parse("x = a+b*c")), "x = (a + (b * c))\n")
+        self.assertEqual(unparse(ast.parse("if a:\n  b\nelif c:\n  d")),
+                         "if a:\n    b\nelif c:\n    d\n")
+
+    ### Private methods #####################################################
+
+    def _check_round_trip(self, code):
+        """ Check that the unparsed code parses into the same AST.
+        """
+        tree = ast.parse(code)
+        actual = unparse(tree)
+        self.assertEqual(ast.dump(ast.parse(actual)), ast.dump(tree), actual)
+        # (Unparsing is stable)
+        self.assertEqual(unparse(ast.parse(actual)), actual)